@@ -1,60 +1,44 @@
 import sys
-from rdkit import Chem
-from rdkit.Chem.Draw import SimilarityMaps
+from drugcellfindcell import buildinput
+from drugcellfindcell import cellquery
+from drugcellfindcell import pipeline
+from drugcellfindcell import snapshot
 
 
-cell2idfile = "../data/cell2ind.txt"
-
-# load one column from a file
-def load_1col(filename, ind):
-	data = set()
-	with open(filename, 'r') as fi:
-		for line in fi:
-			tokens = line.strip().split('\t')
-			data.add(tokens[ind])
-	return list(data)
-
-
-# load mapping from a file
-def load_mapping(filename):
-	mapping = {}
-	with open(filename, 'r') as fi:
-		for line in fi:
-			tokens = line.strip().split('\t')
-			mapping[tokens[1]] = int(tokens[0])
-	return mapping
+default_datadir = "../data"
 
 
 # main function
 def main():
-	# load data
-	cells = load_1col(cell2idfile, 1)
+	args = sys.argv[1:]
+
+	# --datadir DIR reads reference data from DIR instead of ../data
+	datadir = default_datadir
+	if '--datadir' in args:
+		i = args.index('--datadir')
+		datadir = args[i + 1]
+		del args[i:i + 2]
+	config = pipeline.PipelineConfig(datadir=datadir)
+
+	# load data, from the compiled snapshot if it is up to date
+	snap = snapshot.open_fresh(config.snapshotfile)
+	if snap is None:
+		cells = buildinput.load_1col(config.cell2idfile, 1)
+	else:
+		cells = list(snap.cells)
 
 	# load input data
-	inputfile = sys.argv[1]
-	inputdrug = load_1col(inputfile, 0)[0]
-
-	outputdir = sys.argv[2] + "/"
-
-	# build morgan fingerprint for the input drug
-	d = Chem.MolFromSmiles(inputdrug)
-	f = list(map(str, list(SimilarityMaps.GetMorganFingerprint(d, fpType='bv',radius=2))))
-
-	# print out new genotype input file
-	with open(outputdir + "input_drug_fingerprint.txt", 'w') as fo:
-		fo.write("%s\n" % ','.join(f))
-		fo.write("%s\n" % ','.join(f))
-
-	# generate new input cell2ind file
-	with open(outputdir + "input_drug2id.txt", 'w') as fo:
-		fo.write("0\t%s\n" % inputdrug)
-		fo.write("1\tdummy_%s\n" % inputdrug)
-
-	# generate new input data file for prediction
-	with open(outputdir + "input.txt", 'w') as fo:
-		for c in cells:
-			fo.write("%s\t%s\t-1\n" % (c, inputdrug))
-	
+	inputfile = args[0]
+	inputdrugs = buildinput.load_1col(inputfile, 0)
+
+	outputdir = args[1] + "/"
+
+	# optional file of cells to score, one per line, so only those rows are predicted
+	if len(args) > 2:
+		cells = cellquery.select_cells(cells, None, cells=buildinput.load_1col(args[2], 0))
+
+	# write fingerprint, drug2id and input files for prediction
+	buildinput.build_input(inputdrugs, cells, outputdir)
 
 
 if __name__ == "__main__":
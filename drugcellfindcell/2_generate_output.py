@@ -1,88 +1,40 @@
 import sys
-import json 
-import uuid
-
-cell2mutationfile = "../data/cell2mutation_list.txt"
-
-go2namefile = "../data/goterm2name.txt"
-go2genefile = "../data/goterm2genes.txt" 
-
-top_n = 10
-
-# load mapping from a file
-def load_mapping(filename, keyind, valind, skipline=0):
-	mapping = {}
-	with open(filename, 'r') as fi:
-		if skipline > 0:
-			for i in range(skipline):
-				fi.readline()
-
-		for line in fi:
-			tokens = line.strip().split('\t')
-			mapping[tokens[keyind]] = tokens[valind]
-	return mapping
+from drugcellfindcell import generateoutput
+from drugcellfindcell import pipeline
 
+default_datadir = "../data"
 
 
 def main():
 	inputfile = sys.argv[1]
 	rlippfile = sys.argv[2]
-	outputfile = inputfile.replace('.txt', '.json')
-	
-	# load information about GO terms
-	go2name = load_mapping(go2namefile, 0, 1)
-	go2gene = load_mapping(go2genefile, 0, 1)
-
-	# find relevant information for each GO term 
-	rlipp = {}
-	with open(rlippfile, 'r') as fi:
-		for line in fi:
-			tokens = line.strip().split('\t')
-			rlipp[tokens[0]] = float(tokens[1])
 
-	# sort rlipp scores
-	sorted_rlipp = {k: v for k, v in sorted(rlipp.items(), key=lambda item: item[1], reverse=True)}
+	# --stream writes predictions as they are read, --compact drops indentation
+	stream = '--stream' in sys.argv[3:]
+	compact = '--compact' in sys.argv[3:]
+	# --sorted also writes every RLIPP score sorted to rlipp_sorted.txt
+	write_sorted = '--sorted' in sys.argv[3:]
+	# --topk N only writes the N cells with the lowest predicted AUC per drug
+	top_k = None
+	if '--topk' in sys.argv[3:]:
+		top_k = int(sys.argv[sys.argv.index('--topk') + 1])
+	# --normalized lists each cell once, --packauc packs its AUC arrays, --gzip writes output.json.gz
+	schema = generateoutput.VERBOSE_SCHEMA
+	if '--normalized' in sys.argv[3:]:
+		schema = generateoutput.NORMALIZED_SCHEMA
+	pack_auc = '--packauc' in sys.argv[3:]
+	compress = '--gzip' in sys.argv[3:]
+	# --datadir DIR reads reference data from DIR instead of ../data
+	datadir = default_datadir
+	if '--datadir' in sys.argv[3:]:
+		datadir = sys.argv[sys.argv.index('--datadir') + 1]
 	
-	rlippfile = rlippfile.replace('.txt', '_sorted.txt')
-	with open(rlippfile, 'w') as fo:
-		for r in sorted_rlipp:
-			fo.write("%s\t%s\t%.6f\t%s\n" % (r, go2name[r], sorted_rlipp[r], go2gene[r]))	
-
-	# load mapping between cell to id mapping
-	cell2genes = load_mapping(cell2mutationfile, 0, 1)
-
-	# build a dictionary for the results
-	output = {}
-	output['predictions'] = []
-
-	# collect the top RLIPP pathways	
-	top_pathways = []
-
-	with open(rlippfile, 'r') as fi:
-		for i in range(top_n):
-			line = fi.readline()
-			tokens = line.strip().split('\t')
-
-			top_pathways.append({'GO_id': tokens[0], 'pathway_name': tokens[1], 'RLIPP': tokens[2], 'pathway_genes': tokens[3]})
-
-	output['top_pathways'] = top_pathways
-
-
-	with open(inputfile, 'r') as fi:
-		for line in fi:
-			tokens = line.strip().split('\t')
-	
-			cellname = tokens[0]
-			smiles = tokens[1]
-			predicted = float(tokens[3])
-	
-			# add a line to .json
-			output['predictions'].append({'cell': cellname, 'predicted_AUC': predicted, 'mutations': cell2genes[cellname]})
-
-
+	# load information about GO terms and mutations of each cell,
+	# from the compiled snapshot if it is up to date
+	refdata = pipeline.ReferenceData(pipeline.PipelineConfig(datadir=datadir))
 
-	with open(outputfile, 'w') as fo:
-		json.dump(output, fo, indent=4)
+	# write predictions and top RLIPP pathways to .json
+	generateoutput.generate_output(inputfile, rlippfile, refdata.cell2genes, refdata.go2name, refdata.go2gene, stream=stream, compact=compact, write_sorted=write_sorted, top_k=top_k, schema=schema, pack_auc=pack_auc, compress=compress)
 	
 
 if __name__ == "__main__":
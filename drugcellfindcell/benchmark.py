@@ -0,0 +1,405 @@
+# -*- coding: utf-8 -*-
+
+"""
+Times the stages of the pipeline on data from
+:py:mod:`~drugcellfindcell.synthdata` and writes the timings as JSON
+so runs at the same scale can be compared to catch regressions
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+
+from drugcellfindcell import buildinput
+from drugcellfindcell import columnar
+from drugcellfindcell import generateoutput
+from drugcellfindcell import fingerprintio
+from drugcellfindcell import pipeline
+from drugcellfindcell import ranking
+from drugcellfindcell import snapshot
+from drugcellfindcell import synthdata
+from drugcellfindcell import trace
+
+
+DEFAULT_REPEAT = 3
+DEFAULT_TOLERANCE = 0.25
+
+
+class BenchmarkData(object):
+    """
+    Synthetic data set the benchmarks run on
+    """
+    def __init__(self, workdir, cells=synthdata.DEFAULT_CELLS,
+                 terms=synthdata.DEFAULT_TERMS,
+                 genes=synthdata.DEFAULT_GENES, drugs=1, seed=0):
+        """
+        Constructor, generates the data under `workdir`
+
+        :param workdir: directory to write data and outputs to
+        :param cells: number of cells
+        :param terms: number of GO terms
+        :param genes: number of genes
+        :param drugs: number of drugs scored
+        :param seed: random seed
+        """
+        self.workdir = workdir
+        self.params = {'cells': cells, 'terms': terms, 'genes': genes,
+                       'drugs': drugs, 'seed': seed}
+        self.config = synthdata.generate_reference_data(
+            os.path.join(workdir, 'data'), cells=cells, terms=terms,
+            genes=genes, seed=seed)
+        self.cells = [synthdata.cell_name(c) for c in range(cells)]
+        self.drugs = synthdata.synthetic_smiles(drugs)
+        self.rlippfile = os.path.join(workdir, pipeline.RLIPP_FILE)
+        synthdata.generate_rlipp(self.rlippfile, terms=terms, seed=seed)
+        self.outputfile = os.path.join(workdir, pipeline.OUTPUT_FILE)
+        synthdata.generate_predictions(self.outputfile, self.cells,
+                                       self.drugs, seed=seed)
+        self.columndir = os.path.join(workdir, columnar.COLUMNS_DIR)
+        synthdata.generate_prediction_columns(self.columndir, self.cells,
+                                              self.drugs, seed=seed)
+
+    def scratch_dir(self, name):
+        """
+        Gets empty directory for a benchmark to write to
+
+        :param name: name of benchmark
+        :rtype: str
+        """
+        path = os.path.join(self.workdir, 'run', name)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        os.makedirs(path)
+        return path
+
+
+def _bench_build_input(data, fpformat=fingerprintio.TEXT_FORMAT):
+    """
+    Same work as ``1_build_input.py``
+    """
+    outdir = data.scratch_dir('build_input_' + fpformat)
+
+    def run():
+        cells = buildinput.load_1col(data.config.cell2idfile, 1)
+        buildinput.build_input(data.drugs, cells, outdir, fpformat=fpformat)
+    return run
+
+
+def _bench_build_input_npy(data):
+    return _bench_build_input(data, fpformat=fingerprintio.NPY_FORMAT)
+
+
+def _bench_generate_output(data, stream=False, compact=False,
+                           columns=False):
+    """
+    Same work as ``2_generate_output.py``, reading the columnar
+    predictions instead of ``output.txt`` if `columns` is ``True``
+    """
+    config = data.config
+    outputfile = os.path.join(data.scratch_dir('generate_output'),
+                              'output.json')
+    inputfile = data.columndir if columns else data.outputfile
+
+    def run():
+        go2name = generateoutput.load_mapping(config.go2namefile, 0, 1)
+        go2gene = generateoutput.load_mapping(config.go2genefile, 0, 1)
+        cell2genes = generateoutput.load_mapping(config.cell2mutationfile,
+                                                 0, 1)
+        generateoutput.generate_output(inputfile, data.rlippfile,
+                                       cell2genes, go2name, go2gene,
+                                       outputfile=outputfile, stream=stream,
+                                       compact=compact)
+    return run
+
+
+def _bench_generate_output_stream(data):
+    return _bench_generate_output(data, stream=True, compact=True)
+
+
+def _bench_generate_output_columns(data):
+    return _bench_generate_output(data, columns=True)
+
+
+def _bench_rlipp_top(data):
+    def run():
+        ranking.RlippRanking.from_file(data.rlippfile).top(
+            generateoutput.TOP_N)
+    return run
+
+
+def _bench_reference_data_text(data):
+    config = pipeline.PipelineConfig(datadir=data.config.datadir,
+                                     snapshotfile=os.path.join(
+                                         data.workdir, 'missing.snap'))
+
+    def run():
+        refdata = pipeline.ReferenceData(config)
+        for c in refdata.cells:
+            refdata.cell2genes[c]
+    return run
+
+
+def _bench_reference_data_snapshot(data):
+    config = data.config
+    snapshot.build_snapshot(config, config.snapshotfile)
+
+    def run():
+        refdata = pipeline.ReferenceData(config)
+        for c in refdata.cells:
+            refdata.cell2genes[c]
+    return run
+
+
+def _bench_pipeline(data):
+    """
+    Whole task with reference data already loaded as in a worker
+    """
+    config = pipeline.PipelineConfig(datadir=data.config.datadir,
+                                     snapshotfile=os.path.join(
+                                         data.workdir, 'missing.snap'))
+    refdata = pipeline.ReferenceData(config)
+    predictor = synthdata.SyntheticPredictor(
+        terms=data.params['terms'], seed=data.params['seed'])
+    outdir = data.scratch_dir('pipeline')
+
+    def run():
+        pipeline.run_pipeline(data.drugs, config=config, outputdir=outdir,
+                              predictor=predictor, refdata=refdata)
+    return run
+
+
+def _bench_inference(data, cached=False):
+    """
+    Native engine forward passes and RLIPP with model loaded
+    """
+    from drugcellfindcell import inference
+
+    config = pipeline.PipelineConfig(datadir=data.config.datadir)
+    if not os.path.isfile(config.modelfile):
+        synthdata.generate_model(config, seed=data.params['seed'])
+    embedding_cache = None
+    if cached:
+        embedding_cache = os.path.join(data.workdir, 'embeddings')
+    engine = inference.InferenceEngine(config,
+                                       embedding_cache=embedding_cache)
+    engine.load()
+    outdir = data.scratch_dir('inference_cached' if cached
+                              else 'inference')
+    inputfiles = buildinput.build_input(data.drugs, data.cells, outdir)
+
+    def run():
+        engine.predict(inputfiles, outdir)
+    return run
+
+
+def _bench_inference_cached(data):
+    """
+    Native engine reading the genotype branch from the
+    embedding cache, built before timing starts
+    """
+    return _bench_inference(data, cached=True)
+
+
+# (name, function taking BenchmarkData and returning the callable timed)
+BENCHMARKS = [('build_input', _bench_build_input),
+              ('build_input_npy', _bench_build_input_npy),
+              ('reference_data_text', _bench_reference_data_text),
+              ('reference_data_snapshot', _bench_reference_data_snapshot),
+              ('rlipp_top', _bench_rlipp_top),
+              ('generate_output', _bench_generate_output),
+              ('generate_output_stream', _bench_generate_output_stream),
+              ('generate_output_columns', _bench_generate_output_columns),
+              ('inference', _bench_inference),
+              ('inference_cached', _bench_inference_cached),
+              ('pipeline', _bench_pipeline)]
+
+
+def time_callable(func, repeat=DEFAULT_REPEAT):
+    """
+    Runs `func` `repeat` times
+
+    :param func: callable taking no arguments
+    :param repeat: number of runs
+    :return: `seconds` of each run, their `min`, `median` and `mean`
+             and `peak_rss_bytes` of this process afterwards
+    :rtype: dict
+    """
+    seconds = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        seconds.append(round(time.perf_counter() - start, 6))
+    ordered = sorted(seconds)
+    mid = len(ordered) // 2
+    if len(ordered) % 2:
+        median = ordered[mid]
+    else:
+        median = (ordered[mid - 1] + ordered[mid]) / 2.0
+    return {'seconds': seconds, 'min': ordered[0],
+            'median': round(median, 6),
+            'mean': round(sum(seconds) / len(seconds), 6),
+            'peak_rss_bytes': trace.peak_rss()}
+
+
+def run_benchmarks(data, names=None, repeat=DEFAULT_REPEAT):
+    """
+    Runs benchmarks on `data`
+
+    :param data: data to run on
+    :type data: :py:class:`BenchmarkData`
+    :param names: names of benchmarks from :py:const:`BENCHMARKS` to
+                  run, if ``None`` all are run
+    :param repeat: number of timed runs of each benchmark
+    :raises ValueError: if a name is not a known benchmark
+    :return: `params` of data set, `environment` and `results` keyed
+             by benchmark name
+    :rtype: dict
+    """
+    known = dict(BENCHMARKS)
+    if names is None:
+        names = [b[0] for b in BENCHMARKS]
+    for name in names:
+        if name not in known:
+            raise ValueError('Unknown benchmark: ' + name)
+
+    results = {}
+    for name in names:
+        results[name] = time_callable(known[name](data), repeat=repeat)
+    return {'created': time.time(),
+            'params': dict(data.params, repeat=repeat),
+            'environment': {'python': platform.python_version(),
+                            'platform': platform.platform(),
+                            'cpus': os.cpu_count()},
+            'results': results}
+
+
+def compare_results(baseline, current, tolerance=DEFAULT_TOLERANCE):
+    """
+    Finds benchmarks slower than in `baseline`. The fastest run of
+    each is compared since it is the least affected by other load
+
+    :param baseline: results from :py:func:`run_benchmarks`
+    :param current: results from :py:func:`run_benchmarks`
+    :param tolerance: fraction a benchmark may slow down by
+    :raises ValueError: if results are for data of different size
+    :return: dicts with `name`, `baseline` and `current` seconds
+             and their `ratio`, for each benchmark that regressed
+    :rtype: list
+    """
+    keys = ('cells', 'terms', 'genes', 'drugs')
+    if [baseline['params'].get(k) for k in keys] != \
+            [current['params'].get(k) for k in keys]:
+        raise ValueError('Results are for different data sizes')
+    regressions = []
+    for name, res in current['results'].items():
+        base = baseline['results'].get(name)
+        if base is None or base['min'] <= 0:
+            continue
+        ratio = res['min'] / base['min']
+        if ratio > 1.0 + tolerance:
+            regressions.append({'name': name, 'baseline': base['min'],
+                                'current': res['min'],
+                                'ratio': round(ratio, 3)})
+    return regressions
+
+
+def _parse_arguments(desc, args):
+    """
+    Parses command line arguments
+    :param desc:
+    :param args:
+    :return:
+    """
+    help_fm = argparse.ArgumentDefaultsHelpFormatter
+    parser = argparse.ArgumentParser(description=desc,
+                                     formatter_class=help_fm)
+    parser.add_argument('--cells', type=int, default=synthdata.DEFAULT_CELLS,
+                        help='number of cells')
+    parser.add_argument('--terms', type=int, default=synthdata.DEFAULT_TERMS,
+                        help='number of GO terms')
+    parser.add_argument('--genes', type=int, default=synthdata.DEFAULT_GENES,
+                        help='number of genes')
+    parser.add_argument('--drugs', type=int, default=1,
+                        help='number of drugs scored')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='random seed')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help='number of timed runs of each benchmark')
+    parser.add_argument('--only',
+                        help='comma delimited benchmarks to run, one of ' +
+                             ', '.join(b[0] for b in BENCHMARKS))
+    parser.add_argument('--workdir',
+                        help='directory for synthetic data, default is a '
+                             'temporary directory removed afterwards')
+    parser.add_argument('--output',
+                        help='file to write JSON results to, default is '
+                             'standard out')
+    parser.add_argument('--compare',
+                        help='JSON results of an earlier run to compare to')
+    parser.add_argument('--tolerance', type=float,
+                        default=DEFAULT_TOLERANCE,
+                        help='fraction a benchmark may slow down by '
+                             'before --compare reports it')
+    return parser.parse_args(args)
+
+
+def main(args):
+    """
+    Runs benchmarks
+
+    :param args: command line arguments usually :py:const:`sys.argv`
+    :return: 0 for success, 1 if --compare found a regression
+             otherwise failure
+    :rtype: int
+    """
+    desc = """
+        Generates synthetic DrugCell data and times each stage of
+        the pipeline on it, writing the timings as JSON. With
+        --compare the fastest run of each stage is compared to an
+        earlier run and slower stages are reported on standard error
+    """
+    theargs = _parse_arguments(desc, args[1:])
+    names = None
+    if theargs.only is not None:
+        names = theargs.only.split(',')
+
+    workdir = theargs.workdir
+    if workdir is None:
+        workdir = tempfile.mkdtemp(prefix='drugcellbench')
+    try:
+        data = BenchmarkData(workdir, cells=theargs.cells,
+                             terms=theargs.terms, genes=theargs.genes,
+                             drugs=theargs.drugs, seed=theargs.seed)
+        res = run_benchmarks(data, names=names, repeat=theargs.repeat)
+    finally:
+        if theargs.workdir is None:
+            shutil.rmtree(workdir)
+
+    if theargs.output is None:
+        json.dump(res, sys.stdout, indent=4)
+        sys.stdout.write('\n')
+    else:
+        with open(theargs.output, 'w') as fo:
+            json.dump(res, fo, indent=4)
+
+    if theargs.compare is not None:
+        with open(theargs.compare, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare_results(baseline, res,
+                                      tolerance=theargs.tolerance)
+        for r in regressions:
+            sys.stderr.write('%s: %.6fs -> %.6fs (%.2fx)\n' %
+                             (r['name'], r['baseline'], r['current'],
+                              r['ratio']))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':  # pragma: no cover
+    sys.exit(main(sys.argv))
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+"""
+Builds the DrugCell prediction input for a drug: the morgan fingerprint
+file, the drug to id mapping and the cell/drug pairs to score. This is
+the library form of ``1_build_input.py``
+"""
+
+import os
+
+from drugcellfindcell import columnar
+from drugcellfindcell import fingerprint
+from drugcellfindcell import fingerprintio
+from drugcellfindcell import trace
+
+
+FINGERPRINT_FILE = 'input_drug_fingerprint.txt'
+FINGERPRINT_NPY_FILE = 'input_drug_fingerprint.npy'
+DRUG2ID_FILE = 'input_drug2id.txt'
+INPUT_FILE = 'input.txt'
+
+FINGERPRINT_RADIUS = fingerprint.FINGERPRINT_RADIUS
+FINGERPRINT_BITS = fingerprint.FINGERPRINT_BITS
+
+# fingerprinting lives in fingerprint, these names are kept for callers
+morgan_fingerprint = fingerprint.morgan_fingerprint
+parse_smiles = fingerprint.parse_smiles
+canonical_smiles = fingerprint.canonical_smiles
+mol_fingerprint = fingerprint.mol_fingerprint
+
+
+def load_1col(filename, ind):
+    """
+    Loads one column from a tab delimited file
+
+    :param filename: path to tab delimited file
+    :param ind: index of column to load
+    :return: unique values found in column in the order
+             they first appear
+    :rtype: list
+    """
+    data = {}
+    with open(filename, 'r') as fi:
+        for line in fi:
+            tokens = line.strip().split('\t')
+            data.setdefault(tokens[ind], None)
+    return list(data)
+
+
+def load_mapping(filename):
+    """
+    Loads mapping of name to integer id from a tab delimited
+    file where first column is id and second column is name
+
+    :param filename: path to tab delimited file
+    :return: name => id
+    :rtype: dict
+    """
+    mapping = {}
+    with open(filename, 'r') as fi:
+        for line in fi:
+            tokens = line.strip().split('\t')
+            mapping[tokens[1]] = int(tokens[0])
+    return mapping
+
+
+def build_input(inputdrugs, cells, outputdir, fpcache=None,
+                fpformat=fingerprintio.TEXT_FORMAT, tracer=None,
+                text_input=True):
+    """
+    Writes the fingerprint, drug2id and cell/drug input
+    files needed by the DrugCell predictor into `outputdir`.
+    Rows of the input file are grouped by drug so every
+    cell is scored against the first drug, then the second
+    and so on. The same rows are also written in
+    :py:mod:`~drugcellfindcell.columnar` form, which is all the
+    native engine reads
+
+    :param inputdrugs: SMILES strings for drugs, a single
+                       SMILES string is also accepted
+    :param cells: names of cells to score drugs against
+    :param outputdir: directory to write files to
+    :param fpcache: cache to get fingerprints from, if ``None``
+                    fingerprints are computed with RDKit
+    :type fpcache: :py:class:`~drugcellfindcell.fpcache.FingerprintCache`
+    :param fpformat: format of fingerprint file, one of
+                     :py:const:`~drugcellfindcell.fingerprintio.FORMATS`
+    :param tracer: records `smiles_parse` and `fingerprint` spans,
+                   with a cache SMILES are only parsed on a miss so
+                   that is all one `fingerprint` span
+    :type tracer: :py:class:`~drugcellfindcell.trace.Tracer`
+    :param text_input: if ``False`` the input file is not written,
+                       only the prediction script reads it
+    :raises ValueError: if any SMILES cannot be parsed by RDKit
+    :return: paths to files written keyed by `fingerprint`,
+             `drug2id`, `columns` and, with `text_input`, `input`
+    :rtype: dict
+    """
+    if isinstance(inputdrugs, str):
+        inputdrugs = [inputdrugs]
+    inputdrugs = list(dict.fromkeys(inputdrugs))
+    if fpcache is None:
+        with trace.span(tracer, 'smiles_parse'):
+            mols = [fingerprint.parse_smiles(d) for d in inputdrugs]
+        with trace.span(tracer, 'fingerprint'):
+            fingerprints = [fingerprint.mol_fingerprint(m) for m in mols]
+    else:
+        with trace.span(tracer, 'fingerprint', cached=True):
+            fingerprints = [fpcache.get(d) for d in inputdrugs]
+
+    if fpformat == fingerprintio.NPY_FORMAT:
+        fingerprintfile = FINGERPRINT_NPY_FILE
+    else:
+        fingerprintfile = FINGERPRINT_FILE
+    res = {'fingerprint': os.path.join(outputdir, fingerprintfile),
+           'drug2id': os.path.join(outputdir, DRUG2ID_FILE),
+           'columns': os.path.join(outputdir, columnar.COLUMNS_DIR)}
+
+    # predictor needs at least two rows so a dummy
+    # copy is added when there is only one drug
+    drug2id = list(inputdrugs)
+    if len(inputdrugs) == 1:
+        fingerprints.append(fingerprints[0])
+        drug2id.append('dummy_' + inputdrugs[0])
+
+    fingerprintio.write_fingerprints(res['fingerprint'], fingerprints,
+                                     fmt=fpformat)
+
+    with open(res['drug2id'], 'w') as fo:
+        for i, d in enumerate(drug2id):
+            fo.write("%d\t%s\n" % (i, d))
+
+    if text_input:
+        res['input'] = os.path.join(outputdir, INPUT_FILE)
+        with open(res['input'], 'w') as fo:
+            for d in inputdrugs:
+                for c in cells:
+                    fo.write("%s\t%s\t-1\n" % (c, d))
+    columnar.write_input(res['columns'], inputdrugs, cells)
+    return res
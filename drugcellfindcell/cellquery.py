@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+"""
+Narrows the cell panel a drug is scored against, by name or by the
+genes mutated in each cell, and picks the cells most sensitive to a
+drug from its predictions
+"""
+
+import heapq
+
+
+def _auc(prediction):
+    """
+    Gets predicted AUC of prediction entry
+    """
+    return prediction['predicted_AUC']
+
+
+def parse_list(value):
+    """
+    Splits comma delimited command line value
+
+    :param value: comma delimited string or ``None``
+    :return: non empty items or ``None`` if `value` is ``None``
+    :rtype: list
+    """
+    if value is None:
+        return None
+    return [v.strip() for v in value.split(',') if v.strip()]
+
+
+def select_cells(allcells, cell2genes, cells=None, mutations=None):
+    """
+    Picks cells from the panel, keeping panel order
+
+    :param allcells: names of every cell in the panel
+    :param cell2genes: cell => comma delimited mutated genes, a
+                       cell missing from it has no mutations
+    :param cells: if set only these cells are kept
+    :param mutations: if set only cells with at least one of
+                      these genes mutated are kept
+    :raises ValueError: if a name in `cells` is not in the panel
+                        or no cell is left
+    :return: names of cells
+    :rtype: list
+    """
+    if cells is None and mutations is None:
+        return allcells
+    selected = allcells
+    if cells is not None:
+        wanted = set(cells)
+        selected = [c for c in selected if c in wanted]
+        if len(selected) != len(wanted):
+            missing = wanted.difference(selected)
+            raise ValueError('Unknown cells: ' + ','.join(sorted(missing)))
+    if mutations is not None:
+        genes = set(mutations)
+        selected = [c for c in selected
+                    if not genes.isdisjoint(
+                        cell2genes.get(c, '').split(','))]
+    if not selected:
+        raise ValueError('No cells match the cell selection')
+    return list(selected)
+
+
+def top_sensitive(predictions, k):
+    """
+    Gets the `k` cells predicted to be most sensitive, which are
+    those with the lowest predicted AUC
+
+    :param predictions: prediction entries with `predicted_AUC`
+    :param k: number of cells
+    :return: entries sorted by predicted AUC, ties keep their order
+    :rtype: list
+    """
+    return heapq.nsmallest(k, predictions, key=_auc)
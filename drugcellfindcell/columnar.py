@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+"""
+Columnar form of the cell/drug rows scored by DrugCell. A directory
+holds each cell and drug name once in a string table and one ``.npy``
+array per column (cell index, drug index and predicted AUC), so rows
+are matched by position rather than by joining text files line by line
+"""
+
+import os
+
+import numpy as np
+
+
+COLUMNS_DIR = 'columns'
+CELLS_FILE = 'cells.txt'
+DRUGS_FILE = 'drugs.txt'
+CELL_INDEX_FILE = 'cell_index.npy'
+DRUG_INDEX_FILE = 'drug_index.npy'
+PREDICTED_FILE = 'predicted_AUC.npy'
+PREDICTED_STD_FILE = 'predicted_AUC_std.npy'
+
+
+def write_table(filename, strings):
+    """
+    Writes strings one per line
+
+    :param filename: path to write to
+    :param strings: strings without newlines
+    """
+    with open(filename, 'w') as fo:
+        for s in strings:
+            fo.write(s + '\n')
+
+
+def read_table(filename):
+    """
+    Reads strings written by :py:func:`write_table`
+
+    :param filename: path to file
+    :rtype: list
+    """
+    with open(filename, 'r') as fi:
+        return [line.rstrip('\n') for line in fi]
+
+
+def is_columnar(path):
+    """
+    Checks if `path` is a directory written by :py:func:`write_input`
+
+    :param path: path to check
+    :rtype: bool
+    """
+    return os.path.isfile(os.path.join(path, CELL_INDEX_FILE))
+
+
+def write_input(columndir, drugs, cells):
+    """
+    Writes rows scoring every cell against each drug in turn, the
+    same rows and order as the ``input.txt`` written by
+    :py:func:`~drugcellfindcell.buildinput.build_input`
+
+    :param columndir: directory to write to, created if needed
+    :param drugs: SMILES strings of drugs
+    :param cells: names of cells
+    :return: `columndir`
+    :rtype: str
+    """
+    if not os.path.isdir(columndir):
+        os.makedirs(columndir)
+    write_table(os.path.join(columndir, DRUGS_FILE), drugs)
+    write_table(os.path.join(columndir, CELLS_FILE), cells)
+    np.save(os.path.join(columndir, CELL_INDEX_FILE),
+            np.tile(np.arange(len(cells), dtype=np.int32), len(drugs)))
+    np.save(os.path.join(columndir, DRUG_INDEX_FILE),
+            np.repeat(np.arange(len(drugs), dtype=np.int32), len(cells)))
+    return columndir
+
+
+def write_predictions(columndir, predicted, filename=PREDICTED_FILE):
+    """
+    Stores predicted AUC of each row
+
+    :param columndir: directory written by :py:func:`write_input`
+    :param predicted: one value per row
+    :param filename: column to write, :py:const:`PREDICTED_STD_FILE`
+                     stores the spread of an ensemble's predictions
+    :raises ValueError: if number of values does not match rows
+    """
+    predicted = np.asarray(predicted, dtype=np.float64).reshape(-1)
+    rows = np.load(os.path.join(columndir, CELL_INDEX_FILE),
+                   mmap_mode='r').shape[0]
+    if predicted.shape[0] != rows:
+        raise ValueError('Got ' + str(predicted.shape[0]) +
+                         ' predictions for ' + str(rows) + ' rows')
+    np.save(os.path.join(columndir, filename), predicted)
+
+
+def read_predict_file(predictfile):
+    """
+    Reads predictor output with one predicted AUC per line
+
+    :param predictfile: path to predictions file
+    :rtype: :py:class:`numpy.ndarray`
+    """
+    with open(predictfile, 'r') as fi:
+        return np.array([float(line) for line in fi if line.strip()],
+                        dtype=np.float64)
+
+
+class PredictionColumns(object):
+    """
+    Read only view of a directory written by :py:func:`write_input`
+    and :py:func:`write_predictions`, arrays are memory mapped
+    """
+    def __init__(self, columndir):
+        """
+        Constructor
+
+        :param columndir: directory to read
+        """
+        self.cells = read_table(os.path.join(columndir, CELLS_FILE))
+        self.drugs = read_table(os.path.join(columndir, DRUGS_FILE))
+        self.cell_index = np.load(os.path.join(columndir, CELL_INDEX_FILE),
+                                  mmap_mode='r')
+        self.drug_index = np.load(os.path.join(columndir, DRUG_INDEX_FILE),
+                                  mmap_mode='r')
+        self.predicted = np.load(os.path.join(columndir, PREDICTED_FILE),
+                                 mmap_mode='r')
+        # only ensembles write the spread of their predictions
+        self.predicted_std = None
+        stdfile = os.path.join(columndir, PREDICTED_STD_FILE)
+        if os.path.isfile(stdfile):
+            self.predicted_std = np.load(stdfile, mmap_mode='r')
+
+    def __len__(self):
+        return self.cell_index.shape[0]
+
+    def drug_rows(self):
+        """
+        Groups rows by drug
+
+        :return: generator of (drug index, row indices) in drug order,
+                 drugs without rows are skipped
+        """
+        order = np.argsort(self.drug_index, kind='stable')
+        bounds = np.searchsorted(self.drug_index[order],
+                                 np.arange(len(self.drugs) + 1))
+        for d in range(len(self.drugs)):
+            if bounds[d] < bounds[d + 1]:
+                yield d, order[bounds[d]:bounds[d + 1]]
@@ -1,11 +1,21 @@
 #!/usr/bin/env python
 
 import os
-import subprocess
 import sys
 import argparse
 import json
+import gzip
+import cProfile
 import drugcellfindcell
+from drugcellfindcell import pipeline
+from drugcellfindcell import worker
+from drugcellfindcell import fpcache
+from drugcellfindcell import resultcache
+from drugcellfindcell import executor
+from drugcellfindcell import trace
+from drugcellfindcell import cellquery
+from drugcellfindcell import generateoutput
+from drugcellfindcell import simindex
 
 
 def _parse_arguments(desc, args):
@@ -22,6 +32,61 @@ def _parse_arguments(desc, args):
                         help='comma delimited list of genes in file')
     parser.add_argument('--email',
                         help='e-mail address to notify upon completion')
+    parser.add_argument('--datadir', default=pipeline.SERVICE_DATADIR,
+                        help='directory containing DrugCell reference data')
+    parser.add_argument('--workdir', default='/tmp/drugcellinput',
+                        help='directory under which each task gets its '
+                             'own working directory named after its '
+                             'task id')
+    parser.add_argument('--predictscript',
+                        default=pipeline.DEFAULT_PREDICT_SCRIPT,
+                        help='DrugCell prediction script')
+    parser.add_argument('--fpcache',
+                        help='fingerprint cache database, if not set '
+                             'fingerprints are not cached')
+    parser.add_argument('--fpcachesize', type=int,
+                        default=fpcache.DEFAULT_MAX_ENTRIES,
+                        help='maximum number of fingerprints to cache')
+    parser.add_argument('--socket', default=worker.DEFAULT_SOCKET,
+                        help='Unix socket of a running drugcellfindcell '
+                             'worker, if no worker is listening the '
+                             'task is run in this process')
+    parser.add_argument('--noworker', action='store_true',
+                        help='always run the task in this process')
+    parser.add_argument('--cells',
+                        help='comma delimited cells to score, default is '
+                             'every cell in cell2ind.txt')
+    parser.add_argument('--mutations',
+                        help='comma delimited genes, only cells with at '
+                             'least one of them mutated are scored')
+    parser.add_argument('--topk', type=int,
+                        help='only report the k cells with the lowest '
+                             'predicted AUC for each drug')
+    parser.add_argument('--profile', action='store_true',
+                        help='run the task in this process under cProfile '
+                             'and write stats to ' + trace.PROFILE_FILE +
+                             ' in the task directory')
+    parser.add_argument('--resultcache',
+                        help='directory to cache task results in, if not '
+                             'set results are not cached')
+    parser.add_argument('--resultcachesize', type=int,
+                        default=resultcache.DEFAULT_MAX_BYTES,
+                        help='maximum size in bytes of cached results')
+    parser.add_argument('--resultcacheage', type=float,
+                        help='maximum age in seconds of a cached result, '
+                             'if not set results do not expire')
+    parser.add_argument('--similar', type=int,
+                        help='report the k most similar drugs by Tanimoto '
+                             'similarity of fingerprints for each drug, '
+                             'searched in --simindex or, if not set, the '
+                             'drugs in --fpcache')
+    parser.add_argument('--simindex',
+                        help='similarity index written by simindex.py')
+    parser.add_argument('--simworkers', type=int, default=1,
+                        help='threads to split large similarity '
+                             'indexes between')
+    pipeline.add_output_arguments(parser)
+    pipeline.add_engine_arguments(parser)
     return parser.parse_args(args)
 
 
@@ -35,6 +100,137 @@ def read_inputfile(inputfile):
         return f.read()
 
 
+def get_result(genes, outputdir, theargs, task_id=None):
+    """
+    Gets result for drugs from the result cache, a running
+    worker or by running the pipeline in this process. Stage
+    timings are written to ``trace.json`` in `outputdir` and with
+    ``--profile`` cProfile stats to ``profile.pstats``
+
+    :param genes: SMILES strings of drugs
+    :param outputdir: directory to write results to
+    :param theargs: parsed command line arguments
+    :param task_id: id of task passed to the worker
+    :return: result from :py:func:`pipeline.run_pipeline`
+    :rtype: dict
+    """
+    config = pipeline.PipelineConfig(datadir=theargs.datadir,
+                                     predictscript=theargs.predictscript,
+                                     fpcachefile=theargs.fpcache,
+                                     fpcachesize=theargs.fpcachesize,
+                                     cells=cellquery.parse_list(
+                                         theargs.cells),
+                                     mutations=cellquery.parse_list(
+                                         theargs.mutations),
+                                     topk=theargs.topk,
+                                     engine=theargs.engine,
+                                     batchsize=theargs.batchsize,
+                                     intrathreads=theargs.intrathreads,
+                                     interthreads=theargs.interthreads,
+                                     genotypeformat=theargs.genotypeformat,
+                                     embeddingcache=theargs.embeddingcache,
+                                     rlippworkers=theargs.rlippworkers,
+                                     writehidden=theargs.writehidden,
+                                     compresshidden=theargs.compresshidden,
+                                     ensemble=cellquery.parse_list(
+                                         theargs.ensemble),
+                                     outputschema=theargs.schema,
+                                     packauc=theargs.packauc,
+                                     gzipoutput=theargs.gzip)
+    tracer = trace.Tracer()
+    cache = None
+    if theargs.resultcache is not None:
+        with tracer.span('result_cache_lookup'):
+            cache = resultcache.ResultCache(
+                theargs.resultcache, max_bytes=theargs.resultcachesize,
+                max_age=theargs.resultcacheage)
+            with pipeline.opened_fpcache(config) as fpc:
+                cachekey = cache.make_task_key(genes, config, fpcache=fpc)
+            jsonResult = cache.get(cachekey)
+        if jsonResult is not None:
+            # drugs with identical fingerprints share results
+            if 'drugs' in jsonResult:
+                for d, smiles in zip(jsonResult['drugs'],
+                                     dict.fromkeys(genes)):
+                    d['smiles'] = smiles
+            tracer.write(os.path.join(outputdir, trace.TRACE_FILE))
+            return jsonResult
+
+    jsonResult = None
+    if not theargs.noworker and not theargs.profile:
+        jsonResult = worker.submit_task(genes, outputdir,
+                                        socketpath=theargs.socket,
+                                        task_id=task_id,
+                                        cells=config.cells,
+                                        mutations=config.mutations,
+                                        topk=config.topk,
+                                        settings=config.engine_settings())
+    if jsonResult is None:
+        profiler = None
+        if theargs.profile:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        try:
+            jsonResult = pipeline.run_pipeline(genes, config=config,
+                                               outputdir=outputdir,
+                                               tracer=tracer)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(os.path.join(outputdir,
+                                                 trace.PROFILE_FILE))
+    if cache is not None:
+        cache.put(cachekey, jsonResult)
+    return jsonResult
+
+
+def get_similar(genes, theargs):
+    """
+    Gets drugs most similar to each drug
+
+    :param genes: SMILES strings of drugs
+    :param theargs: parsed command line arguments
+    :raises ValueError: if neither ``--simindex`` nor ``--fpcache``
+                        is set
+    :return: from :py:func:`~drugcellfindcell.simindex.similar_drugs`
+    :rtype: list
+    """
+    cache = None
+    if theargs.fpcache is not None:
+        cache = fpcache.FingerprintCache(theargs.fpcache,
+                                         max_entries=theargs.fpcachesize)
+    try:
+        if theargs.simindex is not None:
+            index = simindex.TanimotoIndex.load(theargs.simindex)
+        elif cache is not None:
+            index = simindex.TanimotoIndex.from_fpcache(cache)
+        else:
+            raise ValueError('--similar needs --simindex or --fpcache')
+        with index:
+            return simindex.similar_drugs(index, genes, k=theargs.similar,
+                                          fpcache=cache,
+                                          workers=theargs.simworkers)
+    finally:
+        if cache is not None:
+            cache.close()
+
+
+def write_result(theres, compress=False):
+    """
+    Writes result as JSON to standard out
+
+    :param theres: result to write
+    :param compress: if ``True`` write gzip compressed JSON
+    """
+    if compress:
+        with gzip.GzipFile(fileobj=sys.stdout.buffer, mode='wb') as gz:
+            gz.write(json.dumps(theres).encode('utf-8'))
+        sys.stdout.buffer.flush()
+    else:
+        json.dump(theres, sys.stdout)
+    sys.stdout.flush()
+
+
 def main(args):
     """
     Main entry point for program
@@ -72,40 +268,39 @@ def main(args):
 
     try:
         inputfile = os.path.abspath(theargs.input)
-        os.mkdir("/tmp/drugcellinput")
+        drugcell_input_directory = executor.task_dir(theargs.workdir,
+                                                     taskId)
 
         inputGenes = read_inputfile(inputfile)
         genes = inputGenes.strip(',').strip('\n').split(',')
 
-        f = open("/tmp/drugcellinput/input_genes.txt", "a+")
+        f = open(os.path.join(drugcell_input_directory, "input_drug.txt"),
+                 "w")
         for gene in genes:
             f.write(gene + "\n")
         f.close()
 
-        os.chdir("/opt/conda/bin")
-
-        drugcell_pipeline = "commandline_test_cpu.sh"
-        drugcell_input_directory = "/tmp/drugcellinput"
-
-        with open('/tmp/drugcellinput/output.log', 'a') as stdout:
-            with open('/tmp/drugcellinput/error.log', 'a') as stderr:
-                subprocess.call(
-                    [drugcell_pipeline, drugcell_input_directory], stdout=stdout, stderr=stderr)
-
-        with open('/tmp/drugcellinput/output.json') as f:
-            jsonResult = json.load(f)
+        jsonResult = get_result(genes, drugcell_input_directory, theargs,
+                                task_id=taskId)
 
         theres = {
             'taskId': taskId,
             'email': theargs.email,
-            'inputGenes': inputGenes,
-            'predictions': jsonResult['predictions']
+            'inputGenes': inputGenes
         }
+        if 'drugs' in jsonResult:
+            theres['drugs'] = jsonResult['drugs']
+        else:
+            theres['predictions'] = jsonResult['predictions']
+        if theargs.similar is not None:
+            theres['similar'] = get_similar(genes, theargs)
+        if theargs.schema == generateoutput.NORMALIZED_SCHEMA:
+            theres = generateoutput.normalize_output(
+                theres, pack=theargs.packauc, smiles=genes[0])
         if theres is None:
             sys.stderr.write('No drugs found\n')
         else:
-            json.dump(theres, sys.stdout)
-        sys.stdout.flush()
+            write_result(theres, compress=theargs.gzip)
         return 0
     except Exception as e:
         sys.stderr.write('Caught exception: ' + str(e))
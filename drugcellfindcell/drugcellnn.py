@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+
+"""
+DrugCell visible neural network. The genotype branch mirrors the
+ontology, one small layer per GO term fed by its child terms and its
+directly annotated genes, and is combined with a fully connected
+branch over the drug fingerprint. Trained models such as
+``drugcell_v1.pt`` are whole pickled ``drugcell_NN.drugcell_nn``
+objects, :py:func:`load_model` maps that name to this module
+"""
+
+import sys
+
+import torch
+import torch.nn as nn
+
+
+PICKLED_MODULE = 'drugcell_NN'
+
+DEFAULT_GENOTYPE_HIDDENS = 6
+DEFAULT_DRUG_HIDDENS = (100, 50, 6)
+DEFAULT_FINAL_HIDDENS = 6
+
+
+def load_ontology(ontfile, gene2id):
+    """
+    Reads ontology file of ``parent\\tchild\\tdefault`` term edges
+    and ``term\\tgene\\tgene`` annotations
+
+    :param ontfile: path to ontology file
+    :param gene2id: gene name => column in genotype matrix, genes
+                    not in this mapping are ignored
+    :raises ValueError: if ontology does not have exactly one root
+    :return: (term => child terms, term => set of directly annotated
+             gene ids, root term)
+    :rtype: tuple
+    """
+    term_children = {}
+    term_direct_gene_map = {}
+    children = set()
+    with open(ontfile, 'r') as fi:
+        for line in fi:
+            tokens = line.rstrip('\n').split('\t')
+            if len(tokens) < 3:
+                continue
+            term_children.setdefault(tokens[0], [])
+            if tokens[2] == 'default':
+                term_children[tokens[0]].append(tokens[1])
+                term_children.setdefault(tokens[1], [])
+                children.add(tokens[1])
+            elif tokens[1] in gene2id:
+                term_direct_gene_map.setdefault(
+                    tokens[0], set()).add(gene2id[tokens[1]])
+    roots = [t for t in term_children if t not in children]
+    if len(roots) != 1:
+        raise ValueError('Ontology must have one root, found ' +
+                         str(len(roots)))
+    return term_children, term_direct_gene_map, roots[0]
+
+
+class drugcell_nn(nn.Module):
+    """
+    DrugCell model, named and laid out as the original so
+    pickled models load into it
+    """
+    def __init__(self, term_children, term_direct_gene_map, ngene, ndrug,
+                 root, num_hiddens_genotype=DEFAULT_GENOTYPE_HIDDENS,
+                 num_hiddens_drug=DEFAULT_DRUG_HIDDENS,
+                 num_hiddens_final=DEFAULT_FINAL_HIDDENS):
+        """
+        Constructor
+
+        :param term_children: term => child terms
+        :param term_direct_gene_map: term => set of directly
+                                     annotated gene ids
+        :param ngene: number of genes in genotype
+        :param ndrug: number of bits in drug fingerprint
+        :param root: root term
+        :param num_hiddens_genotype: hidden units per term
+        :param num_hiddens_drug: hidden units of each drug layer
+        :param num_hiddens_final: hidden units of final layer
+        """
+        super(drugcell_nn, self).__init__()
+        self.root = root
+        self.num_hiddens_genotype = num_hiddens_genotype
+        self.num_hiddens_drug = list(num_hiddens_drug)
+        self.term_direct_gene_map = term_direct_gene_map
+        self.term_dim_map = {t: num_hiddens_genotype for t in term_children}
+        self.gene_dim = ngene
+        self.drug_dim = ndrug
+
+        for term, gene_set in term_direct_gene_map.items():
+            self.add_module(term + '_direct_gene_layer',
+                            nn.Linear(ngene, len(gene_set)))
+        self._construct_nn_graph(term_children)
+
+        input_size = ndrug
+        for i, hiddens in enumerate(self.num_hiddens_drug, 1):
+            self.add_module('drug_linear_layer_' + str(i),
+                            nn.Linear(input_size, hiddens))
+            self.add_module('drug_batchnorm_layer_' + str(i),
+                            nn.BatchNorm1d(hiddens))
+            self.add_module('drug_aux_linear_layer1_' + str(i),
+                            nn.Linear(hiddens, 1))
+            self.add_module('drug_aux_linear_layer2_' + str(i),
+                            nn.Linear(1, 1))
+            input_size = hiddens
+
+        final_input_size = num_hiddens_genotype + self.num_hiddens_drug[-1]
+        self.add_module('final_linear_layer',
+                        nn.Linear(final_input_size, num_hiddens_final))
+        self.add_module('final_batchnorm_layer',
+                        nn.BatchNorm1d(num_hiddens_final))
+        self.add_module('final_aux_linear_layer',
+                        nn.Linear(num_hiddens_final, 1))
+        self.add_module('final_linear_layer_output', nn.Linear(1, 1))
+
+    def _construct_nn_graph(self, term_children):
+        """
+        Orders terms into layers, leaves first, and adds the
+        layers of each term
+        """
+        self.term_layer_list = []
+        self.term_neighbor_map = {t: list(c)
+                                  for t, c in term_children.items()}
+        remaining = set(term_children)
+        while remaining:
+            leaves = [t for t in term_children if t in remaining and
+                      remaining.isdisjoint(term_children[t])]
+            if not leaves:
+                raise ValueError('Ontology has a cycle')
+            self.term_layer_list.append(leaves)
+            for term in leaves:
+                input_size = sum(self.term_dim_map[c]
+                                 for c in self.term_neighbor_map[term])
+                if term in self.term_direct_gene_map:
+                    input_size += len(self.term_direct_gene_map[term])
+                hiddens = self.term_dim_map[term]
+                self.add_module(term + '_linear_layer',
+                                nn.Linear(input_size, hiddens))
+                self.add_module(term + '_batchnorm_layer',
+                                nn.BatchNorm1d(hiddens))
+                self.add_module(term + '_aux_linear_layer1',
+                                nn.Linear(hiddens, 1))
+                self.add_module(term + '_aux_linear_layer2',
+                                nn.Linear(1, 1))
+            remaining.difference_update(leaves)
+
+    def gene_layer_outputs(self, gene_input):
+        """
+        Runs the direct gene layer of every term
+
+        :param gene_input: genotype rows
+        :type gene_input: :py:class:`torch.Tensor`
+        :return: term => output
+        :rtype: dict
+        """
+        return {term: self._modules[term + '_direct_gene_layer'](gene_input)
+                for term in self.term_direct_gene_map}
+
+    def genotype_forward(self, gene_input):
+        """
+        Runs the genotype branch
+
+        :param gene_input: genotype rows
+        :type gene_input: :py:class:`torch.Tensor`
+        :return: (term => auxiliary output, term => hidden state,
+                 term => direct gene layer output)
+        :rtype: tuple
+        """
+        term_gene_out_map = self.gene_layer_outputs(gene_input)
+        term_nn_out_map = {}
+        aux_out_map = {}
+        for layer in self.term_layer_list:
+            for term in layer:
+                child_input_list = [term_nn_out_map[c]
+                                    for c in self.term_neighbor_map[term]]
+                if term in self.term_direct_gene_map:
+                    child_input_list.append(term_gene_out_map[term])
+                child_input = torch.cat(child_input_list, 1)
+                term_nn_out = self._modules[term + '_linear_layer'](
+                    child_input)
+                term_nn_out_map[term] = self._modules[
+                    term + '_batchnorm_layer'](torch.tanh(term_nn_out))
+                aux_layer1_out = torch.tanh(self._modules[
+                    term + '_aux_linear_layer1'](term_nn_out_map[term]))
+                aux_out_map[term] = self._modules[
+                    term + '_aux_linear_layer2'](aux_layer1_out)
+        return aux_out_map, term_nn_out_map, term_gene_out_map
+
+    def drug_forward(self, drug_input, aux_out_map, term_nn_out_map):
+        """
+        Runs the drug branch adding its outputs to the maps
+
+        :param drug_input: fingerprint rows
+        :type drug_input: :py:class:`torch.Tensor`
+        :return: output of last drug layer
+        :rtype: :py:class:`torch.Tensor`
+        """
+        drug_out = drug_input
+        for i in range(1, len(self.num_hiddens_drug) + 1):
+            drug_out = self._modules['drug_batchnorm_layer_' + str(i)](
+                torch.tanh(self._modules['drug_linear_layer_' + str(i)](
+                    drug_out)))
+            term_nn_out_map['drug_' + str(i)] = drug_out
+            aux_layer1_out = torch.tanh(self._modules[
+                'drug_aux_linear_layer1_' + str(i)](drug_out))
+            aux_out_map['drug_' + str(i)] = self._modules[
+                'drug_aux_linear_layer2_' + str(i)](aux_layer1_out)
+        return drug_out
+
+    def final_forward(self, root_out, drug_out, aux_out_map,
+                      term_nn_out_map):
+        """
+        Combines root term and drug branch outputs into the
+        prediction, stored as ``aux_out_map['final']``
+        """
+        final_input = torch.cat((root_out, drug_out), 1)
+        out = self._modules['final_batchnorm_layer'](
+            torch.tanh(self._modules['final_linear_layer'](final_input)))
+        term_nn_out_map['final'] = out
+        aux_layer_out = torch.tanh(self._modules['final_aux_linear_layer'](
+            out))
+        aux_out_map['final'] = self._modules['final_linear_layer_output'](
+            aux_layer_out)
+
+    def forward(self, x):
+        """
+        Runs the model on rows of genotype followed by fingerprint
+
+        :param x: input rows
+        :type x: :py:class:`torch.Tensor`
+        :return: (name => auxiliary output, name => hidden state),
+                 prediction is ``aux_out_map['final']``
+        :rtype: tuple
+        """
+        gene_input = x.narrow(1, 0, self.gene_dim)
+        drug_input = x.narrow(1, self.gene_dim, self.drug_dim)
+        aux_out_map, term_nn_out_map, _ = self.genotype_forward(gene_input)
+        drug_out = self.drug_forward(drug_input, aux_out_map,
+                                     term_nn_out_map)
+        self.final_forward(term_nn_out_map[self.root], drug_out,
+                           aux_out_map, term_nn_out_map)
+        return aux_out_map, term_nn_out_map
+
+
+def load_model(modelfile):
+    """
+    Loads pickled DrugCell model onto the CPU in evaluation mode
+
+    :param modelfile: path to model such as ``drugcell_v1.pt``
+    :return: model
+    :rtype: :py:class:`drugcell_nn`
+    """
+    # models pickled by the original code refer to drugcell_NN
+    if PICKLED_MODULE not in sys.modules:
+        sys.modules[PICKLED_MODULE] = sys.modules[__name__]
+    try:
+        model = torch.load(modelfile, map_location='cpu',
+                           weights_only=False)
+    except TypeError:  # pragma: no cover
+        model = torch.load(modelfile, map_location='cpu')
+    model.eval()
+    return model
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+
+"""
+Caches the output of the DrugCell genotype branch for every cell.
+That branch does not see the drug, so it only needs to run once per
+model and genotype, after which a request runs just the drug branch
+and the final layers. Entries are keyed by content hashes of the
+model and genotype files so a new model or genotype gets a new entry
+"""
+
+import os
+import sys
+import argparse
+import shutil
+import hashlib
+import logging
+import tempfile
+
+import numpy as np
+
+from drugcellfindcell import hiddenstore
+
+
+_CHUNK = 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+def file_digest(filename):
+    """
+    Gets sha256 of file content
+
+    :param filename: path to file
+    :return: hex digest
+    :rtype: str
+    """
+    sha = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(_CHUNK), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def genotype_files(config):
+    """
+    Gets the files the genotype is read from, ``cell2mutation.txt``
+    with either format
+
+    :param config: pipeline configuration
+    :type config: :py:class:`~drugcellfindcell.pipeline.PipelineConfig`
+    :rtype: list
+    """
+    return [config.genotypefile]
+
+
+def cache_key(config):
+    """
+    Builds key of the embeddings for the model and genotype in
+    `config`, every file is hashed so this reads all of them
+
+    :param config: pipeline configuration
+    :type config: :py:class:`~drugcellfindcell.pipeline.PipelineConfig`
+    :return: hex digest
+    :rtype: str
+    """
+    sha = hashlib.sha256()
+    for filename in [config.modelfile] + genotype_files(config):
+        sha.update(file_digest(filename).encode('utf-8'))
+    return sha.hexdigest()
+
+
+def build_embeddings(model, geno, outputdir, batch_size=1000):
+    """
+    Runs the genotype branch over every cell and writes the hidden
+    state of every term and the direct gene layer outputs to a
+    :py:mod:`~drugcellfindcell.hiddenstore`
+
+    :param model: model in evaluation mode
+    :type model: :py:class:`~drugcellfindcell.drugcellnn.drugcell_nn`
+    :param geno: genotype of every cell
+    :type geno: :py:class:`~drugcellfindcell.genotype.SparseGenotype`
+    :param outputdir: directory to write to, created if needed
+    :param batch_size: cells per forward pass
+    :return: `outputdir`
+    :rtype: str
+    """
+    import torch
+    if not os.path.isdir(outputdir):
+        os.makedirs(outputdir)
+    terms = [t for layer in model.term_layer_list for t in layer]
+    hidden = {t: [] for t in terms}
+    gene_out = {t: [] for t in model.term_direct_gene_map}
+    cells = len(geno)
+    with torch.no_grad():
+        for start in range(0, cells, batch_size):
+            end = min(start + batch_size, cells)
+            gene_input = torch.from_numpy(geno.dense(np.arange(start, end)))
+            aux_out_map, term_nn_out_map, term_gene_out_map = \
+                model.genotype_forward(gene_input)
+            for t in terms:
+                hidden[t].append(term_nn_out_map[t].numpy())
+            for t, out in term_gene_out_map.items():
+                gene_out[t].append(out.numpy())
+    hiddenstore.write_states(
+        os.path.join(outputdir, hiddenstore.HIDDEN_STORE_FILE),
+        {t: np.concatenate(v) for t, v in hidden.items()},
+        {t: np.concatenate(v) for t, v in gene_out.items()},
+        metadata={'cells': cells, 'root': model.root,
+                  'children': model.term_neighbor_map})
+    return outputdir
+
+
+class CellEmbeddings(object):
+    """
+    Read only view of embeddings written by :py:func:`build_embeddings`,
+    row `i` is the cell with id `i`. Each term is read from the memory
+    mapped store when first accessed
+    """
+    def __init__(self, directory):
+        """
+        Constructor
+
+        :param directory: directory written by :py:func:`build_embeddings`
+        """
+        self.store = hiddenstore.HiddenStore(
+            os.path.join(directory, hiddenstore.HIDDEN_STORE_FILE))
+        self.root = self.store.metadata['root']
+
+    def __len__(self):
+        return self.store.metadata['cells']
+
+    @property
+    def terms(self):
+        """
+        Terms with a hidden state, children before parents
+        """
+        return list(self.store.hidden())
+
+    def root_embedding(self, rows):
+        """
+        Gets hidden state of root term, the input to the final
+        layers alongside the drug branch
+
+        :param rows: cells to get
+        :rtype: :py:class:`numpy.ndarray`
+        """
+        return np.ascontiguousarray(self.store.read(self.root, rows=rows))
+
+    def hidden_states(self, rows):
+        """
+        Gets hidden state of every term
+
+        :param rows: cells to get
+        :return: term => hidden state
+        :rtype: :py:class:`~drugcellfindcell.hiddenstore.StoreMapping`
+        """
+        return self.store.hidden(rows=rows)
+
+    def gene_outputs(self, rows):
+        """
+        Gets direct gene layer output of each term that has genes
+
+        :param rows: cells to get
+        :return: term => output
+        :rtype: :py:class:`~drugcellfindcell.hiddenstore.StoreMapping`
+        """
+        return self.store.gene_outputs(rows=rows)
+
+
+def load_embeddings(cachedir, config, model, load_genotype,
+                    batch_size=1000):
+    """
+    Gets embeddings for the model and genotype in `config`, building
+    them first if the cache has no entry for their content
+
+    :param cachedir: directory holding one entry per key
+    :param config: pipeline configuration
+    :type config: :py:class:`~drugcellfindcell.pipeline.PipelineConfig`
+    :param model: model loaded from `config`
+    :param load_genotype: callable returning the genotype, only
+                          called when embeddings are built
+    :param batch_size: cells per forward pass when building
+    :rtype: :py:class:`CellEmbeddings`
+    """
+    entry = os.path.join(cachedir, cache_key(config))
+    storefile = os.path.join(entry, hiddenstore.HIDDEN_STORE_FILE)
+    if not os.path.isfile(storefile):
+        logger.info('Building cell embeddings in ' + entry)
+        if not os.path.isdir(cachedir):
+            os.makedirs(cachedir)
+        tmpdir = tempfile.mkdtemp(dir=cachedir, prefix='.build')
+        try:
+            build_embeddings(model, load_genotype(), tmpdir,
+                             batch_size=batch_size)
+            try:
+                os.rename(tmpdir, entry)
+            except OSError:
+                # another process built the same entry first
+                if not os.path.isfile(storefile):
+                    raise
+        finally:
+            if os.path.isdir(tmpdir):
+                shutil.rmtree(tmpdir)
+    return CellEmbeddings(entry)
+
+
+def _parse_arguments(desc, args):
+    """
+    Parses command line arguments
+    :param desc:
+    :param args:
+    :return:
+    """
+    from drugcellfindcell import genotype
+    from drugcellfindcell import pipeline
+    help_fm = argparse.ArgumentDefaultsHelpFormatter
+    parser = argparse.ArgumentParser(description=desc,
+                                     formatter_class=help_fm)
+    parser.add_argument('cachedir',
+                        help='directory to write cell embeddings to')
+    parser.add_argument('--datadir', default=pipeline.DEFAULT_DATADIR,
+                        help='directory containing DrugCell reference data')
+    parser.add_argument('--modelfile',
+                        help='trained DrugCell model, default is '
+                             'pretrained_model/drugcell_v1.pt under '
+                             '--datadir')
+    parser.add_argument('--genotypeformat', choices=genotype.FORMATS,
+                        default=genotype.SPARSE_FORMAT,
+                        help='genotype source, see pipeline')
+    parser.add_argument('--batchsize', type=int,
+                        default=pipeline.DEFAULT_BATCH_SIZE,
+                        help='cells per forward pass')
+    return parser.parse_args(args)
+
+
+def main(args):
+    """
+    Precomputes cell embeddings
+
+    :param args: command line arguments usually :py:const:`sys.argv`
+    :return: 0 for success otherwise failure
+    :rtype: int
+    """
+    from drugcellfindcell import drugcellnn
+    from drugcellfindcell import genotype
+    from drugcellfindcell import pipeline
+    desc = """
+        Runs the genotype branch of the DrugCell model over every
+        cell once and caches the result in cachedir, for use with
+        --engine native --embeddingcache cachedir
+    """
+    theargs = _parse_arguments(desc, args[1:])
+    config = pipeline.PipelineConfig(datadir=theargs.datadir,
+                                     modelfile=theargs.modelfile,
+                                     genotypeformat=theargs.genotypeformat)
+    embeddings = load_embeddings(
+        theargs.cachedir, config, drugcellnn.load_model(config.modelfile),
+        lambda: genotype.load_genotype(config, fmt=config.genotypeformat),
+        batch_size=theargs.batchsize)
+    sys.stdout.write(str(len(embeddings)) + ' cells in ' +
+                     os.path.join(theargs.cachedir, cache_key(config)) +
+                     '\n')
+    return 0
+
+
+if __name__ == '__main__':  # pragma: no cover
+    sys.exit(main(sys.argv))
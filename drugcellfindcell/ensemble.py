@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+
+"""
+Scores drugs with several trained DrugCell models at once. Each model
+runs in its own worker process. The genotype of every cell is placed
+in shared memory once, and the fingerprints and rows of each request
+are too, so no worker holds a copy of them. Workers write their
+predictions into a shared matrix, from which the mean predicted AUC
+and its standard deviation across models are taken
+"""
+
+import os
+import copy
+import time
+import logging
+import weakref
+import traceback
+import multiprocessing
+
+import numpy as np
+
+from drugcellfindcell import buildinput
+from drugcellfindcell import columnar
+from drugcellfindcell import genotype as genotypemod
+from drugcellfindcell import pipeline
+from drugcellfindcell import sharedmem
+
+
+logger = logging.getLogger(__name__)
+
+
+def _serve(conn, config, modelfile, genotype_specs, ngenes, threads):
+    """
+    Runs in a worker process. Loads one model then scores
+    requests received on `conn` until it receives ``None``
+    """
+    from drugcellfindcell import inference
+
+    blocks = []
+    try:
+        config = copy.copy(config)
+        config.modelfile = modelfile
+        geno = indptr = indices = None
+        if genotype_specs is not None:
+            indptr_spec, indices_spec = genotype_specs
+            indptr_block, indptr = sharedmem.attach_array(indptr_spec)
+            indices_block, indices = sharedmem.attach_array(indices_spec)
+            blocks = [indptr_block, indices_block]
+            geno = genotypemod.SparseGenotype(indptr, indices, ngenes)
+        engine = inference.InferenceEngine(
+            config, batch_size=config.batchsize, intra_threads=threads,
+            inter_threads=config.interthreads,
+            embedding_cache=config.embeddingcache, genotype=geno)
+        engine.load()
+    except Exception as e:
+        conn.send(('error', _portable(e)))
+        return
+    conn.send(('ready', None))
+
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            # parent exited without stopping this worker
+            request = None
+        if request is None:
+            break
+        try:
+            conn.send(('done', _score(engine, request, config.rlippworkers)))
+        except Exception as e:
+            conn.send(('error', _portable(e)))
+    engine = geno = indptr = indices = None
+    sharedmem.release(blocks)
+
+
+def _score(engine, request, rlipp_workers):
+    """
+    Scores the rows of a request with the model of this worker,
+    writing predictions to its row of the shared output
+
+    :return: term => RLIPP score
+    :rtype: dict
+    """
+    from drugcellfindcell import rlipp
+
+    blocks = []
+    arrays = {}
+    try:
+        for key, spec in request['arrays'].items():
+            block, arrays[key] = sharedmem.attach_array(spec)
+            blocks.append(block)
+        predicted, hidden, gene_out = engine.run(
+            arrays['cell_rows'], arrays['fingerprints'], arrays['drug_rows'])
+        arrays['output'][request['index']] = predicted
+        return rlipp.compute_rlipp(predicted, hidden,
+                                   engine.model.term_neighbor_map, gene_out,
+                                   workers=rlipp_workers)
+    finally:
+        # views of the blocks have to go before the blocks can close
+        arrays = predicted = hidden = gene_out = None
+        sharedmem.release(blocks)
+
+
+def _portable(e):
+    """
+    Gets exception that can be sent back to the parent
+    """
+    if isinstance(e, (ValueError, KeyError, OSError)):
+        return e
+    return RuntimeError(type(e).__name__ + ': ' + str(e) + '\n' +
+                        traceback.format_exc())
+
+
+def _shutdown(workers, blocks):
+    """
+    Stops workers and frees the shared genotype
+    """
+    for process, conn in workers:
+        try:
+            conn.send(None)
+        except (OSError, ValueError):
+            pass
+    for process, conn in workers:
+        process.join(timeout=10)
+        if process.is_alive():
+            process.terminate()
+        conn.close()
+    sharedmem.release(blocks, unlink=True)
+
+
+class EnsemblePredictor(object):
+    """
+    Predictor that averages several DrugCell models, a drop in
+    replacement for :py:class:`~drugcellfindcell.inference.InferenceEngine`.
+    Besides the predictions and RLIPP file it writes the standard
+    deviation of the models' predictions to the
+    :py:const:`~drugcellfindcell.columnar.PREDICTED_STD_FILE` column.
+    RLIPP scores are the mean of each model's scores
+    """
+    def __init__(self, config, modelfiles=None):
+        """
+        Constructor
+
+        :param config: pipeline configuration, the native engine
+                       settings in it apply to every model
+        :type config: :py:class:`~drugcellfindcell.pipeline.PipelineConfig`
+        :param modelfiles: trained models, if ``None`` the `ensemble`
+                           set in `config`
+        :raises ValueError: if there are no models
+        """
+        if modelfiles is None:
+            modelfiles = config.ensemble
+        if not modelfiles:
+            raise ValueError('Ensemble needs at least one model')
+        self._config = config
+        self.modelfiles = list(modelfiles)
+        self.cell2id = None
+        self.stats = None
+        self._workers = None
+        self._finalizer = None
+
+    def load(self):
+        """
+        Shares the genotype and starts a worker per model, returning
+        once every model is loaded. Only the first call does any work
+
+        :raises ValueError: if a worker fails to load its model
+        """
+        if self._workers is not None:
+            return
+        config = self._config
+        blocks = []
+        genotype_specs = None
+        ngenes = None
+        # cells read from the embedding cache need no genotype
+        if config.embeddingcache is None:
+            geno = genotypemod.load_genotype(config,
+                                             fmt=config.genotypeformat)
+            indptr_block, indptr_spec = sharedmem.share_array(
+                geno.indptr)
+            indices_block, indices_spec = sharedmem.share_array(
+                geno.indices)
+            blocks = [indptr_block, indices_block]
+            genotype_specs = (indptr_spec, indices_spec)
+            ngenes = geno.ngenes
+            geno = None
+        threads = config.intrathreads
+        if threads is None:
+            # models run side by side so split the cores between them
+            threads = max(1, (os.cpu_count() or 1) // len(self.modelfiles))
+
+        # spawned so workers do not inherit torch state of this process.
+        # Not daemons, as those cannot start the RLIPP pool, the
+        # finalizer stops them instead
+        context = multiprocessing.get_context('spawn')
+        workers = []
+        for modelfile in self.modelfiles:
+            conn, child = context.Pipe()
+            process = context.Process(target=_serve,
+                                      args=(child, config, modelfile,
+                                            genotype_specs, ngenes,
+                                            threads))
+            process.start()
+            child.close()
+            workers.append((process, conn))
+        self._finalizer = weakref.finalize(self, _shutdown, workers, blocks)
+        try:
+            for modelfile, (status, value) in zip(self.modelfiles,
+                                                  self._receive(workers)):
+                if status == 'error':
+                    raise ValueError('Unable to load ' + modelfile + ': ' +
+                                     str(value))
+        except Exception:
+            self._finalizer()
+            raise
+        self._workers = workers
+        self.cell2id = buildinput.load_mapping(config.cell2idfile)
+
+    def _receive(self, workers):
+        """
+        Gets the next message from every worker
+        """
+        res = []
+        for modelfile, (process, conn) in zip(self.modelfiles, workers):
+            try:
+                res.append(conn.recv())
+            except EOFError:
+                res.append(('error', RuntimeError(
+                    'Worker for ' + modelfile + ' exited with code ' +
+                    str(process.exitcode))))
+        return res
+
+    def close(self):
+        """
+        Stops workers and frees shared memory
+        """
+        if self._finalizer is not None:
+            self._finalizer()
+        self._workers = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def predict(self, inputfiles, outputdir):
+        """
+        Scores rows of the columnar input with every model and
+        writes the mean prediction and its standard deviation to
+        the columns and the mean RLIPP scores to a file
+
+        :param inputfiles: paths keyed by `fingerprint` and `columns`
+        :param outputdir: directory to write results to
+        :raises ValueError: if a cell is not in ``cell2ind.txt``
+        :return: (``None`` as there is no predictions file,
+                 path to RLIPP file)
+        :rtype: tuple
+        """
+        from drugcellfindcell import inference
+        from drugcellfindcell import rlipp
+
+        self.load()
+        start = time.time()
+        cell_rows, fingerprints, drug_rows = inference.read_input(
+            inputfiles, self.cell2id, self._config.cell2idfile)
+        blocks = []
+        specs = {}
+        try:
+            for key, array in [('cell_rows', cell_rows),
+                               ('fingerprints', fingerprints),
+                               ('drug_rows', drug_rows),
+                               ('output', np.zeros((len(self.modelfiles),
+                                                    len(cell_rows)),
+                                                   dtype=np.float32))]:
+                block, specs[key] = sharedmem.share_array(array)
+                blocks.append(block)
+            for i, (process, conn) in enumerate(self._workers):
+                conn.send({'index': i, 'arrays': specs})
+            replies = self._receive(self._workers)
+            for status, value in replies:
+                if status == 'error':
+                    raise value
+            output_block, output = sharedmem.attach_array(specs['output'])
+            try:
+                predictions = np.array(output, dtype=np.float64)
+            finally:
+                output = None
+                output_block.close()
+        finally:
+            sharedmem.release(blocks, unlink=True)
+        elapsed = time.time() - start
+
+        # mean and spread go to the columns at the same precision
+        columnar.write_predictions(inputfiles['columns'],
+                                   predictions.mean(axis=0))
+        columnar.write_predictions(inputfiles['columns'],
+                                   predictions.std(axis=0),
+                                   filename=columnar.PREDICTED_STD_FILE)
+        rlippfile = os.path.join(outputdir, pipeline.RLIPP_FILE)
+        rlipp.write_rlipp(rlippfile, _mean_scores([v for s, v in replies]))
+
+        self.stats = {'cells': len(cell_rows), 'models': len(self.modelfiles),
+                      'seconds': elapsed,
+                      'cells_per_second': len(cell_rows) / elapsed
+                      if elapsed > 0 else float('inf')}
+        logger.info('Scored ' + str(len(cell_rows)) + ' cells with ' +
+                    str(len(self.modelfiles)) + ' models in ' +
+                    '%.3f' % elapsed + ' seconds')
+        return None, rlippfile
+
+
+def _mean_scores(scores):
+    """
+    Averages term => score dicts, a term missing from some
+    models is averaged over the models that have it
+    """
+    total = {}
+    count = {}
+    for s in scores:
+        for term, value in s.items():
+            total[term] = total.get(term, 0.0) + value
+            count[term] = count.get(term, 0) + 1
+    return {t: total[t] / count[t] for t in total}
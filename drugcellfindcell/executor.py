@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+"""
+Runs several DrugCell tasks at once in a bounded pool of processes,
+giving each task its own working directory and a share of the cores
+"""
+
+import os
+import re
+import sys
+import concurrent.futures
+
+
+THREAD_ENV_VARS = ['OMP_NUM_THREADS', 'MKL_NUM_THREADS',
+                   'OPENBLAS_NUM_THREADS', 'NUMEXPR_NUM_THREADS']
+
+# per process state set up by _init_process
+_worker = None
+
+
+def task_dir(workroot, task_id):
+    """
+    Creates working directory for a task under `workroot`
+
+    :param workroot: directory holding all task directories
+    :param task_id: id of task, characters other than letters,
+                    digits, ``.``, ``_`` and ``-`` are replaced
+                    with ``_``
+    :raises ValueError: if `task_id` is empty
+    :return: path to task directory
+    :rtype: str
+    """
+    name = re.sub(r'[^A-Za-z0-9._-]', '_', str(task_id)).lstrip('.')
+    if not name:
+        raise ValueError('Invalid task id: ' + str(task_id))
+    path = os.path.join(workroot, name)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def default_threads_per_task(max_workers):
+    """
+    Splits the cores evenly between `max_workers` tasks
+
+    :param max_workers: number of tasks run at once
+    :return: number of threads each task may use, at least 1
+    :rtype: int
+    """
+    return max(1, (os.cpu_count() or 1) // max_workers)
+
+
+def set_thread_budget(threads):
+    """
+    Limits the number of threads used by torch and the
+    OpenMP/MKL/BLAS libraries in this process
+
+    :param threads: number of threads
+    """
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(threads)
+    torch = sys.modules.get('torch')
+    if torch is not None:
+        torch.set_num_threads(threads)
+
+
+def _init_process(config, threads, predictor_factory):
+    """
+    Sets thread budget and loads worker in a pool process
+    """
+    global _worker
+    from drugcellfindcell import worker
+
+    set_thread_budget(threads)
+    predictor = None
+    if predictor_factory is not None:
+        predictor = predictor_factory(config)
+    _worker = worker.DrugCellWorker(config, predictor=predictor)
+    _worker.load()
+
+
+def _run_task(task):
+    """
+    Runs task on the worker of this pool process
+    """
+    return _worker.run_task(task)
+
+
+def _run_batch(tasks):
+    """
+    Runs batch of tasks on the worker of this pool process
+    """
+    return _worker.run_batch(tasks)
+
+
+class TaskExecutor(object):
+    """
+    Bounded pool of processes, each keeping its own reference
+    data and predictor loaded, that runs tasks concurrently
+    """
+    def __init__(self, config, max_workers=2, threads_per_task=None,
+                 predictor_factory=None):
+        """
+        Constructor
+
+        :param config: pipeline configuration
+        :type config: :py:class:`~drugcellfindcell.pipeline.PipelineConfig`
+        :param max_workers: maximum number of tasks run at once
+        :param threads_per_task: threads each task may use, if ``None``
+                                 cores are split evenly between tasks
+        :param predictor_factory: callable taking `config` and returning
+                                  predictor for a pool process, if
+                                  ``None`` the worker default is used
+        """
+        if threads_per_task is None:
+            threads_per_task = default_threads_per_task(max_workers)
+        self.max_workers = max_workers
+        self.threads_per_task = threads_per_task
+        self._pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers=max_workers, initializer=_init_process,
+            initargs=(config, threads_per_task, predictor_factory))
+
+    def submit(self, task):
+        """
+        Queues task to run once a pool process is free
+
+        :param task: task with `smiles` and `outputdir`
+        :type task: dict
+        :return: future holding result from
+                 :py:func:`~drugcellfindcell.pipeline.run_pipeline`
+        :rtype: :py:class:`concurrent.futures.Future`
+        """
+        return self._pool.submit(_run_task, task)
+
+    def run_task(self, task):
+        """
+        Runs task in a pool process and waits for it
+
+        :param task: task with `smiles` and `outputdir`
+        :type task: dict
+        :return: result from
+                 :py:func:`~drugcellfindcell.pipeline.run_pipeline`
+        :rtype: dict
+        """
+        return self.submit(task).result()
+
+    def run_batch(self, tasks):
+        """
+        Runs tasks as one prediction pass in a pool process
+        and waits for them
+
+        :param tasks: tasks with `smiles` and `outputdir`
+        :type tasks: list
+        :return: results from
+                 :py:meth:`~drugcellfindcell.worker.DrugCellWorker.run_batch`
+        :rtype: list
+        """
+        return self._pool.submit(_run_batch, tasks).result()
+
+    def shutdown(self, wait=True):
+        """
+        Stops pool processes
+
+        :param wait: if ``True`` wait for queued tasks to finish
+        """
+        self._pool.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
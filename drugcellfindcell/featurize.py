@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+
+"""
+Fingerprints whole compound libraries with the morgan settings of
+:py:mod:`~drugcellfindcell.fingerprint`. SMILES are streamed in chunks to
+a process pool and rows are written into a preallocated memory mapped
+matrix in :py:const:`~drugcellfindcell.fingerprintio.NPY_FORMAT`
+"""
+
+import os
+import sys
+import argparse
+import logging
+import collections
+import multiprocessing
+
+import numpy as np
+
+from drugcellfindcell import fingerprint
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNKSIZE = 1000
+
+INDEX_SUFFIX = '.index.txt'
+INVALID_SUFFIX = '.invalid.txt'
+
+
+def count_smiles(inputfile):
+    """
+    Counts non blank lines in SMILES file
+
+    :param inputfile: path to SMILES file
+    :return: number of SMILES
+    :rtype: int
+    """
+    count = 0
+    with open(inputfile, 'r') as fi:
+        for line in fi:
+            if line.strip():
+                count += 1
+    return count
+
+
+def read_chunks(inputfile, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Reads SMILES file in chunks. Each line has SMILES in the first
+    tab delimited column and an optional id in the second, lines
+    without an id get their row number as id. Blank lines are skipped
+
+    :param inputfile: path to SMILES file
+    :param chunksize: number of SMILES per chunk
+    :return: generator of (row of first SMILES, list of (id, SMILES))
+    """
+    chunk = []
+    start = 0
+    row = 0
+    with open(inputfile, 'r') as fi:
+        for line in fi:
+            tokens = line.strip().split('\t')
+            if not tokens[0]:
+                continue
+            if len(tokens) > 1:
+                chunk.append((tokens[1], tokens[0]))
+            else:
+                chunk.append((str(row), tokens[0]))
+            row += 1
+            if len(chunk) == chunksize:
+                yield start, chunk
+                start = row
+                chunk = []
+    if chunk:
+        yield start, chunk
+
+
+def _init_process():
+    """
+    Silences RDKit parse errors, invalid SMILES are reported
+    by :py:func:`featurize_library` instead
+    """
+    from rdkit import RDLogger
+    RDLogger.DisableLog('rdApp.*')
+
+
+def featurize_chunk(start, smiles, radius=fingerprint.FINGERPRINT_RADIUS,
+                    nbits=fingerprint.FINGERPRINT_BITS):
+    """
+    Fingerprints a chunk of SMILES
+
+    :param start: row of first SMILES in chunk
+    :param smiles: SMILES strings
+    :param radius: morgan fingerprint radius
+    :param nbits: number of bits in fingerprint, must be a multiple of 8
+    :return: (`start`, packed bits with one row per SMILES,
+             offsets within chunk of SMILES RDKit could not parse).
+             Rows of invalid SMILES are all zero
+    :rtype: tuple
+    """
+    bits = np.zeros((len(smiles), nbits), dtype=np.uint8)
+    invalid = []
+    for i, s in enumerate(smiles):
+        try:
+            mol = fingerprint.parse_smiles(s)
+        except ValueError:
+            invalid.append(i)
+            continue
+        bits[i] = fingerprint.mol_fingerprint_array(mol, radius=radius,
+                                                    nbits=nbits)
+    return start, np.packbits(bits, axis=1), invalid
+
+
+def featurize_library(inputfile, outputfile, processes=None,
+                      chunksize=DEFAULT_CHUNKSIZE,
+                      radius=fingerprint.FINGERPRINT_RADIUS,
+                      nbits=fingerprint.FINGERPRINT_BITS):
+    """
+    Fingerprints every SMILES in `inputfile` writing the packed bit
+    matrix to `outputfile`, the row/id/SMILES index to
+    ``<outputfile>.index.txt`` and SMILES RDKit could not parse
+    to ``<outputfile>.invalid.txt``
+
+    :param inputfile: path to SMILES file, see :py:func:`read_chunks`
+    :param outputfile: path to ``.npy`` file to write
+    :param processes: number of worker processes, ``None`` uses
+                      every CPU
+    :param chunksize: number of SMILES sent to a worker at a time
+    :param radius: morgan fingerprint radius
+    :param nbits: number of bits in fingerprint, must be a multiple of 8
+    :return: `total` number of SMILES and number `invalid`
+    :rtype: dict
+    """
+    total = count_smiles(inputfile)
+    matrix = np.lib.format.open_memmap(outputfile, mode='w+',
+                                       dtype=np.uint8,
+                                       shape=(total, nbits // 8))
+    if processes is None:
+        processes = os.cpu_count() or 1
+    max_pending = processes * 2
+    invalid_count = 0
+
+    with multiprocessing.Pool(processes, initializer=_init_process) as pool, \
+            open(outputfile + INDEX_SUFFIX, 'w') as indexfile, \
+            open(outputfile + INVALID_SUFFIX, 'w') as invalidfile:
+        pending = collections.deque()
+        chunks = {}
+
+        def _collect():
+            start, packed, invalid = pending.popleft().get()
+            matrix[start:start + len(packed)] = packed
+            chunk = chunks.pop(start)
+            for i in invalid:
+                invalidfile.write('%d\t%s\t%s\n' % (start + i, chunk[i][0],
+                                                    chunk[i][1]))
+            return len(invalid)
+
+        for start, chunk in read_chunks(inputfile, chunksize=chunksize):
+            for i, (drugid, smiles) in enumerate(chunk):
+                indexfile.write('%d\t%s\t%s\n' % (start + i, drugid, smiles))
+            chunks[start] = chunk
+            pending.append(pool.apply_async(featurize_chunk,
+                                            (start, [c[1] for c in chunk]),
+                                            {'radius': radius,
+                                             'nbits': nbits}))
+            if len(pending) >= max_pending:
+                invalid_count += _collect()
+        while pending:
+            invalid_count += _collect()
+
+    matrix.flush()
+    logger.info('Fingerprinted ' + str(total) + ' SMILES, ' +
+                str(invalid_count) + ' invalid')
+    return {'total': total, 'invalid': invalid_count}
+
+
+def _parse_arguments(desc, args):
+    """
+    Parses command line arguments
+    :param desc:
+    :param args:
+    :return:
+    """
+    help_fm = argparse.ArgumentDefaultsHelpFormatter
+    parser = argparse.ArgumentParser(description=desc,
+                                     formatter_class=help_fm)
+    parser.add_argument('input',
+                        help='SMILES file with SMILES in first column and '
+                             'optional id in second tab delimited column')
+    parser.add_argument('output',
+                        help='.npy file to write packed fingerprints to')
+    parser.add_argument('--processes', type=int,
+                        help='number of worker processes, default is '
+                             'number of CPUs')
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE,
+                        help='number of SMILES sent to a worker at a time')
+    parser.add_argument('--radius', type=int,
+                        default=fingerprint.FINGERPRINT_RADIUS,
+                        help='morgan fingerprint radius')
+    parser.add_argument('--nbits', type=int,
+                        default=fingerprint.FINGERPRINT_BITS,
+                        help='number of bits in fingerprint')
+    return parser.parse_args(args)
+
+
+def main(args):
+    """
+    Fingerprints SMILES library
+
+    :param args: command line arguments usually :py:const:`sys.argv`
+    :return: 0 for success otherwise failure
+    :rtype: int
+    """
+    desc = """
+        Fingerprints every SMILES in input file writing packed
+        morgan fingerprints to output .npy file along with
+        <output>.index.txt (row, id, SMILES) and
+        <output>.invalid.txt listing SMILES RDKit could not parse
+    """
+    theargs = _parse_arguments(desc, args[1:])
+    if theargs.nbits % 8 != 0:
+        sys.stderr.write('--nbits must be a multiple of 8\n')
+        return 2
+    res = featurize_library(theargs.input, theargs.output,
+                            processes=theargs.processes,
+                            chunksize=theargs.chunksize,
+                            radius=theargs.radius, nbits=theargs.nbits)
+    sys.stderr.write('Fingerprinted %d SMILES, %d invalid\n' %
+                     (res['total'], res['invalid']))
+    return 0
+
+
+if __name__ == '__main__':  # pragma: no cover
+    sys.exit(main(sys.argv))
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+"""
+Morgan fingerprints of drugs. RDKit is imported on first use and only
+the parts needed to parse SMILES and fingerprint a molecule, so
+importing this module, and the modules that import it, does not pay
+for RDKit or its drawing stack until a drug is actually fingerprinted
+"""
+
+import functools
+
+
+FINGERPRINT_RADIUS = 2
+FINGERPRINT_BITS = 2048
+
+
+def _chem():
+    """
+    Gets :py:mod:`rdkit.Chem`
+    """
+    from rdkit import Chem
+    return Chem
+
+
+@functools.lru_cache(maxsize=None)
+def _generator(radius, nbits):
+    """
+    Gets morgan fingerprint generator, ``None`` on RDKit
+    releases without :py:mod:`rdkit.Chem.rdFingerprintGenerator`
+    """
+    try:
+        from rdkit.Chem import rdFingerprintGenerator
+    except ImportError:
+        return None
+    return rdFingerprintGenerator.GetMorganGenerator(radius=radius,
+                                                     fpSize=nbits)
+
+
+def parse_smiles(smiles):
+    """
+    Parses SMILES string with RDKit
+
+    :param smiles: SMILES string for drug
+    :raises ValueError: if `smiles` cannot be parsed by RDKit
+    :return: molecule
+    :rtype: :py:class:`rdkit.Chem.rdchem.Mol`
+    """
+    d = _chem().MolFromSmiles(smiles)
+    if d is None:
+        raise ValueError('Unable to parse SMILES: ' + str(smiles))
+    return d
+
+
+def canonical_smiles(mol):
+    """
+    Gets RDKit canonical SMILES for molecule
+
+    :param mol: molecule from :py:func:`parse_smiles`
+    :return: canonical SMILES
+    :rtype: str
+    """
+    return _chem().MolToSmiles(mol)
+
+
+def mol_fingerprint_array(mol, radius=FINGERPRINT_RADIUS,
+                          nbits=FINGERPRINT_BITS):
+    """
+    Builds morgan fingerprint of parsed molecule as an array, the
+    same bits ``SimilarityMaps.GetMorganFingerprint(fpType='bv')``
+    gives
+
+    :param mol: molecule from :py:func:`parse_smiles`
+    :param radius: morgan fingerprint radius
+    :param nbits: number of bits in fingerprint
+    :return: fingerprint bits
+    :rtype: :py:class:`numpy.ndarray` of uint8
+    """
+    generator = _generator(radius, nbits)
+    if generator is not None:
+        return generator.GetFingerprintAsNumPy(mol)
+    import numpy as np
+    from rdkit.Chem import rdMolDescriptors
+    return np.array(list(rdMolDescriptors.GetMorganFingerprintAsBitVect(
+        mol, radius, nBits=nbits)), dtype=np.uint8)
+
+
+def mol_fingerprint(mol, radius=FINGERPRINT_RADIUS, nbits=FINGERPRINT_BITS):
+    """
+    Builds morgan fingerprint bit vector for parsed molecule
+
+    :param mol: molecule from :py:func:`parse_smiles`
+    :param radius: morgan fingerprint radius
+    :param nbits: number of bits in fingerprint
+    :return: fingerprint bits
+    :rtype: list
+    """
+    return mol_fingerprint_array(mol, radius=radius, nbits=nbits).tolist()
+
+
+def morgan_fingerprint(smiles, radius=FINGERPRINT_RADIUS,
+                       nbits=FINGERPRINT_BITS):
+    """
+    Builds morgan fingerprint bit vector for the drug
+
+    :param smiles: SMILES string for drug
+    :param radius: morgan fingerprint radius
+    :param nbits: number of bits in fingerprint
+    :raises ValueError: if `smiles` cannot be parsed by RDKit
+    :return: fingerprint bits
+    :rtype: list
+    """
+    return mol_fingerprint(parse_smiles(smiles), radius=radius, nbits=nbits)
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+"""
+Reads and writes drug fingerprint matrices either as comma delimited
+text (one row of ``0``/``1`` per drug) or as bits packed 8 per byte
+in a ``.npy`` file that can be memory mapped
+"""
+
+import numpy as np
+
+
+TEXT_FORMAT = 'text'
+NPY_FORMAT = 'npy'
+FORMATS = [TEXT_FORMAT, NPY_FORMAT]
+
+
+def get_format(filename):
+    """
+    Gets format of fingerprint file from its extension
+
+    :param filename: path to fingerprint file
+    :return: :py:const:`NPY_FORMAT` for ``.npy`` files
+             otherwise :py:const:`TEXT_FORMAT`
+    :rtype: str
+    """
+    if filename.endswith('.npy'):
+        return NPY_FORMAT
+    return TEXT_FORMAT
+
+
+def write_fingerprints(filename, fingerprints, fmt=TEXT_FORMAT):
+    """
+    Writes fingerprint matrix
+
+    :param filename: path to write to
+    :param fingerprints: fingerprint bits, one row per drug
+    :param fmt: :py:const:`TEXT_FORMAT` or :py:const:`NPY_FORMAT`,
+                for the latter number of bits must be a multiple of 8
+    :raises ValueError: if `fmt` is not a known format
+    """
+    if fmt == TEXT_FORMAT:
+        with open(filename, 'w') as fo:
+            for f in fingerprints:
+                fo.write("%s\n" % ','.join(map(str, f)))
+        return
+    if fmt == NPY_FORMAT:
+        bits = np.asarray(fingerprints, dtype=np.uint8)
+        np.save(filename, np.packbits(bits, axis=1))
+        return
+    raise ValueError('Unknown fingerprint format: ' + str(fmt))
+
+
+def load_packed(filename, mmap=True):
+    """
+    Loads packed fingerprint matrix written in :py:const:`NPY_FORMAT`
+
+    :param filename: path to ``.npy`` fingerprint file
+    :param mmap: if ``True`` memory map the file instead of reading it
+    :return: packed bits with shape (drugs, bits / 8)
+    :rtype: :py:class:`numpy.ndarray`
+    """
+    return np.load(filename, mmap_mode='r' if mmap else None)
+
+
+def unpack(packed, rows=None, dtype=np.float32):
+    """
+    Expands packed fingerprints into a dense matrix
+
+    :param packed: packed bits from :py:func:`load_packed`
+    :param rows: indices of rows to expand, ``None`` for all
+    :param dtype: type of returned matrix
+    :return: dense matrix with one 0/1 column per bit
+    :rtype: :py:class:`numpy.ndarray`
+    """
+    if rows is not None:
+        packed = packed[rows]
+    return np.unpackbits(packed, axis=1).astype(dtype)
+
+
+def load_fingerprints(filename, dtype=np.float32):
+    """
+    Loads dense fingerprint matrix from file in either format,
+    as the DrugCell predictor expects it
+
+    :param filename: path to fingerprint file
+    :param dtype: type of returned matrix
+    :return: dense matrix with one row per drug
+    :rtype: :py:class:`numpy.ndarray`
+    """
+    if get_format(filename) == NPY_FORMAT:
+        return unpack(load_packed(filename), dtype=dtype)
+    return np.loadtxt(filename, delimiter=',', dtype=dtype, ndmin=2)
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+
+"""
+On disk cache of morgan fingerprints keyed by RDKit canonical
+SMILES and fingerprint parameters
+"""
+
+import time
+import sqlite3
+import logging
+import threading
+
+from drugcellfindcell import fingerprint
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 100000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fingerprints (
+    canonical TEXT NOT NULL,
+    radius INTEGER NOT NULL,
+    nbits INTEGER NOT NULL,
+    bits BLOB NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (canonical, radius, nbits));
+CREATE INDEX IF NOT EXISTS fingerprints_last_used
+    ON fingerprints (last_used);
+CREATE TABLE IF NOT EXISTS aliases (
+    smiles TEXT NOT NULL,
+    radius INTEGER NOT NULL,
+    nbits INTEGER NOT NULL,
+    canonical TEXT NOT NULL,
+    PRIMARY KEY (smiles, radius, nbits));
+CREATE INDEX IF NOT EXISTS aliases_canonical
+    ON aliases (canonical, radius, nbits);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL);
+"""
+
+
+def pack_bits(bits):
+    """
+    Packs list of 0/1 values into bytes, most significant bit first
+
+    :param bits: fingerprint bits, length must be a multiple of 8
+    :return: packed bits
+    :rtype: bytes
+    """
+    return int(''.join(map(str, bits)), 2).to_bytes(len(bits) // 8, 'big')
+
+
+def unpack_bits(data, nbits):
+    """
+    Reverses :py:func:`pack_bits`
+
+    :param data: packed bits
+    :type data: bytes
+    :param nbits: number of bits packed in `data`
+    :return: fingerprint bits
+    :rtype: list
+    """
+    bitstring = bin(int.from_bytes(data, 'big'))[2:].zfill(nbits)
+    return [int(b) for b in bitstring]
+
+
+class FingerprintCache(object):
+    """
+    Size bounded cache of morgan fingerprints stored in a SQLite
+    database. Least recently used fingerprints are evicted once
+    there are more than `max_entries`. Every SMILES string seen is
+    remembered as an alias of its canonical form so repeat lookups
+    of the same string do not need RDKit at all
+    """
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES,
+                 radius=fingerprint.FINGERPRINT_RADIUS,
+                 nbits=fingerprint.FINGERPRINT_BITS):
+        """
+        Constructor
+
+        :param path: path to database file, created if needed
+        :param max_entries: maximum number of fingerprints to keep
+        :param radius: morgan fingerprint radius
+        :param nbits: number of bits in fingerprint
+        """
+        self._max_entries = max_entries
+        self._radius = radius
+        self._nbits = nbits
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30,
+                                     check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        """
+        Closes the database
+        """
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def get(self, smiles):
+        """
+        Gets fingerprint for drug computing and caching
+        it if it is not already in the cache
+
+        :param smiles: SMILES string for drug
+        :raises ValueError: if `smiles` is not cached and cannot
+                            be parsed by RDKit
+        :return: fingerprint bits
+        :rtype: list
+        """
+        with self._lock, self._conn:
+            canonical = self._lookup_alias(smiles)
+            bits = None
+            if canonical is not None:
+                bits = self._lookup(canonical)
+            if bits is None:
+                mol = fingerprint.parse_smiles(smiles)
+                canonical = fingerprint.canonical_smiles(mol)
+                bits = self._lookup(canonical)
+                self._conn.execute('INSERT OR REPLACE INTO aliases '
+                                   'VALUES (?, ?, ?, ?)',
+                                   (smiles, self._radius, self._nbits,
+                                    canonical))
+            if bits is None:
+                bits = fingerprint.mol_fingerprint(mol, radius=self._radius,
+                                                   nbits=self._nbits)
+                self._store(canonical, bits)
+                self.misses += 1
+                self._increment('misses')
+            else:
+                self.hits += 1
+                self._increment('hits')
+        return bits
+
+    def stats(self):
+        """
+        Gets hit and miss counts for this instance along with
+        totals across every user of the cache
+
+        :return: `hits`, `misses`, `total_hits`, `total_misses`
+                 and number of `entries`
+        :rtype: dict
+        """
+        with self._lock:
+            totals = dict(self._conn.execute('SELECT name, value '
+                                             'FROM counters'))
+            entries = self._conn.execute('SELECT COUNT(*) '
+                                         'FROM fingerprints').fetchone()[0]
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'total_hits': totals.get('hits', 0),
+                'total_misses': totals.get('misses', 0),
+                'entries': entries}
+
+    def packed_items(self):
+        """
+        Gets every cached fingerprint without unpacking it
+
+        :return: list of (canonical SMILES, bits packed as by
+                 :py:func:`pack_bits`)
+        :rtype: list
+        """
+        with self._lock:
+            return [(r[0], bytes(r[1])) for r in self._conn.execute(
+                'SELECT canonical, bits FROM fingerprints WHERE '
+                'radius=? AND nbits=? ORDER BY canonical',
+                (self._radius, self._nbits))]
+
+    def _lookup_alias(self, smiles):
+        """
+        Gets canonical SMILES previously recorded for `smiles`
+        """
+        row = self._conn.execute('SELECT canonical FROM aliases WHERE '
+                                 'smiles=? AND radius=? AND nbits=?',
+                                 (smiles, self._radius,
+                                  self._nbits)).fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def _lookup(self, canonical):
+        """
+        Gets fingerprint for `canonical` marking it as recently used
+        """
+        key = (canonical, self._radius, self._nbits)
+        row = self._conn.execute('SELECT bits FROM fingerprints WHERE '
+                                 'canonical=? AND radius=? AND nbits=?',
+                                 key).fetchone()
+        if row is None:
+            return None
+        self._conn.execute('UPDATE fingerprints SET last_used=? WHERE '
+                           'canonical=? AND radius=? AND nbits=?',
+                           (time.time(),) + key)
+        return unpack_bits(row[0], self._nbits)
+
+    def _store(self, canonical, bits):
+        """
+        Adds fingerprint evicting least recently used entries
+        if cache has grown past its size bound
+        """
+        self._conn.execute('INSERT OR REPLACE INTO fingerprints '
+                           'VALUES (?, ?, ?, ?, ?)',
+                           (canonical, self._radius, self._nbits,
+                            pack_bits(bits), time.time()))
+        count = self._conn.execute('SELECT COUNT(*) '
+                                   'FROM fingerprints').fetchone()[0]
+        if count <= self._max_entries:
+            return
+        evicted = self._conn.execute('SELECT rowid, canonical '
+                                     'FROM fingerprints '
+                                     'ORDER BY last_used LIMIT ?',
+                                     (count - self._max_entries,)).fetchall()
+        logger.debug('Evicting ' + str(len(evicted)) + ' fingerprints')
+        self._conn.executemany('DELETE FROM fingerprints WHERE rowid=?',
+                               [(r[0],) for r in evicted])
+        self._conn.executemany('DELETE FROM aliases WHERE canonical=? AND '
+                               'radius=? AND nbits=?',
+                               [(r[1], self._radius, self._nbits)
+                                for r in evicted])
+
+    def _increment(self, name):
+        """
+        Adds one to the persistent counter `name`
+        """
+        self._conn.execute('INSERT OR IGNORE INTO counters VALUES (?, 0)',
+                           (name,))
+        self._conn.execute('UPDATE counters SET value=value+1 '
+                           'WHERE name=?', (name,))
@@ -0,0 +1,544 @@
+# -*- coding: utf-8 -*-
+
+"""
+Assembles the DrugCell predictions and RLIPP scores into the
+JSON result. This is the library form of ``2_generate_output.py``
+"""
+
+import os
+import gzip
+import json
+import base64
+import itertools
+
+import numpy as np
+
+from drugcellfindcell import cellquery
+from drugcellfindcell import columnar
+from drugcellfindcell import ranking
+from drugcellfindcell import trace
+
+
+TOP_N = 10
+
+# verbose repeats each cell's mutations in every prediction, normalized
+# lists cells once and predictions refer to them by position
+VERBOSE_SCHEMA = 'verbose'
+NORMALIZED_SCHEMA = 'normalized'
+SCHEMAS = [VERBOSE_SCHEMA, NORMALIZED_SCHEMA]
+
+# encoding of predicted AUC arrays packed by pack_values
+PACKED_AUC_ENCODING = 'float32le-base64'
+AUC_KEYS = ['predicted_AUC', 'predicted_AUC_std']
+
+GZIP_SUFFIX = '.gz'
+
+
+def load_mapping(filename, keyind, valind, skipline=0):
+    """
+    Loads mapping from a tab delimited file
+
+    :param filename: path to tab delimited file
+    :param keyind: index of column to use as key
+    :param valind: index of column to use as value
+    :param skipline: number of header lines to skip
+    :return: key => value
+    :rtype: dict
+    """
+    mapping = {}
+    with open(filename, 'r') as fi:
+        if skipline > 0:
+            for i in range(skipline):
+                fi.readline()
+
+        for line in fi:
+            tokens = line.strip().split('\t')
+            mapping[tokens[keyind]] = tokens[valind]
+    return mapping
+
+
+def get_top_pathways(rlippfile, go2name, go2gene, top_n=TOP_N,
+                     min_rlipp=None, write_sorted=False):
+    """
+    Gets the `top_n` highest scoring RLIPP pathways and, if
+    asked, writes every score sorted to ``<rlippfile>_sorted.txt``
+
+    :param rlippfile: path to file of GO term and RLIPP score
+    :param go2name: GO term => name
+    :param go2gene: GO term => genes
+    :param top_n: number of pathways to return
+    :param min_rlipp: if set only pathways with at least this
+                      RLIPP score are returned
+    :param write_sorted: if ``True`` write the sorted file
+    :return: top pathways
+    :rtype: list
+    """
+    rlipp = ranking.RlippRanking.from_file(rlippfile)
+    if write_sorted:
+        rlipp.write_sorted(rlippfile.replace('.txt', '_sorted.txt'),
+                           go2name, go2gene)
+    ranked = rlipp.top(top_n)
+    if min_rlipp is not None:
+        ranked = [r for r in ranked if r[1] >= min_rlipp]
+    return ranking.to_pathways(ranked, go2name, go2gene)
+
+
+def _drugs_in_file(inputfile):
+    """
+    Gets SMILES on first and last line of merged predictions
+    file, which are the same if rows are grouped by drug and
+    there is only one drug. Returns (None, None) if file is empty
+    """
+    with open(inputfile, 'rb') as fi:
+        first = fi.readline()
+        if not first.strip():
+            return None, None
+        fi.seek(0, os.SEEK_END)
+        size = fi.tell()
+        block = 4096
+        while True:
+            fi.seek(max(0, size - block))
+            lines = fi.read().strip().split(b'\n')
+            if len(lines) > 1 or block >= size:
+                break
+            block *= 2
+    return (first.decode('utf-8').split('\t')[1],
+            lines[-1].decode('utf-8').split('\t')[1])
+
+
+def _prediction(tokens, cell2genes):
+    """
+    Builds prediction entry from a merged predictions file row
+    """
+    cellname = tokens[0]
+    return {'cell': cellname,
+            'predicted_AUC': float(tokens[3]),
+            'mutations': cell2genes.get(cellname, '')}
+
+
+def _first(item):
+    """
+    Gets first value of tuple
+    """
+    return item[0]
+
+
+def _text_rows(inputfile, cell2genes, top_k=None):
+    """
+    Yields (SMILES, prediction entry) for each row of
+    merged predictions file, or only the `top_k` most
+    sensitive cells of each drug
+    """
+    with open(inputfile, 'r') as fi:
+        rows = ((tokens[1], _prediction(tokens, cell2genes))
+                for tokens in (line.strip().split('\t') for line in fi))
+        if top_k is None:
+            for row in rows:
+                yield row
+            return
+        for smiles, group in itertools.groupby(rows, key=_first):
+            for p in cellquery.top_sensitive((g[1] for g in group), top_k):
+                yield smiles, p
+
+
+def _column_rows(cols, cell2genes, top_k=None):
+    """
+    Yields (SMILES, prediction entry) for each row of
+    :py:class:`~drugcellfindcell.columnar.PredictionColumns`
+    grouped by drug, or only the `top_k` most sensitive
+    cells of each drug. Entries have `predicted_AUC_std` when
+    the predictions came from an ensemble
+    """
+    mutations = [cell2genes.get(c, '') for c in cols.cells]
+    for d, rows in cols.drug_rows():
+        smiles = cols.drugs[d]
+        if top_k is not None:
+            rows = rows[np.argsort(cols.predicted[rows],
+                                   kind='stable')[:top_k]]
+        if cols.predicted_std is None:
+            for c, auc in zip(cols.cell_index[rows].tolist(),
+                              cols.predicted[rows].tolist()):
+                yield smiles, {'cell': cols.cells[c],
+                               'predicted_AUC': auc,
+                               'mutations': mutations[c]}
+            continue
+        for c, auc, std in zip(cols.cell_index[rows].tolist(),
+                               cols.predicted[rows].tolist(),
+                               cols.predicted_std[rows].tolist()):
+            yield smiles, {'cell': cols.cells[c],
+                           'predicted_AUC': auc,
+                           'predicted_AUC_std': std,
+                           'mutations': mutations[c]}
+
+
+def _read_rows(inputfile, cell2genes, top_k=None):
+    """
+    Opens merged predictions file or columnar directory
+
+    :return: (``True`` if rows are for a single drug,
+             generator of (SMILES, prediction entry))
+    :rtype: tuple
+    """
+    if columnar.is_columnar(inputfile):
+        cols = columnar.PredictionColumns(inputfile)
+        return len(cols.drugs) <= 1, _column_rows(cols, cell2genes,
+                                                  top_k=top_k)
+    firstdrug, lastdrug = _drugs_in_file(inputfile)
+    return firstdrug == lastdrug, _text_rows(inputfile, cell2genes,
+                                             top_k=top_k)
+
+
+def write_output_stream(inputfile, outputfile, top_pathways, cell2genes,
+                        compact=False, top_k=None, compress=False):
+    """
+    Writes result as JSON while reading the merged predictions
+    file so memory use does not grow with the number of rows.
+    Rows must be grouped by drug as written by
+    :py:func:`~drugcellfindcell.buildinput.build_input`
+
+    :param inputfile: path to merged predictions file or
+                      :py:mod:`~drugcellfindcell.columnar` directory
+    :param outputfile: path to write JSON to
+    :param top_pathways: top RLIPP pathways
+    :param cell2genes: cell => mutations
+    :param compact: if ``True`` write without any whitespace
+    :param top_k: if set only write the `top_k` cells with the lowest
+                  predicted AUC for each drug
+    :param compress: if ``True`` gzip compress, `outputfile` is
+                     used as is
+    :return: number of predictions written
+    :rtype: int
+    """
+    if compact:
+        sep = (',', ':')
+        nl = ''
+    else:
+        sep = (', ', ': ')
+        nl = '\n'
+    enc = json.JSONEncoder(separators=sep)
+    single, predictions = _read_rows(inputfile, cell2genes, top_k=top_k)
+
+    rows = 0
+    with _open_output(outputfile, compress=compress) as fo:
+        fo.write('{' + nl + enc.encode('top_pathways') + sep[1] +
+                 enc.encode(top_pathways) + sep[0] + nl)
+        if single:
+            fo.write(enc.encode('predictions') + sep[1] + '[')
+        else:
+            fo.write(enc.encode('drugs') + sep[1] + '[')
+
+        cursmiles = None
+        for smiles, prediction in predictions:
+            if not single and smiles != cursmiles:
+                if cursmiles is not None:
+                    fo.write(nl + ']}' + sep[0])
+                fo.write(nl + '{' + enc.encode('smiles') + sep[1] +
+                         enc.encode(smiles) + sep[0] +
+                         enc.encode('predictions') + sep[1] + '[')
+                cursmiles = smiles
+            elif rows > 0:
+                fo.write(sep[0])
+            fo.write(nl + enc.encode(prediction))
+            rows += 1
+
+        if cursmiles is not None:
+            fo.write(nl + ']}')
+        fo.write(nl + ']' + nl + '}' + nl)
+    return rows
+
+
+def pack_values(values):
+    """
+    Packs numbers as base64 of little endian float32, a quarter
+    the size of their JSON text at the cost of float32 precision
+
+    :param values: numbers
+    :rtype: str
+    """
+    return base64.b64encode(np.asarray(values, dtype='<f4').tobytes()).\
+        decode('ascii')
+
+
+def unpack_values(data):
+    """
+    Unpacks numbers packed by :py:func:`pack_values`
+
+    :param data: packed numbers
+    :rtype: list
+    """
+    return np.frombuffer(base64.b64decode(data), dtype='<f4').\
+        astype(np.float64).tolist()
+
+
+def normalize_drugs(drugs, pack=False):
+    """
+    Builds :py:const:`NORMALIZED_SCHEMA` form of predictions. Each cell
+    is listed once in `cells` with its mutations and each drug in
+    `drugs` has `smiles`, the position in `cells` of each of its
+    predictions in `cell_index` and the `predicted_AUC`, and
+    `predicted_AUC_std` for ensembles, of each in the same order
+
+    :param drugs: (SMILES, verbose prediction entries) of each drug
+    :param pack: if ``True`` AUC arrays are packed with
+                 :py:func:`pack_values` and `auc_encoding` is set
+    :return: result with `schema`, `cells` and `drugs`
+    :rtype: dict
+    """
+    cells = []
+    cellindex = {}
+    entries = []
+    for smiles, predictions in drugs:
+        entry = {'smiles': smiles, 'cell_index': []}
+        for key in AUC_KEYS:
+            if predictions and key in predictions[0]:
+                entry[key] = []
+        for p in predictions:
+            i = cellindex.get(p['cell'])
+            if i is None:
+                i = len(cells)
+                cellindex[p['cell']] = i
+                cells.append({'cell': p['cell'],
+                              'mutations': p['mutations']})
+            entry['cell_index'].append(i)
+            for key in AUC_KEYS:
+                if key in entry:
+                    entry[key].append(p[key])
+        if pack:
+            for key in AUC_KEYS:
+                if key in entry:
+                    entry[key] = pack_values(entry[key])
+        entries.append(entry)
+    res = {'schema': NORMALIZED_SCHEMA, 'cells': cells, 'drugs': entries}
+    if pack:
+        res['auc_encoding'] = PACKED_AUC_ENCODING
+    return res
+
+
+def normalize_output(result, pack=False, smiles=None):
+    """
+    Converts result from :py:func:`generate_output` to
+    :py:const:`NORMALIZED_SCHEMA` with :py:func:`normalize_drugs`,
+    other keys such as `top_pathways` are kept as is
+
+    :param result: verbose result with `predictions` or `drugs`
+    :param pack: if ``True`` pack AUC arrays
+    :param smiles: SMILES of the drug of a result with `predictions`,
+                   which does not record it
+    :rtype: dict
+    """
+    res = {k: v for k, v in result.items()
+           if k not in ('predictions', 'drugs')}
+    if 'drugs' in result:
+        drugs = [(d['smiles'], d['predictions']) for d in result['drugs']]
+    elif result.get('predictions'):
+        drugs = [(smiles, result['predictions'])]
+    else:
+        drugs = []
+    res.update(normalize_drugs(drugs, pack=pack))
+    return res
+
+
+def expand_output(result):
+    """
+    Converts :py:const:`NORMALIZED_SCHEMA` result back to the
+    verbose form :py:func:`generate_output` returns
+
+    :param result: normalized result
+    :rtype: dict
+    """
+    res = {k: v for k, v in result.items()
+           if k not in ('schema', 'cells', 'drugs', 'auc_encoding')}
+    packed = result.get('auc_encoding') == PACKED_AUC_ENCODING
+    cells = result['cells']
+    drugs = []
+    for entry in result['drugs']:
+        values = {}
+        for key in AUC_KEYS:
+            if key in entry:
+                values[key] = entry[key]
+                if packed:
+                    values[key] = unpack_values(values[key])
+        predictions = []
+        for pos, i in enumerate(entry['cell_index']):
+            p = {'cell': cells[i]['cell']}
+            for key in AUC_KEYS:
+                if key in values:
+                    p[key] = values[key][pos]
+            p['mutations'] = cells[i]['mutations']
+            predictions.append(p)
+        drugs.append({'smiles': entry['smiles'],
+                      'predictions': predictions})
+    if len(drugs) <= 1:
+        res['predictions'] = drugs[0]['predictions'] if drugs else []
+    else:
+        res['drugs'] = drugs
+    return res
+
+
+def is_streamed(result):
+    """
+    Tells if `result` came from :py:func:`generate_output` with
+    `stream` set, in which case it has the number of `rows`
+    written in place of predictions
+
+    :param result: result from :py:func:`generate_output`
+    :rtype: bool
+    """
+    return 'rows' in result and 'predictions' not in result and \
+        'drugs' not in result
+
+
+def _open_output(outputfile, compress=False):
+    """
+    Opens `outputfile` for writing text, gzip compressed
+    if `compress` is ``True``
+    """
+    if compress:
+        return gzip.open(outputfile, 'wt', encoding='utf-8')
+    return open(outputfile, 'w')
+
+
+def output_path(outputfile, compress=False):
+    """
+    Gets path output is written to, `outputfile` with
+    :py:const:`GZIP_SUFFIX` added if `compress` is ``True``
+
+    :rtype: str
+    """
+    if compress and not outputfile.endswith(GZIP_SUFFIX):
+        return outputfile + GZIP_SUFFIX
+    return outputfile
+
+
+def write_json(outputfile, result, compact=False, schema=VERBOSE_SCHEMA,
+               pack_auc=False, compress=False, smiles=None):
+    """
+    Writes result as JSON
+
+    :param outputfile: path to write to
+    :param result: result from :py:func:`generate_output`
+    :param compact: if ``True`` write without indentation
+    :param schema: one of :py:const:`SCHEMAS`
+    :param pack_auc: if ``True`` pack AUC arrays of normalized output
+    :param compress: if ``True`` gzip compress and add
+                     :py:const:`GZIP_SUFFIX` to `outputfile`
+    :param smiles: SMILES of the drug of a single drug result,
+                   only needed for normalized output
+    :raises ValueError: if `schema` is not one of :py:const:`SCHEMAS`
+    :return: path written to
+    :rtype: str
+    """
+    if schema not in SCHEMAS:
+        raise ValueError('Unknown output schema: ' + str(schema))
+    if schema == NORMALIZED_SCHEMA:
+        result = normalize_output(result, pack=pack_auc, smiles=smiles)
+    outputfile = output_path(outputfile, compress=compress)
+    with _open_output(outputfile, compress=compress) as fo:
+        if compact:
+            json.dump(result, fo, separators=(',', ':'))
+        else:
+            json.dump(result, fo, indent=4)
+    return outputfile
+
+
+def generate_output(inputfile, rlippfile, cell2genes, go2name, go2gene,
+                    outputfile=None, stream=False, compact=False,
+                    top_n=TOP_N, min_rlipp=None, write_sorted=False,
+                    tracer=None, top_k=None, schema=VERBOSE_SCHEMA,
+                    pack_auc=False, compress=False):
+    """
+    Builds the result from the merged predictions file and
+    RLIPP scores and writes it as JSON. If predictions cover
+    a single drug they are put under `predictions`, otherwise
+    they are grouped per drug under `drugs` as a list of
+    dicts with `smiles` and `predictions`
+
+    :param inputfile: path to merged predictions file with
+                      cell, SMILES, label and predicted AUC columns
+                      or :py:mod:`~drugcellfindcell.columnar` directory
+    :param rlippfile: path to file of GO term and RLIPP score
+    :param cell2genes: cell => mutations
+    :param go2name: GO term => name
+    :param go2gene: GO term => genes
+    :param outputfile: path to write JSON to, if ``None`` then
+                       `inputfile` with `.txt` replaced by `.json`,
+                       or ``output.json`` next to a columnar directory
+    :param stream: if ``True`` write predictions as they are read with
+                   :py:func:`write_output_stream` instead of building
+                   the whole result in memory
+    :param compact: if ``True`` write JSON without indentation
+    :param top_n: number of top RLIPP pathways to include
+    :param min_rlipp: if set only pathways with at least this
+                      RLIPP score are included
+    :param write_sorted: if ``True`` also write every RLIPP score
+                         sorted to ``<rlippfile>_sorted.txt``
+    :param tracer: records `rlipp`, `output_assembly` and `json_write`
+                   spans, when streaming the result is assembled while
+                   it is written so there is only a `json_write` span
+    :type tracer: :py:class:`~drugcellfindcell.trace.Tracer`
+    :param top_k: if set only include the `top_k` most sensitive cells,
+                  those with the lowest predicted AUC, for each drug
+                  sorted by predicted AUC
+    :param schema: layout of JSON written, one of :py:const:`SCHEMAS`.
+                   :py:const:`NORMALIZED_SCHEMA` output is always
+                   built in memory so `stream` only applies to
+                   :py:const:`VERBOSE_SCHEMA`
+    :param pack_auc: if ``True`` pack AUC arrays of normalized output
+                     with :py:func:`pack_values`
+    :param compress: if ``True`` gzip compress JSON and add
+                     :py:const:`GZIP_SUFFIX` to `outputfile`
+    :raises ValueError: if `schema` is not one of :py:const:`SCHEMAS`
+    :return: result with `predictions` or `drugs` and `top_pathways`.
+             When `stream` is ``True`` predictions are only written to
+             `outputfile` so just `top_pathways` and number of
+             `rows` written are returned, see :py:func:`is_streamed`
+    :rtype: dict
+    """
+    if outputfile is None and columnar.is_columnar(inputfile):
+        outputfile = os.path.join(os.path.dirname(os.path.abspath(
+            inputfile)), 'output.json')
+    elif outputfile is None:
+        outputfile = inputfile.replace('.txt', '.json')
+
+    with trace.span(tracer, 'rlipp'):
+        top_pathways = get_top_pathways(rlippfile, go2name, go2gene,
+                                        top_n=top_n, min_rlipp=min_rlipp,
+                                        write_sorted=write_sorted)
+    if schema not in SCHEMAS:
+        raise ValueError('Unknown output schema: ' + str(schema))
+    if stream and schema == VERBOSE_SCHEMA:
+        with trace.span(tracer, 'json_write', stream=True):
+            rows = write_output_stream(inputfile,
+                                       output_path(outputfile,
+                                                   compress=compress),
+                                       top_pathways, cell2genes,
+                                       compact=compact, top_k=top_k,
+                                       compress=compress)
+        return {'top_pathways': top_pathways, 'rows': rows}
+
+    with trace.span(tracer, 'output_assembly'):
+        drug2predictions = {}
+        for smiles, prediction in _read_rows(inputfile, cell2genes,
+                                             top_k=top_k)[1]:
+            if smiles not in drug2predictions:
+                drug2predictions[smiles] = []
+            drug2predictions[smiles].append(prediction)
+
+        output = {}
+        if len(drug2predictions) <= 1:
+            output['predictions'] = []
+            for preds in drug2predictions.values():
+                output['predictions'] = preds
+        else:
+            output['drugs'] = [{'smiles': smiles, 'predictions': preds}
+                               for smiles, preds in drug2predictions.items()]
+        output['top_pathways'] = top_pathways
+
+    with trace.span(tracer, 'json_write', schema=schema):
+        written = output
+        if schema == NORMALIZED_SCHEMA:
+            written = dict(normalize_drugs(drug2predictions.items(),
+                                           pack=pack_auc))
+            written['top_pathways'] = top_pathways
+        write_json(outputfile, written, compact=compact, compress=compress)
+    return output
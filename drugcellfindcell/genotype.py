@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+"""
+Cell genotypes held as compressed sparse rows of mutated gene ids,
+expanded to the dense 0/1 matrix the model takes only for the
+cells of one inference batch at a time
+"""
+
+import numpy as np
+
+from drugcellfindcell import snapshot as snapshotmod
+
+
+DENSE_FORMAT = 'dense'
+SPARSE_FORMAT = 'sparse'
+FORMATS = [SPARSE_FORMAT, DENSE_FORMAT]
+
+
+class SparseGenotype(object):
+    """
+    Mutated gene ids of each cell, row `i` is the cell with
+    id `i` in ``cell2ind.txt``
+    """
+    def __init__(self, indptr, indices, ngenes):
+        """
+        Constructor
+
+        :param indptr: int64 array, genes of row `i` are
+                       ``indices[indptr[i]:indptr[i + 1]]``
+        :param indices: gene ids
+        :param ngenes: number of genes, width of dense rows
+        """
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.ngenes = ngenes
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    @property
+    def nnz(self):
+        """
+        Number of mutations stored
+        """
+        return len(self.indices)
+
+    @property
+    def nbytes(self):
+        """
+        Bytes held by the arrays
+        """
+        return self.indptr.nbytes + self.indices.nbytes
+
+    def row(self, i):
+        """
+        Gets gene ids mutated in row `i`
+
+        :rtype: :py:class:`numpy.ndarray`
+        """
+        return self.indices[self.indptr[i]:self.indptr[i + 1]]
+
+    def dense(self, rows, dtype=np.float32):
+        """
+        Expands rows into a dense 0/1 matrix
+
+        :param rows: row of each output row, rows may repeat
+        :param dtype: type of returned matrix
+        :return: matrix with one row per entry of `rows` and
+                 :py:attr:`ngenes` columns
+        :rtype: :py:class:`numpy.ndarray`
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        starts = self.indptr[rows]
+        counts = self.indptr[rows + 1] - starts
+        res = np.zeros((len(rows), self.ngenes), dtype=dtype)
+        if counts.sum() == 0:
+            return res
+        outrows = np.repeat(np.arange(len(rows)), counts)
+        # position of each mutation in the concatenated rows
+        offsets = np.arange(counts.sum()) - np.repeat(
+            np.cumsum(counts) - counts, counts)
+        res[outrows, self.indices[np.repeat(starts, counts) + offsets]] = 1
+        return res
+
+
+def read_dense(genotypefile):
+    """
+    Reads dense ``cell2mutation.txt`` keeping only the
+    mutated genes of each row
+
+    :param genotypefile: path to file with one comma delimited
+                         row of 0/1 per cell
+    :rtype: :py:class:`SparseGenotype`
+    """
+    rows = []
+    ngenes = 0
+    one = ord('1')
+    with open(genotypefile, 'rb') as fi:
+        for line in fi:
+            line = line.rstrip()
+            if not line:
+                continue
+            values = np.frombuffer(line, dtype=np.uint8)
+            ngenes = (len(values) + 1) // 2
+            if len(values) % 2 and (values[1::2] == ord(',')).all():
+                # single character values every other byte
+                rows.append(np.flatnonzero(values[::2] == one))
+            else:
+                tokens = line.split(b',')
+                ngenes = len(tokens)
+                rows.append([i for i, t in enumerate(tokens)
+                             if float(t) != 0])
+    indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(r) for r in rows])
+    indices = np.fromiter((g for r in rows for g in r), dtype=np.int32,
+                          count=int(indptr[-1]))
+    return SparseGenotype(indptr, indices, ngenes)
+
+
+def from_snapshot(snap):
+    """
+    Gets genotype compiled into a reference snapshot from
+    ``cell2mutation.txt``, without reading the text files
+
+    :param snap: reference snapshot
+    :type snap: :py:class:`~drugcellfindcell.snapshot.ReferenceSnapshot`
+    :raises ValueError: if the snapshot was built without
+                        ``cell2mutation.txt``
+    :rtype: :py:class:`SparseGenotype`
+    """
+    if 'genotype_indptr' not in snap:
+        raise ValueError('Snapshot has no genotype')
+    return SparseGenotype(snap.array('genotype_indptr'),
+                          snap.array('genotype_indices'),
+                          int(snap.array('genotype_ngenes')[0]))
+
+
+def load_genotype(config, fmt=SPARSE_FORMAT):
+    """
+    Loads genotype of every cell
+
+    :param config: pipeline configuration
+    :type config: :py:class:`~drugcellfindcell.pipeline.PipelineConfig`
+    :param fmt: :py:const:`SPARSE_FORMAT` maps the rows compiled into
+                the reference snapshot if it is up to date, otherwise
+                it reads ``cell2mutation.txt`` as
+                :py:const:`DENSE_FORMAT` always does. Either way
+                the genotype is the one the model was trained on,
+                ``cell2mutation_list.txt`` is not used
+    :raises ValueError: if `fmt` is not one of :py:const:`FORMATS`
+    :rtype: :py:class:`SparseGenotype`
+    """
+    if fmt == DENSE_FORMAT:
+        return read_dense(config.genotypefile)
+    if fmt != SPARSE_FORMAT:
+        raise ValueError('Unknown genotype format: ' + str(fmt))
+    snap = snapshotmod.open_fresh(config.snapshotfile)
+    if snap is not None and 'genotype_indptr' in snap:
+        return from_snapshot(snap)
+    return read_dense(config.genotypefile)
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+
+"""
+Single file store of the hidden states of every ontology term, in
+place of a directory of one text file per term. Each term is one
+contiguous float32 block of shape (rows, width), optionally zlib
+compressed, located through an index at the end of the file. Only the
+index is read on open and a term's block is read when it is accessed,
+uncompressed blocks straight from a memory map
+"""
+
+import os
+import json
+import mmap
+import zlib
+import struct
+import collections.abc
+
+import numpy as np
+
+
+MAGIC = b'DCHIDN'
+VERSION = 1
+HIDDEN_STORE_FILE = 'hidden.store'
+
+# names of direct gene layer outputs are the term with this suffix
+GENE_OUTPUT_SUFFIX = ':genes'
+
+RAW_CODEC = 'raw'
+ZLIB_CODEC = 'zlib'
+
+_PREAMBLE = struct.Struct('<6sIQQ')
+_ALIGN = 64
+
+
+class HiddenStoreWriter(object):
+    """
+    Writes blocks one at a time so every term does not
+    have to be held in memory at once
+    """
+    def __init__(self, filename, compress=False, metadata=None):
+        """
+        Constructor
+
+        :param filename: path to write to, the file only appears
+                         there once :py:meth:`close` succeeds
+        :param compress: if ``True`` zlib compress each block
+        :param metadata: JSON serializable data stored in the index
+        """
+        self._filename = filename
+        self._tmpfile = filename + '.tmp'
+        self._codec = ZLIB_CODEC if compress else RAW_CODEC
+        self._metadata = metadata or {}
+        self._entries = collections.OrderedDict()
+        self._fo = open(self._tmpfile, 'wb')
+        self._fo.write(b'\0' * _ALIGN)
+
+    def add(self, name, array):
+        """
+        Appends block
+
+        :param name: name of block, usually a GO term
+        :param array: matrix with one row per cell/drug row
+        :raises ValueError: if a block of that name was already added
+        """
+        if name in self._entries:
+            raise ValueError('Duplicate block: ' + name)
+        array = np.ascontiguousarray(array, dtype=np.float32)
+        if array.ndim == 1:
+            array = array.reshape(-1, 1)
+        data = array.tobytes()
+        if self._codec == ZLIB_CODEC:
+            data = zlib.compress(data)
+        offset = self._fo.tell()
+        self._fo.write(data)
+        pad = -self._fo.tell() % _ALIGN
+        self._fo.write(b'\0' * pad)
+        self._entries[name] = {'offset': offset, 'nbytes': len(data),
+                               'shape': list(array.shape)}
+
+    def close(self):
+        """
+        Writes index and moves file into place
+        """
+        index = json.dumps({'codec': self._codec,
+                            'metadata': self._metadata,
+                            'blocks': self._entries}).encode('utf-8')
+        indexstart = self._fo.tell()
+        self._fo.write(index)
+        self._fo.seek(0)
+        self._fo.write(_PREAMBLE.pack(MAGIC, VERSION, indexstart,
+                                      len(index)))
+        self._fo.close()
+        os.replace(self._tmpfile, self._filename)
+
+    def abort(self):
+        """
+        Discards what was written
+        """
+        self._fo.close()
+        os.remove(self._tmpfile)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def write_states(filename, hidden, gene_out=None, compress=False,
+                 metadata=None):
+    """
+    Writes hidden states and direct gene layer outputs
+
+    :param filename: path to write to
+    :param hidden: term => hidden state
+    :param gene_out: term => direct gene layer output
+    :param compress: if ``True`` zlib compress each block
+    :param metadata: JSON serializable data stored in the index
+    :return: `filename`
+    :rtype: str
+    """
+    with HiddenStoreWriter(filename, compress=compress,
+                           metadata=metadata) as writer:
+        for term, value in hidden.items():
+            writer.add(term, value)
+        for term, value in (gene_out or {}).items():
+            writer.add(term + GENE_OUTPUT_SUFFIX, value)
+    return filename
+
+
+class HiddenStore(object):
+    """
+    Store written by :py:class:`HiddenStoreWriter`
+    """
+    def __init__(self, filename):
+        """
+        Constructor, reads only the index
+
+        :param filename: path to store
+        :raises ValueError: if file is not a hidden state store or
+                            was written by a different version
+        """
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            magic, version, indexstart, indexlen = _PREAMBLE.unpack(
+                f.read(_PREAMBLE.size))
+            if magic != MAGIC:
+                raise ValueError(filename + ' is not a hidden state store')
+            if version != VERSION:
+                raise ValueError(filename + ' is store version ' +
+                                 str(version) + ', expected ' +
+                                 str(VERSION))
+            f.seek(indexstart)
+            index = json.loads(f.read(indexlen).decode('utf-8'))
+        self.codec = index['codec']
+        self.metadata = index['metadata']
+        self._blocks = index['blocks']
+        self._mmap = None
+
+    def names(self):
+        """
+        Names of blocks in the order they were added
+
+        :rtype: list
+        """
+        return list(self._blocks)
+
+    def __contains__(self, name):
+        return name in self._blocks
+
+    def shape(self, name):
+        """
+        Gets shape of block without reading it
+
+        :rtype: tuple
+        """
+        return tuple(self._blocks[name]['shape'])
+
+    def read(self, name, rows=None):
+        """
+        Reads block
+
+        :param name: name of block
+        :param rows: rows to get, ``None`` for all
+        :raises KeyError: if there is no such block
+        :return: matrix, read only for uncompressed stores
+        :rtype: :py:class:`numpy.ndarray`
+        """
+        entry = self._blocks[name]
+        if self._mmap is None:
+            with open(self.filename, 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), 0,
+                                       access=mmap.ACCESS_READ)
+        if self.codec == ZLIB_CODEC:
+            data = zlib.decompress(self._mmap[entry['offset']:
+                                              entry['offset'] +
+                                              entry['nbytes']])
+            arr = np.frombuffer(data, dtype=np.float32)
+        else:
+            arr = np.frombuffer(self._mmap, dtype=np.float32,
+                                count=entry['nbytes'] // 4,
+                                offset=entry['offset'])
+        arr = arr.reshape(entry['shape'])
+        if rows is None:
+            return arr
+        return arr[rows]
+
+    def hidden(self, rows=None):
+        """
+        Gets hidden states, each read when first accessed
+
+        :param rows: rows to get, ``None`` for all
+        :return: term => hidden state
+        :rtype: :py:class:`StoreMapping`
+        """
+        return StoreMapping(self, [n for n in self._blocks
+                                   if not n.endswith(GENE_OUTPUT_SUFFIX)],
+                            rows=rows)
+
+    def gene_outputs(self, rows=None):
+        """
+        Gets direct gene layer outputs, each read when first accessed
+
+        :param rows: rows to get, ``None`` for all
+        :return: term => output
+        :rtype: :py:class:`StoreMapping`
+        """
+        return StoreMapping(self, [n for n in self._blocks
+                                   if n.endswith(GENE_OUTPUT_SUFFIX)],
+                            rows=rows, suffix=GENE_OUTPUT_SUFFIX)
+
+
+def _reopen(filename, names, rows, suffix):
+    """
+    Rebuilds a pickled :py:class:`StoreMapping`
+    """
+    return StoreMapping(HiddenStore(filename), names, rows=rows,
+                        suffix=suffix)
+
+
+class StoreMapping(collections.abc.Mapping):
+    """
+    Read only mapping of term => block, blocks are read from
+    the store on first access and kept. Pickling it pickles
+    just the store path so another process reopens the store
+    rather than getting a copy of the blocks
+    """
+    def __init__(self, store, names, rows=None, suffix=''):
+        """
+        Constructor
+
+        :param store: store to read from
+        :type store: :py:class:`HiddenStore`
+        :param names: names of blocks in store
+        :param rows: rows to get, ``None`` for all
+        :param suffix: suffix of block names not in keys
+        """
+        self._store = store
+        self._rows = rows
+        self._suffix = suffix
+        self._keys = [n[:len(n) - len(suffix)] for n in names]
+        self._keyset = frozenset(self._keys)
+        self._cache = {}
+
+    def width(self, key):
+        """
+        Gets number of columns of block without reading it
+
+        :raises KeyError: if there is no such block
+        :rtype: int
+        """
+        if key not in self._keyset:
+            raise KeyError(key)
+        return self._store.shape(key + self._suffix)[1]
+
+    def __reduce__(self):
+        return (_reopen, (self._store.filename,
+                          [k + self._suffix for k in self._keys],
+                          self._rows, self._suffix))
+
+    def __getitem__(self, key):
+        if key not in self._keyset:
+            raise KeyError(key)
+        if key not in self._cache:
+            self._cache[key] = self._store.read(key + self._suffix,
+                                                rows=self._rows)
+        return self._cache[key]
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._keyset
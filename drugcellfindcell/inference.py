@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+
+"""
+Runs the DrugCell model in this process on the CPU, scoring the rows
+written by :py:func:`~drugcellfindcell.buildinput.build_input` in
+batches of cells, and computes the RLIPP score of every term from
+the hidden states of the same pass
+"""
+
+import os
+import time
+import logging
+
+import numpy as np
+import torch
+
+from drugcellfindcell import buildinput
+from drugcellfindcell import columnar
+from drugcellfindcell import drugcellnn
+from drugcellfindcell import embedcache
+from drugcellfindcell import fingerprintio
+from drugcellfindcell import genotype as genotypemod
+from drugcellfindcell import hiddenstore
+from drugcellfindcell import pipeline
+from drugcellfindcell import rlipp
+from drugcellfindcell import snapshot as snapshotmod
+
+
+DEFAULT_BATCH_SIZE = pipeline.DEFAULT_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+def set_torch_threads(intra_threads=None, inter_threads=None):
+    """
+    Sets threads torch uses within an operation and across
+    independent operations. Torch only accepts the inter-op
+    setting before its first parallel work, later attempts
+    are logged and ignored
+
+    :param intra_threads: intra-op threads, ``None`` leaves it as is
+    :param inter_threads: inter-op threads, ``None`` leaves it as is
+    """
+    if intra_threads is not None:
+        torch.set_num_threads(intra_threads)
+    if inter_threads is not None and \
+            inter_threads != torch.get_num_interop_threads():
+        try:
+            torch.set_num_interop_threads(inter_threads)
+        except RuntimeError as e:
+            logger.warning('Unable to set inter-op threads: ' + str(e))
+
+
+def read_input(inputfiles, cell2id, cell2idfile=None):
+    """
+    Reads the rows to score from the columnar input
+
+    :param inputfiles: paths keyed by `fingerprint` and `columns`
+    :param cell2id: cell => genotype row
+    :param cell2idfile: file `cell2id` came from, for error messages
+    :raises ValueError: if a cell is not in `cell2id`
+    :return: (genotype row of each row, dense fingerprint matrix,
+             fingerprint row of each row)
+    :rtype: tuple
+    """
+    columndir = inputfiles['columns']
+    cells = columnar.read_table(os.path.join(columndir, columnar.CELLS_FILE))
+    try:
+        cell_ids = np.array([cell2id[c] for c in cells], dtype=np.int64)
+    except KeyError as e:
+        raise ValueError('Cell not in ' + str(cell2idfile) + ': ' + str(e))
+    cell_rows = cell_ids[np.load(os.path.join(columndir,
+                                              columnar.CELL_INDEX_FILE))]
+    drug_rows = np.load(os.path.join(columndir, columnar.DRUG_INDEX_FILE))
+    fingerprints = fingerprintio.load_fingerprints(inputfiles['fingerprint'],
+                                                   dtype=np.float32)
+    return cell_rows, fingerprints, drug_rows
+
+
+class InferenceEngine(object):
+    """
+    Predictor that runs the DrugCell model in this process, a drop in
+    replacement for :py:class:`~drugcellfindcell.pipeline.ScriptPredictor`.
+    After each call to :py:meth:`predict` throughput is in
+    :py:attr:`stats`. With an embedding cache the genotype branch
+    is read from the cache and only the drug branch and final
+    layers run per request
+    """
+    def __init__(self, config, batch_size=DEFAULT_BATCH_SIZE,
+                 intra_threads=None, inter_threads=None,
+                 embedding_cache=None, rlipp_workers=1, write_hidden=False,
+                 compress_hidden=False, genotype=None):
+        """
+        Constructor
+
+        :param config: pipeline configuration
+        :type config: :py:class:`~drugcellfindcell.pipeline.PipelineConfig`
+        :param batch_size: number of rows per forward pass
+        :param intra_threads: threads torch uses within an operation,
+                              if ``None`` torch's default
+        :param inter_threads: threads torch uses across operations,
+                              if ``None`` torch's default
+        :param embedding_cache: directory of
+                                :py:mod:`~drugcellfindcell.embedcache`
+                                entries, if ``None`` the genotype
+                                branch runs on every request
+        :param rlipp_workers: processes to compute RLIPP scores with
+        :param write_hidden: if ``True`` write hidden state of every
+                             term for every row to the
+                             :py:const:`~.hiddenstore.HIDDEN_STORE_FILE`
+                             in the output directory
+        :param compress_hidden: if ``True`` compress that store
+        :param genotype: genotype of every cell already in memory, if
+                         ``None`` it is read in the format set in
+                         `config` when needed
+        :type genotype: :py:class:`~drugcellfindcell.genotype.SparseGenotype`
+        """
+        if batch_size < 1:
+            raise ValueError('Batch size must be at least 1')
+        self._config = config
+        self._batch_size = batch_size
+        self._intra_threads = intra_threads
+        self._inter_threads = inter_threads
+        self._embedding_cache = embedding_cache
+        self._rlipp_workers = rlipp_workers
+        self._write_hidden = write_hidden
+        self._compress_hidden = compress_hidden
+        self.model = None
+        self.genotype = genotype
+        self.embeddings = None
+        self.cell2id = None
+        self.stats = None
+
+    def load(self):
+        """
+        Loads model and either the cell embeddings, building them if
+        needed, or the sparse genotype. Genotype rows of cells come
+        from the reference snapshot when it is up to date. Only the
+        first call does any work
+        """
+        if self.model is not None:
+            return
+        set_torch_threads(self._intra_threads, self._inter_threads)
+        self.model = drugcellnn.load_model(self._config.modelfile)
+        if self._embedding_cache is None:
+            if self.genotype is None:
+                self.genotype = self._load_genotype()
+        else:
+            self.embeddings = embedcache.load_embeddings(
+                self._embedding_cache, self._config, self.model,
+                self._load_genotype, batch_size=self._batch_size)
+        snap = snapshotmod.open_fresh(self._config.snapshotfile)
+        if snap is None:
+            self.cell2id = buildinput.load_mapping(self._config.cell2idfile)
+        else:
+            self.cell2id = snap.cell2id
+            snap.close()
+
+    def _load_genotype(self):
+        """
+        Loads genotype in the format set in configuration
+        unless it was given to the constructor
+        """
+        if self.genotype is not None:
+            return self.genotype
+        return genotypemod.load_genotype(
+            self._config, fmt=self._config.genotypeformat)
+
+    def run(self, cell_rows, fingerprints, drug_rows):
+        """
+        Runs model over rows in batches
+
+        :param cell_rows: genotype row of each input row
+        :param fingerprints: dense fingerprint matrix
+        :param drug_rows: fingerprint row of each input row
+        :return: (predicted AUC of each row, term => hidden state,
+                 term => direct gene layer output)
+        :rtype: tuple
+        """
+        if self.embeddings is not None:
+            return self._run_cached(cell_rows, fingerprints, drug_rows)
+        model = self.model
+        terms = [t for layer in model.term_layer_list for t in layer]
+        predicted = []
+        hidden = {t: [] for t in terms}
+        gene_out = {t: [] for t in model.term_direct_gene_map}
+        with torch.no_grad():
+            for start in range(0, len(cell_rows), self._batch_size):
+                end = start + self._batch_size
+                gene_input = torch.from_numpy(
+                    self.genotype.dense(cell_rows[start:end]))
+                drug_input = torch.from_numpy(
+                    fingerprints[drug_rows[start:end]])
+                # same steps as model.forward, keeping the direct
+                # gene layer outputs RLIPP needs
+                aux_out_map, term_nn_out_map, term_gene_out_map = \
+                    model.genotype_forward(gene_input)
+                drug_out = model.drug_forward(drug_input, aux_out_map,
+                                              term_nn_out_map)
+                model.final_forward(term_nn_out_map[model.root], drug_out,
+                                    aux_out_map, term_nn_out_map)
+                predicted.append(aux_out_map['final'].numpy().reshape(-1))
+                for t in terms:
+                    hidden[t].append(term_nn_out_map[t].numpy())
+                for t, out in term_gene_out_map.items():
+                    gene_out[t].append(out.numpy())
+        return (np.concatenate(predicted),
+                {t: np.concatenate(v) for t, v in hidden.items()},
+                {t: np.concatenate(v) for t, v in gene_out.items()})
+
+    def _run_cached(self, cell_rows, fingerprints, drug_rows):
+        """
+        Same as :py:meth:`run` with the genotype branch read
+        from :py:attr:`embeddings`
+        """
+        model = self.model
+        embeddings = self.embeddings
+        predicted = []
+        with torch.no_grad():
+            for start in range(0, len(cell_rows), self._batch_size):
+                end = start + self._batch_size
+                root_out = torch.from_numpy(
+                    embeddings.root_embedding(cell_rows[start:end]))
+                drug_input = torch.from_numpy(
+                    fingerprints[drug_rows[start:end]])
+                aux_out_map = {}
+                term_nn_out_map = {}
+                drug_out = model.drug_forward(drug_input, aux_out_map,
+                                              term_nn_out_map)
+                model.final_forward(root_out, drug_out, aux_out_map,
+                                    term_nn_out_map)
+                predicted.append(aux_out_map['final'].numpy().reshape(-1))
+        return (np.concatenate(predicted),
+                embeddings.hidden_states(cell_rows),
+                embeddings.gene_outputs(cell_rows))
+
+    def predict(self, inputfiles, outputdir):
+        """
+        Scores rows of the columnar input and writes predictions
+        and RLIPP scores
+
+        :param inputfiles: paths keyed by `fingerprint` and `columns`
+        :param outputdir: directory to write results to
+        :raises ValueError: if a cell is not in ``cell2ind.txt``
+        :return: (``None`` as predictions go to the columns,
+                 path to RLIPP file)
+        :rtype: tuple
+        """
+        self.load()
+        start = time.time()
+        cell_rows, fingerprints, drug_rows = read_input(
+            inputfiles, self.cell2id, self._config.cell2idfile)
+
+        predicted, hidden, gene_out = self.run(cell_rows, fingerprints,
+                                               drug_rows)
+        elapsed = time.time() - start
+
+        columnar.write_predictions(inputfiles['columns'], predicted)
+        if self._write_hidden:
+            hiddenstore.write_states(
+                os.path.join(outputdir, hiddenstore.HIDDEN_STORE_FILE),
+                hidden, gene_out, compress=self._compress_hidden,
+                metadata={'root': self.model.root,
+                          'children': self.model.term_neighbor_map})
+        rlippfile = os.path.join(outputdir, pipeline.RLIPP_FILE)
+        rlipp.write_rlipp(rlippfile, rlipp.compute_rlipp(
+            predicted, hidden, self.model.term_neighbor_map, gene_out,
+            workers=self._rlipp_workers))
+
+        self.stats = {'cells': len(predicted), 'seconds': elapsed,
+                      'cells_per_second': len(predicted) / elapsed
+                      if elapsed > 0 else float('inf')}
+        logger.info('Scored ' + str(len(predicted)) + ' cells in ' +
+                    '%.3f' % elapsed + ' seconds, ' +
+                    '%.1f' % self.stats['cells_per_second'] +
+                    ' cells/sec')
+        return None, rlippfile
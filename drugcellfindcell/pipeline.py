@@ -0,0 +1,677 @@
+# -*- coding: utf-8 -*-
+
+"""
+Runs the whole DrugCell pipeline (fingerprint, input construction,
+prediction and output assembly) inside a single Python process
+"""
+
+import os
+import sys
+import argparse
+import logging
+import contextlib
+import tempfile
+import warnings
+
+from drugcellfindcell import buildinput
+from drugcellfindcell import cellquery
+from drugcellfindcell import columnar
+from drugcellfindcell import generateoutput
+from drugcellfindcell import fpcache as fpcachemod
+from drugcellfindcell import fingerprintio
+from drugcellfindcell import genotype
+from drugcellfindcell import snapshot
+from drugcellfindcell import trace
+
+
+DEFAULT_DATADIR = '../data'
+
+# reference data of the installed service, absolute so the command
+# and a worker started from another directory agree on it
+SERVICE_DATADIR = '/opt/conda/data'
+
+DEFAULT_PREDICT_SCRIPT = '/cellar/users/jpark/Data2/DrugCell_web/' \
+                         'case3_drug/script/code/' \
+                         'predict_drugcell_rlipp_cpu.py'
+
+PREDICT_FILE = 'drugcell.predict'
+RLIPP_FILE = 'rlipp.txt'
+OUTPUT_FILE = 'output.txt'
+OUTPUT_JSON_FILE = 'output.json'
+
+SCRIPT_ENGINE = 'script'
+NATIVE_ENGINE = 'native'
+ENGINES = [SCRIPT_ENGINE, NATIVE_ENGINE]
+DEFAULT_BATCH_SIZE = 1000
+
+logger = logging.getLogger(__name__)
+
+
+class PipelineConfig(object):
+    """
+    Locations of the reference data, model and predictor
+    used by :py:func:`run_pipeline`
+    """
+    def __init__(self, datadir=DEFAULT_DATADIR,
+                 predictscript=DEFAULT_PREDICT_SCRIPT,
+                 modelfile=None, fpcachefile=None,
+                 fpcachesize=fpcachemod.DEFAULT_MAX_ENTRIES,
+                 fpformat=fingerprintio.TEXT_FORMAT,
+                 streamoutput=False, compactoutput=False,
+                 topn=generateoutput.TOP_N, minrlipp=None,
+                 writesortedrlipp=False, snapshotfile=None, cells=None,
+                 mutations=None, topk=None, engine=SCRIPT_ENGINE,
+                 batchsize=DEFAULT_BATCH_SIZE, intrathreads=None,
+                 interthreads=None, genotypeformat=genotype.SPARSE_FORMAT,
+                 embeddingcache=None, rlippworkers=1, writehidden=False,
+                 compresshidden=False, ensemble=None,
+                 outputschema=generateoutput.VERBOSE_SCHEMA, packauc=False,
+                 gzipoutput=False):
+        """
+        Constructor
+
+        :param datadir: directory containing DrugCell reference data,
+                        relative paths are resolved against the
+                        current working directory
+        :param predictscript: path to DrugCell prediction script
+        :param modelfile: path to trained model, if ``None`` then
+                          ``pretrained_model/drugcell_v1.pt`` under
+                          `datadir` is used
+        :param fpcachefile: path to fingerprint cache database,
+                            if ``None`` fingerprints are not cached
+        :param fpcachesize: maximum number of fingerprints to cache
+        :param fpformat: format of fingerprint file passed to the
+                         predictor, one of
+                         :py:const:`~drugcellfindcell.fingerprintio.FORMATS`
+        :param streamoutput: if ``True`` write ``output.json`` while
+                             reading predictions instead of building
+                             the whole result in memory
+        :param compactoutput: if ``True`` write ``output.json``
+                              without indentation
+        :param topn: number of top RLIPP pathways in result
+        :param minrlipp: if set only pathways with at least this
+                         RLIPP score are in result
+        :param writesortedrlipp: if ``True`` also write every RLIPP
+                                 score sorted to ``rlipp_sorted.txt``
+        :param snapshotfile: compiled reference data snapshot to use
+                             when it is up to date, if ``None`` then
+                             ``reference.snap`` under `datadir`
+        :param cells: if set only these cells are scored
+        :param mutations: if set only cells with at least one of
+                          these genes mutated are scored
+        :param topk: if set only the `topk` most sensitive cells of
+                     each drug are in result
+        :param engine: :py:const:`SCRIPT_ENGINE` to run `predictscript`
+                       or :py:const:`NATIVE_ENGINE` to run the model
+                       with :py:mod:`~drugcellfindcell.inference`
+        :param batchsize: rows per forward pass of native engine
+        :param intrathreads: torch intra-op threads of native engine,
+                             if ``None`` torch's default
+        :param interthreads: torch inter-op threads of native engine,
+                             if ``None`` torch's default
+        :param genotypeformat: how native engine reads the genotype,
+                               one of
+                               :py:const:`~drugcellfindcell.genotype.FORMATS`
+        :param embeddingcache: directory to cache the native engine's
+                               genotype branch output for every cell
+                               in, if ``None`` it is not cached
+        :param rlippworkers: processes the native engine computes
+                             RLIPP scores with
+        :param writehidden: if ``True`` native engine writes hidden
+                            state of every term to ``hidden.store``
+                            in the output directory
+        :param compresshidden: if ``True`` compress ``hidden.store``
+        :param ensemble: trained models the native engine scores
+                         every row with, reporting their mean and
+                         standard deviation, in place of `modelfile`.
+                         Hidden states are not written for ensembles
+        :param outputschema: layout of ``output.json``, one of
+                             :py:const:`~.generateoutput.SCHEMAS`
+        :param packauc: if ``True`` pack AUC arrays of normalized
+                        ``output.json`` as base64 float32
+        :param gzipoutput: if ``True`` write ``output.json.gz``
+                           instead of ``output.json``
+        """
+        self.datadir = os.path.abspath(datadir)
+        self.predictscript = predictscript
+        self.gene2idfile = self._datafile('gene2ind.txt')
+        self.cell2idfile = self._datafile('cell2ind.txt')
+        self.genotypefile = self._datafile('cell2mutation.txt')
+        self.cell2mutationfile = self._datafile('cell2mutation_list.txt')
+        self.ontfile = self._datafile('drugcell_ont.txt')
+        self.go2namefile = self._datafile('goterm2name.txt')
+        self.go2genefile = self._datafile('goterm2genes.txt')
+        if modelfile is None:
+            modelfile = os.path.join(self.datadir, 'pretrained_model',
+                                     'drugcell_v1.pt')
+        self.modelfile = modelfile
+        self.fpcachefile = fpcachefile
+        self.fpcachesize = fpcachesize
+        self.fpformat = fpformat
+        self.streamoutput = streamoutput
+        self.compactoutput = compactoutput
+        self.topn = topn
+        self.minrlipp = minrlipp
+        self.writesortedrlipp = writesortedrlipp
+        if snapshotfile is None:
+            snapshotfile = self._datafile(snapshot.SNAPSHOT_FILE)
+        self.snapshotfile = snapshotfile
+        self.cells = cells
+        self.mutations = mutations
+        self.topk = topk
+        self.engine = engine
+        self.batchsize = batchsize
+        self.intrathreads = intrathreads
+        self.interthreads = interthreads
+        self.genotypeformat = genotypeformat
+        self.embeddingcache = embeddingcache
+        self.rlippworkers = rlippworkers
+        self.writehidden = writehidden
+        self.compresshidden = compresshidden
+        self.ensemble = ensemble
+        self.outputschema = outputschema
+        self.packauc = packauc
+        self.gzipoutput = gzipoutput
+
+    @property
+    def modelfiles(self):
+        """
+        Models that are run, the `ensemble` if set
+        otherwise `modelfile`
+
+        :rtype: list
+        """
+        if self.ensemble:
+            return list(self.ensemble)
+        return [self.modelfile]
+
+    def engine_settings(self):
+        """
+        Gets the settings of the predictor and output files, the
+        ones a worker must share with a task it runs for it
+
+        :return: JSON serializable settings
+        :rtype: dict
+        """
+        predictscript = None
+        if self.engine == SCRIPT_ENGINE:
+            predictscript = os.path.abspath(self.predictscript)
+        embeddingcache = None
+        if self.embeddingcache is not None:
+            embeddingcache = os.path.abspath(self.embeddingcache)
+        return {'datadir': self.datadir,
+                'modelfiles': [os.path.abspath(m) for m in self.modelfiles],
+                'predictscript': predictscript,
+                'ensemble': bool(self.ensemble),
+                'engine': self.engine,
+                'batchsize': self.batchsize,
+                'intrathreads': self.intrathreads,
+                'interthreads': self.interthreads,
+                'genotypeformat': self.genotypeformat,
+                'embeddingcache': embeddingcache,
+                'rlippworkers': self.rlippworkers,
+                'writehidden': self.writehidden,
+                'compresshidden': self.compresshidden,
+                'outputschema': self.outputschema,
+                'packauc': self.packauc,
+                'gzipoutput': self.gzipoutput}
+
+    def open_fpcache(self):
+        """
+        Opens the fingerprint cache
+
+        :return: cache or ``None`` if caching is not enabled
+        :rtype: :py:class:`~drugcellfindcell.fpcache.FingerprintCache`
+        """
+        if self.fpcachefile is None:
+            return None
+        return fpcachemod.FingerprintCache(self.fpcachefile,
+                                           max_entries=self.fpcachesize)
+
+    def _datafile(self, name):
+        """
+        Gets path to file `name` in data directory
+        """
+        return os.path.join(self.datadir, name)
+
+
+class ReferenceData(object):
+    """
+    Reference data used to build inputs and assemble output,
+    loaded once so it can be reused across tasks. Data comes from
+    the compiled snapshot when it exists and is up to date,
+    otherwise from the text files
+    """
+    def __init__(self, config):
+        """
+        Constructor
+
+        :param config: pipeline configuration
+        :type config: :py:class:`PipelineConfig`
+        """
+        snap = None
+        if os.path.isfile(config.snapshotfile):
+            snap = snapshot.ReferenceSnapshot(config.snapshotfile)
+            if snap.is_stale():
+                logger.warning(config.snapshotfile + ' is older than '
+                               'reference data, reading text files')
+                snap = None
+        self.snapshot = snap
+        if snap is not None:
+            self.cells = snap.cells
+            self.go2name = snap.go2name
+            self.go2gene = snap.go2gene
+            self.cell2genes = snap.cell2genes
+            return
+
+        self.cells = buildinput.load_1col(config.cell2idfile, 1)
+        self.go2name = generateoutput.load_mapping(config.go2namefile, 0, 1)
+        self.go2gene = generateoutput.load_mapping(config.go2genefile, 0, 1)
+        self.cell2genes = generateoutput.load_mapping(
+            config.cell2mutationfile, 0, 1)
+
+
+class ScriptPredictor(object):
+    """
+    Runs the DrugCell prediction script in the current
+    interpreter instead of starting a new one
+    """
+    def __init__(self, config):
+        """
+        Constructor
+
+        :param config: pipeline configuration
+        :type config: :py:class:`PipelineConfig`
+        """
+        self._config = config
+        self._code = None
+
+    def load(self):
+        """
+        Compiles the prediction script so later calls to
+        :py:meth:`predict` only pay for running it
+        """
+        if self._code is not None:
+            return
+        with open(self._config.predictscript, 'r') as f:
+            self._code = compile(f.read(), self._config.predictscript, 'exec')
+
+    def predict(self, inputfiles, outputdir):
+        """
+        Runs prediction on files created by
+        :py:func:`~drugcellfindcell.buildinput.build_input`
+
+        :param inputfiles: paths keyed by `fingerprint`, `drug2id`
+                           and `input`
+        :param outputdir: directory to write results to
+        :return: (path to predictions file, path to RLIPP file)
+        :rtype: tuple
+        """
+        self.load()
+        rlippfile = os.path.join(outputdir, RLIPP_FILE)
+        config = self._config
+
+        # prediction script only reads text fingerprints
+        fingerprintfile = inputfiles['fingerprint']
+        if fingerprintio.get_format(fingerprintfile) != \
+                fingerprintio.TEXT_FORMAT:
+            fingerprintfile = os.path.join(outputdir,
+                                           buildinput.FINGERPRINT_FILE)
+            fingerprintio.write_fingerprints(
+                fingerprintfile,
+                fingerprintio.load_fingerprints(inputfiles['fingerprint'],
+                                                dtype=int))
+
+        argv = [config.predictscript,
+                '-gene2id', config.gene2idfile,
+                '-cell2id', config.cell2idfile,
+                '-drug2id', inputfiles['drug2id'],
+                '-genotype', config.genotypefile,
+                '-fingerprint', fingerprintfile,
+                '-result', outputdir,
+                '-predict', inputfiles['input'],
+                '-load', config.modelfile,
+                '-ont', config.ontfile,
+                '-rlipp', rlippfile]
+
+        scriptdir = os.path.dirname(os.path.abspath(config.predictscript))
+        saved_argv = sys.argv
+        saved_path = list(sys.path)
+        sys.argv = argv
+        sys.path.insert(0, scriptdir)
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                exec(self._code, {'__name__': '__main__',
+                                  '__file__': config.predictscript})
+        finally:
+            sys.argv = saved_argv
+            sys.path[:] = saved_path
+        return os.path.join(outputdir, PREDICT_FILE), rlippfile
+
+
+def create_predictor(config):
+    """
+    Creates the predictor selected by `engine` in `config`
+
+    :param config: pipeline configuration
+    :type config: :py:class:`PipelineConfig`
+    :raises ValueError: if engine is not one of :py:const:`ENGINES`
+                        or an ensemble is set for the script engine
+    :return: predictor
+    """
+    if config.ensemble:
+        if config.engine != NATIVE_ENGINE:
+            raise ValueError('Ensembles need the ' + NATIVE_ENGINE +
+                             ' engine')
+        from drugcellfindcell import ensemble
+        return ensemble.EnsemblePredictor(config)
+    if config.engine == SCRIPT_ENGINE:
+        return ScriptPredictor(config)
+    if config.engine == NATIVE_ENGINE:
+        # torch is only imported when the native engine is used
+        from drugcellfindcell import inference
+        return inference.InferenceEngine(
+            config, batch_size=config.batchsize,
+            intra_threads=config.intrathreads,
+            inter_threads=config.interthreads,
+            embedding_cache=config.embeddingcache,
+            rlipp_workers=config.rlippworkers,
+            write_hidden=config.writehidden,
+            compress_hidden=config.compresshidden)
+    raise ValueError('Unknown engine: ' + str(config.engine))
+
+
+@contextlib.contextmanager
+def opened_fpcache(config, fpcache=None):
+    """
+    Yields `fpcache` if set, otherwise opens the fingerprint cache
+    set in `config` and closes it on exit. Yields ``None`` if
+    caching is disabled
+    """
+    if fpcache is None:
+        fpcache = config.open_fpcache()
+        close = fpcache is not None
+    else:
+        close = False
+    try:
+        yield fpcache
+        if fpcache is not None:
+            logger.info('Fingerprint cache: ' + str(fpcache.stats()))
+    finally:
+        if close:
+            fpcache.close()
+
+
+def run_pipeline(smiles, config=None, outputdir=None, predictor=None,
+                 refdata=None, fpcache=None, tracer=None):
+    """
+    Scores drugs against every cell in the reference data
+    in a single prediction pass
+
+    :param smiles: SMILES string for drug or list of SMILES
+                   strings to score as one batch
+    :param config: pipeline configuration, if ``None`` defaults are used
+    :type config: :py:class:`PipelineConfig`
+    :param outputdir: directory to write intermediate files and
+                      ``output.json`` to, if ``None`` a new
+                      temporary directory is created
+    :param predictor: object with `predict(inputfiles, outputdir)`
+                      method returning the paths of its predictions
+                      and RLIPP files, the predictions path ``None``
+                      if it stored them in the columns itself. If
+                      ``None`` one is made with
+                      :py:func:`create_predictor`
+    :param refdata: already loaded reference data, if ``None`` it is
+                    loaded from files in `config`
+    :type refdata: :py:class:`ReferenceData`
+    :param fpcache: fingerprint cache, if ``None`` the cache set in
+                    `config` is opened for the duration of the call
+    :type fpcache: :py:class:`~drugcellfindcell.fpcache.FingerprintCache`
+    :param tracer: tracer to record stage timings with, if ``None`` a
+                   new one is used. The trace is written to
+                   ``trace.json`` in `outputdir`
+    :type tracer: :py:class:`~drugcellfindcell.trace.Tracer`
+    :return: result from
+             :py:func:`~drugcellfindcell.generateoutput.generate_output`
+    :rtype: dict
+    """
+    if config is None:
+        config = PipelineConfig()
+    if outputdir is None:
+        outputdir = tempfile.mkdtemp(prefix='drugcell')
+    if predictor is None:
+        predictor = create_predictor(config)
+    if tracer is None:
+        tracer = trace.Tracer()
+    if refdata is None:
+        with tracer.span('reference_data_load'):
+            refdata = ReferenceData(config)
+
+    # only selected cells are written to the input so
+    # the predictor does not score the rest of the panel
+    cells = cellquery.select_cells(refdata.cells, refdata.cell2genes,
+                                   cells=config.cells,
+                                   mutations=config.mutations)
+    # only the prediction script reads the text input
+    text_input = config.engine == SCRIPT_ENGINE
+    with opened_fpcache(config, fpcache=fpcache) as cache:
+        inputfiles = buildinput.build_input(smiles, cells,
+                                            outputdir, fpcache=cache,
+                                            fpformat=config.fpformat,
+                                            tracer=tracer,
+                                            text_input=text_input)
+
+    # predictors kept loaded by a worker return right away here
+    if hasattr(predictor, 'load'):
+        with tracer.span('model_load'):
+            predictor.load()
+    with tracer.span('inference'):
+        predictfile, rlippfile = predictor.predict(inputfiles, outputdir)
+    if predictfile is not None:
+        with tracer.span('output_assembly', columns=True):
+            columnar.write_predictions(
+                inputfiles['columns'],
+                columnar.read_predict_file(predictfile))
+        os.remove(predictfile)
+
+    res = generateoutput.generate_output(inputfiles['columns'], rlippfile,
+                                         refdata.cell2genes,
+                                         refdata.go2name, refdata.go2gene,
+                                         outputfile=os.path.join(
+                                             outputdir, OUTPUT_JSON_FILE),
+                                         stream=config.streamoutput,
+                                         compact=config.compactoutput,
+                                         top_n=config.topn,
+                                         min_rlipp=config.minrlipp,
+                                         write_sorted=config.writesortedrlipp,
+                                         tracer=tracer, top_k=config.topk,
+                                         schema=config.outputschema,
+                                         pack_auc=config.packauc,
+                                         compress=config.gzipoutput)
+    tracer.write(os.path.join(outputdir, trace.TRACE_FILE))
+    return res
+
+
+def add_engine_arguments(parser):
+    """
+    Adds arguments selecting and tuning the predictor
+
+    :param parser: parser to add arguments to
+    :type parser: :py:class:`argparse.ArgumentParser`
+    """
+    parser.add_argument('--engine', choices=ENGINES, default=SCRIPT_ENGINE,
+                        help='script runs --predictscript, native runs '
+                             'the model in this process')
+    parser.add_argument('--batchsize', type=int, default=DEFAULT_BATCH_SIZE,
+                        help='rows per forward pass of native engine')
+    parser.add_argument('--intrathreads', type=int,
+                        help='torch threads within an operation for '
+                             'native engine, default is torch\'s')
+    parser.add_argument('--interthreads', type=int,
+                        help='torch threads across operations for '
+                             'native engine, default is torch\'s')
+    parser.add_argument('--genotypeformat', choices=genotype.FORMATS,
+                        default=genotype.SPARSE_FORMAT,
+                        help='genotype source of native engine, sparse '
+                             'maps the rows compiled from '
+                             'cell2mutation.txt into the snapshot if it '
+                             'is up to date, dense always parses '
+                             'cell2mutation.txt. Either way only the '
+                             'mutated genes are kept in memory')
+    parser.add_argument('--embeddingcache',
+                        help='directory to cache the native engine\'s '
+                             'drug independent cell embeddings in, '
+                             'entries are keyed by content of the '
+                             'model and genotype files')
+    parser.add_argument('--rlippworkers', type=int, default=1,
+                        help='processes the native engine spreads '
+                             'RLIPP regressions over')
+    parser.add_argument('--writehidden', action='store_true',
+                        help='native engine writes hidden state of '
+                             'every term to hidden.store in the '
+                             'output directory')
+    parser.add_argument('--compresshidden', action='store_true',
+                        help='zlib compress blocks of hidden.store')
+    parser.add_argument('--ensemble',
+                        help='comma delimited trained DrugCell models the '
+                             'native engine runs side by side in place of '
+                             '--modelfile, each in its own process. Mean '
+                             'predicted AUC is reported with its standard '
+                             'deviation across models as '
+                             'predicted_AUC_std')
+
+
+def add_output_arguments(parser):
+    """
+    Adds arguments selecting the layout of ``output.json``
+
+    :param parser: parser to add arguments to
+    :type parser: :py:class:`argparse.ArgumentParser`
+    """
+    parser.add_argument('--schema', choices=generateoutput.SCHEMAS,
+                        default=generateoutput.VERBOSE_SCHEMA,
+                        help='verbose puts cell and mutations in every '
+                             'prediction, normalized lists each cell '
+                             'once and gives each drug arrays of cell '
+                             'positions and predicted AUC')
+    parser.add_argument('--packauc', action='store_true',
+                        help='with --schema normalized write AUC arrays '
+                             'as base64 of little endian float32')
+    parser.add_argument('--gzip', action='store_true',
+                        help='gzip compress output.json, written as '
+                             'output.json.gz, and any JSON written to '
+                             'standard out')
+
+
+def _parse_arguments(desc, args):
+    """
+    Parses command line arguments
+    :param desc:
+    :param args:
+    :return:
+    """
+    help_fm = argparse.ArgumentDefaultsHelpFormatter
+    parser = argparse.ArgumentParser(description=desc,
+                                     formatter_class=help_fm)
+    parser.add_argument('input',
+                        help='file with SMILES of drugs in first column')
+    parser.add_argument('outputdir',
+                        help='directory where results will be stored')
+    parser.add_argument('--datadir', default=DEFAULT_DATADIR,
+                        help='directory containing DrugCell reference data')
+    parser.add_argument('--predictscript', default=DEFAULT_PREDICT_SCRIPT,
+                        help='DrugCell prediction script')
+    parser.add_argument('--modelfile',
+                        help='trained DrugCell model, default is '
+                             'pretrained_model/drugcell_v1.pt under '
+                             '--datadir')
+    parser.add_argument('--fpcache',
+                        help='fingerprint cache database, if not set '
+                             'fingerprints are not cached')
+    parser.add_argument('--fpcachesize', type=int,
+                        default=fpcachemod.DEFAULT_MAX_ENTRIES,
+                        help='maximum number of fingerprints to cache')
+    parser.add_argument('--fpformat', choices=fingerprintio.FORMATS,
+                        default=fingerprintio.TEXT_FORMAT,
+                        help='format of fingerprint file given to '
+                             'predictor, npy packs bits into a file '
+                             'that can be memory mapped')
+    parser.add_argument('--stream', action='store_true',
+                        help='write predictions to output.json as they '
+                             'are read instead of building the whole '
+                             'result in memory')
+    parser.add_argument('--compact', action='store_true',
+                        help='write output.json without indentation')
+    parser.add_argument('--topn', type=int, default=generateoutput.TOP_N,
+                        help='number of top RLIPP pathways to report')
+    parser.add_argument('--minrlipp', type=float,
+                        help='only report pathways with at least this '
+                             'RLIPP score')
+    parser.add_argument('--writesortedrlipp', action='store_true',
+                        help='also write every RLIPP score sorted '
+                             'to rlipp_sorted.txt')
+    parser.add_argument('--cells',
+                        help='comma delimited cells to score, default is '
+                             'every cell in cell2ind.txt')
+    parser.add_argument('--mutations',
+                        help='comma delimited genes, only cells with at '
+                             'least one of them mutated are scored')
+    parser.add_argument('--topk', type=int,
+                        help='only report the k cells with the lowest '
+                             'predicted AUC for each drug')
+    add_output_arguments(parser)
+    add_engine_arguments(parser)
+    return parser.parse_args(args)
+
+
+def main(args):
+    """
+    Runs pipeline on drugs in input file writing
+    ``output.json`` to output directory
+
+    :param args: command line arguments usually :py:const:`sys.argv`
+    :return: 0 for success otherwise failure
+    :rtype: int
+    """
+    desc = """
+        Runs DrugCell on the drugs in input file writing
+        output.json to the output directory
+    """
+    theargs = _parse_arguments(desc, args[1:])
+    if not os.path.isdir(theargs.outputdir):
+        os.makedirs(theargs.outputdir)
+    config = PipelineConfig(datadir=theargs.datadir,
+                            predictscript=theargs.predictscript,
+                            modelfile=theargs.modelfile,
+                            fpcachefile=theargs.fpcache,
+                            fpcachesize=theargs.fpcachesize,
+                            fpformat=theargs.fpformat,
+                            streamoutput=theargs.stream,
+                            compactoutput=theargs.compact,
+                            topn=theargs.topn, minrlipp=theargs.minrlipp,
+                            writesortedrlipp=theargs.writesortedrlipp,
+                            cells=cellquery.parse_list(theargs.cells),
+                            mutations=cellquery.parse_list(
+                                theargs.mutations),
+                            topk=theargs.topk, engine=theargs.engine,
+                            batchsize=theargs.batchsize,
+                            intrathreads=theargs.intrathreads,
+                            interthreads=theargs.interthreads,
+                            genotypeformat=theargs.genotypeformat,
+                            embeddingcache=theargs.embeddingcache,
+                            rlippworkers=theargs.rlippworkers,
+                            writehidden=theargs.writehidden,
+                            compresshidden=theargs.compresshidden,
+                            ensemble=cellquery.parse_list(
+                                theargs.ensemble),
+                            outputschema=theargs.schema,
+                            packauc=theargs.packauc,
+                            gzipoutput=theargs.gzip)
+    inputdrugs = buildinput.load_1col(theargs.input, 0)
+    run_pipeline(inputdrugs, config=config, outputdir=theargs.outputdir)
+    return 0
+
+
+if __name__ == '__main__':  # pragma: no cover
+    sys.exit(main(sys.argv))
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+"""
+Ranks GO terms by RLIPP score without sorting or writing every
+score unless asked to
+"""
+
+import heapq
+
+
+def _score(item):
+    """
+    Gets score of (term, score) pair
+    """
+    return item[1]
+
+
+class RlippRanking(object):
+    """
+    RLIPP scores of GO terms. Ties keep the order
+    terms were loaded in
+    """
+    def __init__(self, scores):
+        """
+        Constructor
+
+        :param scores: GO term => RLIPP score
+        :type scores: dict
+        """
+        self._scores = scores
+
+    @classmethod
+    def from_file(cls, rlippfile):
+        """
+        Loads scores from tab delimited file of GO term and RLIPP score
+
+        :param rlippfile: path to RLIPP file
+        :return: ranking
+        :rtype: :py:class:`RlippRanking`
+        """
+        scores = {}
+        with open(rlippfile, 'r') as fi:
+            for line in fi:
+                tokens = line.strip().split('\t')
+                if len(tokens) < 2:
+                    continue
+                scores[tokens[0]] = float(tokens[1])
+        return cls(scores)
+
+    def __len__(self):
+        return len(self._scores)
+
+    def top(self, k):
+        """
+        Gets the `k` highest scoring terms using a partial
+        heap selection rather than sorting every score
+
+        :param k: number of terms
+        :return: (term, score) highest score first
+        :rtype: list
+        """
+        return heapq.nlargest(k, self._scores.items(), key=_score)
+
+    def above(self, threshold):
+        """
+        Gets terms scoring at least `threshold`
+
+        :param threshold: minimum RLIPP score
+        :return: (term, score) highest score first
+        :rtype: list
+        """
+        res = [i for i in self._scores.items() if i[1] >= threshold]
+        res.sort(key=_score, reverse=True)
+        return res
+
+    def percentile(self, q):
+        """
+        Gets score at percentile `q` using linear interpolation
+        between the two closest scores
+
+        :param q: percentile between 0 and 100
+        :raises ValueError: if there are no scores or `q` is out of range
+        :return: score
+        :rtype: float
+        """
+        if not self._scores:
+            raise ValueError('No RLIPP scores')
+        if q < 0 or q > 100:
+            raise ValueError('Percentile must be between 0 and 100: ' +
+                             str(q))
+        values = sorted(self._scores.values())
+        pos = (len(values) - 1) * q / 100.0
+        lower = int(pos)
+        upper = min(lower + 1, len(values) - 1)
+        return values[lower] + (values[upper] - values[lower]) * (pos - lower)
+
+    def above_percentile(self, q):
+        """
+        Gets terms scoring at or above percentile `q`
+
+        :param q: percentile between 0 and 100
+        :return: (term, score) highest score first
+        :rtype: list
+        """
+        return self.above(self.percentile(q))
+
+    def write_sorted(self, filename, go2name, go2gene):
+        """
+        Writes every term sorted by score with its name and genes
+
+        :param filename: path to write to
+        :param go2name: GO term => name
+        :param go2gene: GO term => genes
+        """
+        ranked = sorted(self._scores.items(), key=_score, reverse=True)
+        with open(filename, 'w') as fo:
+            for r, score in ranked:
+                fo.write("%s\t%s\t%.6f\t%s\n" % (r, go2name[r], score,
+                                                 go2gene[r]))
+
+
+def to_pathways(ranked, go2name, go2gene):
+    """
+    Converts ranked terms into pathway entries for the JSON result
+
+    :param ranked: (term, score) from :py:class:`RlippRanking`
+    :param go2name: GO term => name
+    :param go2gene: GO term => genes
+    :return: dicts with `GO_id`, `pathway_name`, `RLIPP` and
+             `pathway_genes`
+    :rtype: list
+    """
+    return [{'GO_id': r,
+             'pathway_name': go2name[r],
+             'RLIPP': "%.6f" % score,
+             'pathway_genes': go2gene[r]} for r, score in ranked]
@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+
+"""
+On disk cache of whole task results keyed by the fingerprints of the
+drugs scored and content hashes of the model and reference data
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+
+from drugcellfindcell import fingerprint as fingerprintmod
+from drugcellfindcell import fpcache
+from drugcellfindcell import generateoutput
+from drugcellfindcell import pipeline
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+DIGESTS_FILE = 'digests.json'
+RESULT_SUFFIX = '.json'
+
+
+def _write_json(filename, data):
+    """
+    Writes `data` as JSON replacing `filename` atomically
+    """
+    fd, tmpfile = tempfile.mkstemp(dir=os.path.dirname(filename),
+                                   suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as fo:
+            json.dump(data, fo)
+        os.replace(tmpfile, filename)
+    except Exception:
+        os.remove(tmpfile)
+        raise
+
+
+def config_files(config):
+    """
+    Gets the files whose content determines prediction results
+
+    :param config: pipeline configuration
+    :type config: :py:class:`~drugcellfindcell.pipeline.PipelineConfig`
+    :return: paths of models, prediction script if the script engine
+             runs it, and reference data
+    :rtype: list
+    """
+    files = list(config.modelfiles)
+    if config.engine == pipeline.SCRIPT_ENGINE:
+        files.append(config.predictscript)
+    return files + [config.gene2idfile, config.cell2idfile,
+                    config.genotypefile, config.cell2mutationfile,
+                    config.ontfile, config.go2namefile, config.go2genefile]
+
+
+class ResultCache(object):
+    """
+    Stores each task result as a JSON file in a directory. Results
+    older than `max_age` seconds are dropped and least recently used
+    results are removed once the directory holds more than `max_bytes`
+    """
+    def __init__(self, cachedir, max_bytes=DEFAULT_MAX_BYTES, max_age=None):
+        """
+        Constructor
+
+        :param cachedir: directory to store results in, created if needed
+        :param max_bytes: maximum total size of stored results,
+                          ``None`` for no limit
+        :param max_age: maximum age of a result in seconds,
+                        ``None`` for no limit
+        """
+        self._cachedir = cachedir
+        self._max_bytes = max_bytes
+        self._max_age = max_age
+        self._digests = None
+        if not os.path.isdir(cachedir):
+            os.makedirs(cachedir)
+
+    def file_digest(self, filename):
+        """
+        Gets sha256 of file content. Digests are remembered
+        in the cache directory by path, size and modification
+        time so unchanged files are only read once
+
+        :param filename: path to file
+        :return: hex digest
+        :rtype: str
+        """
+        if self._digests is None:
+            try:
+                with open(os.path.join(self._cachedir, DIGESTS_FILE)) as f:
+                    self._digests = json.load(f)
+            except (OSError, ValueError):
+                self._digests = {}
+
+        filename = os.path.abspath(filename)
+        st = os.stat(filename)
+        stamp = [st.st_size, st.st_mtime_ns]
+        entry = self._digests.get(filename)
+        if entry is not None and entry['stamp'] == stamp:
+            return entry['sha256']
+
+        sha = hashlib.sha256()
+        with open(filename, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(block)
+        self._digests[filename] = {'stamp': stamp,
+                                   'sha256': sha.hexdigest()}
+        _write_json(os.path.join(self._cachedir, DIGESTS_FILE),
+                    self._digests)
+        return sha.hexdigest()
+
+    def make_key(self, fingerprints, files, query=None):
+        """
+        Builds cache key for a task
+
+        :param fingerprints: fingerprint bits of each drug in task
+                             in the order they are scored
+        :param files: paths to model and reference data files
+        :param query: JSON serializable cell selection of task,
+                      ``None`` if every cell is reported
+        :return: hex digest
+        :rtype: str
+        """
+        sha = hashlib.sha256()
+        for f in fingerprints:
+            sha.update(fpcache.pack_bits(f))
+        sha.update(b'|')
+        for filename in files:
+            sha.update(self.file_digest(filename).encode('utf-8'))
+        if query is not None:
+            sha.update(b'|' + json.dumps(query).encode('utf-8'))
+        return sha.hexdigest()
+
+    def make_task_key(self, smiles, config, fpcache=None):
+        """
+        Builds cache key for scoring `smiles` with `config`, drugs
+        with identical fingerprints get the same key
+
+        :param smiles: SMILES string or list of SMILES strings
+        :param config: pipeline configuration
+        :type config: :py:class:`~drugcellfindcell.pipeline.PipelineConfig`
+        :param fpcache: cache to get fingerprints from, if ``None``
+                        fingerprints are computed with RDKit
+        :return: hex digest
+        :rtype: str
+        """
+        if isinstance(smiles, str):
+            smiles = [smiles]
+        if fpcache is None:
+            fingerprint = fingerprintmod.morgan_fingerprint
+        else:
+            fingerprint = fpcache.get
+        fingerprints = [fingerprint(s) for s in dict.fromkeys(smiles)]
+        query = [config.cells, config.mutations, config.topk]
+        # engines compute RLIPP differently
+        if config.engine != pipeline.SCRIPT_ENGINE:
+            query.append(config.engine)
+        # ensembles also report the spread of their predictions
+        if config.ensemble:
+            query.append('ensemble')
+        if all(q is None for q in query):
+            query = None
+        return self.make_key(fingerprints, config_files(config),
+                             query=query)
+
+    def get(self, key):
+        """
+        Gets stored result
+
+        :param key: key from :py:meth:`make_key`
+        :return: result or ``None`` if not stored or expired
+        :rtype: dict
+        """
+        filename = self._result_file(key)
+        try:
+            st = os.stat(filename)
+        except OSError:
+            return None
+        if self._max_age is not None and \
+                time.time() - st.st_mtime > self._max_age:
+            self._remove(filename)
+            return None
+        try:
+            with open(filename, 'r') as f:
+                res = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        # access time marks entry as recently used
+        os.utime(filename, (time.time(), st.st_mtime))
+        return res
+
+    def put(self, key, result):
+        """
+        Stores result and evicts old entries
+
+        :param key: key from :py:meth:`make_key`
+        :param result: result from
+                       :py:func:`~drugcellfindcell.pipeline.run_pipeline`
+        :type result: dict
+        :raises ValueError: if `result` was streamed, so has
+                            no predictions to store
+        """
+        if generateoutput.is_streamed(result):
+            raise ValueError('Streamed results cannot be cached')
+        _write_json(self._result_file(key), result)
+        self.evict()
+
+    def evict(self):
+        """
+        Removes expired results then least recently used results
+        until cache is within its size bound
+
+        :return: number of results removed
+        :rtype: int
+        """
+        now = time.time()
+        entries = []
+        removed = 0
+        for name in os.listdir(self._cachedir):
+            if not name.endswith(RESULT_SUFFIX) or name == DIGESTS_FILE:
+                continue
+            filename = os.path.join(self._cachedir, name)
+            try:
+                st = os.stat(filename)
+            except OSError:
+                continue
+            if self._max_age is not None and \
+                    now - st.st_mtime > self._max_age:
+                removed += self._remove(filename)
+                continue
+            entries.append((max(st.st_atime, st.st_mtime), st.st_size,
+                            filename))
+
+        if self._max_bytes is not None:
+            total = sum(e[1] for e in entries)
+            entries.sort()
+            while entries and total > self._max_bytes:
+                lastused, size, filename = entries.pop(0)
+                total -= size
+                removed += self._remove(filename)
+        if removed > 0:
+            logger.debug('Evicted ' + str(removed) + ' results')
+        return removed
+
+    def _result_file(self, key):
+        """
+        Gets path of file storing result for `key`
+        """
+        return os.path.join(self._cachedir, key + RESULT_SUFFIX)
+
+    def _remove(self, filename):
+        """
+        Removes `filename` ignoring errors, returns 1 if
+        removed otherwise 0
+        """
+        try:
+            os.remove(filename)
+            return 1
+        except OSError:
+            return 0
@@ -0,0 +1,377 @@
+# -*- coding: utf-8 -*-
+
+"""
+Relative local improvement in predictive power (RLIPP) of every
+ontology term: how much better a term's hidden state predicts the drug
+response than the inputs it was computed from. The ridge regressions
+behind it are solved in closed form for many terms at once, terms
+with equal input width stacked into one batched solve, and groups of
+terms can be spread over a pool of processes. Pool workers are not
+forked from the caller, which may have torch threads running, and
+read hidden states from shared memory or the hidden state store
+"""
+
+import os
+import sys
+import argparse
+import multiprocessing
+import concurrent.futures
+
+import numpy as np
+
+from drugcellfindcell import hiddenstore
+from drugcellfindcell import sharedmem
+
+
+RIDGE_ALPHA = 1.0
+
+# upper bound on floats in one stacked solve
+MAX_BLOCK_VALUES = 1 << 24
+
+# inputs of the current computation, set in each pool worker
+_shared = None
+
+# shared memory blocks backing _shared in a pool worker
+_blocks = []
+
+
+def rank_rows(values):
+    """
+    Ranks each row from 1, ties get their average rank
+
+    :param values: matrix ranked along its last axis
+    :rtype: :py:class:`numpy.ndarray`
+    """
+    values = np.atleast_2d(values)
+    rows, n = values.shape
+    order = np.argsort(values, axis=1, kind='stable')
+    ordered = np.take_along_axis(values, order, axis=1)
+    pos = np.broadcast_to(np.arange(n), (rows, n))
+    # first and last sorted position of the tie group of each value
+    new = np.ones((rows, n), dtype=bool)
+    new[:, 1:] = ordered[:, 1:] != ordered[:, :-1]
+    first = np.maximum.accumulate(np.where(new, pos, 0), axis=1)
+    last_new = np.ones((rows, n), dtype=bool)
+    last_new[:, :-1] = new[:, 1:]
+    last = np.minimum.accumulate(
+        np.where(last_new, pos, n - 1)[:, ::-1], axis=1)[:, ::-1]
+    ranks = np.empty((rows, n), dtype=np.float64)
+    np.put_along_axis(ranks, order, (first + last) / 2.0 + 1, axis=1)
+    return ranks
+
+
+def spearman_rows(values, target_ranks):
+    """
+    Spearman correlation of each row of `values` with a target
+
+    :param values: matrix with one row per variable
+    :param target_ranks: ranks of target from :py:func:`rank_rows`
+    :return: correlation of each row, 0 where a row is constant
+    :rtype: :py:class:`numpy.ndarray`
+    """
+    ranks = rank_rows(values)
+    ranks -= ranks.mean(axis=1, keepdims=True)
+    target = target_ranks.reshape(-1) - target_ranks.mean()
+    denom = np.sqrt((ranks * ranks).sum(axis=1) * np.dot(target, target))
+    num = np.dot(ranks, target)
+    res = np.zeros(len(num))
+    ok = denom > 0
+    res[ok] = num[ok] / denom[ok]
+    return res
+
+
+def spearman(x, y):
+    """
+    Spearman rank correlation of two vectors
+
+    :return: correlation, 0 if either input is constant
+    :rtype: float
+    """
+    return float(spearman_rows(np.asarray(x, dtype=np.float64),
+                               rank_rows(np.asarray(y,
+                                                    dtype=np.float64)))[0])
+
+
+def ridge_fit_predict(features, target, alpha=RIDGE_ALPHA):
+    """
+    Fits ridge regression with intercept to each stack of features
+    and predicts its training rows
+
+    :param features: array (samples, width) or stack of them
+                     (models, samples, width)
+    :param target: value of each sample
+    :param alpha: regularization strength
+    :return: predictions, (samples,) or (models, samples)
+    :rtype: :py:class:`numpy.ndarray`
+    """
+    features = np.asarray(features, dtype=np.float64)
+    single = features.ndim == 2
+    if single:
+        features = features[np.newaxis]
+    centered = features - features.mean(axis=1, keepdims=True)
+    target = np.asarray(target, dtype=np.float64)
+    tmean = target.mean()
+    # batched matmul runs each stack through BLAS
+    transposed = centered.transpose(0, 2, 1)
+    gram = np.matmul(transposed, centered)
+    idx = np.arange(gram.shape[1])
+    gram[:, idx, idx] += alpha
+    rhs = np.matmul(transposed, target - tmean)
+    weights = np.linalg.solve(gram, rhs[:, :, np.newaxis])
+    res = np.matmul(centered, weights)[:, :, 0] + tmean
+    if single:
+        return res[0]
+    return res
+
+
+def _child_features(term, hidden, term_children, gene_out):
+    """
+    Gets inputs `term` was computed from side by side
+    """
+    parts = [hidden[c] for c in term_children.get(term, [])]
+    if term in gene_out:
+        parts.append(gene_out[term])
+    return np.concatenate(parts, axis=1)
+
+
+def _group_terms(terms, widths, samples):
+    """
+    Splits terms into groups of equal (hidden, input) widths
+    small enough to stack in one solve
+    """
+    bywidth = {}
+    for t in terms:
+        bywidth.setdefault(widths[t], []).append(t)
+    groups = []
+    for width, members in bywidth.items():
+        size = max(1, MAX_BLOCK_VALUES // (sum(width) * samples))
+        for start in range(0, len(members), size):
+            groups.append(members[start:start + size])
+    return groups
+
+
+def _group_corr(features, target, target_ranks, alpha):
+    """
+    Spearman correlation of the ridge predictions of
+    each stacked feature matrix
+    """
+    return spearman_rows(ridge_fit_predict(features, target, alpha=alpha),
+                         target_ranks)
+
+
+def _score_group(terms):
+    """
+    Scores terms with the inputs in :py:data:`_shared`
+    """
+    predicted, target_ranks, hidden, term_children, gene_out, alpha = \
+        _shared
+    parent_corr = _group_corr(np.stack([hidden[t] for t in terms]),
+                              predicted, target_ranks, alpha)
+    child_corr = _group_corr(
+        np.stack([_child_features(t, hidden, term_children, gene_out)
+                  for t in terms]), predicted, target_ranks, alpha)
+    res = np.zeros(len(terms))
+    ok = child_corr != 0
+    res[ok] = (parent_corr[ok] - child_corr[ok]) / child_corr[ok]
+    return dict(zip(terms, res.tolist()))
+
+
+def _width(mapping, term):
+    """
+    Gets number of columns of the matrix of `term`, without
+    reading it if `mapping` is backed by a hidden state store
+    """
+    if isinstance(mapping, hiddenstore.StoreMapping):
+        return mapping.width(term)
+    return mapping[term].shape[1]
+
+
+def _pool_context():
+    """
+    Gets start method of pool workers, forkserver where the
+    platform has it so workers fork from a process that never
+    loaded torch, otherwise spawn
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context('spawn')
+
+
+def _export(mapping, blocks):
+    """
+    Gets picklable stand in for term => matrix mapping. Store
+    backed mappings pickle as the path of their store, other
+    matrices are copied to shared memory once, the blocks are
+    appended to `blocks`
+    """
+    if isinstance(mapping, hiddenstore.StoreMapping):
+        return mapping
+    specs = {}
+    for term, value in mapping.items():
+        block, specs[term] = sharedmem.share_array(value)
+        blocks.append(block)
+    return specs
+
+
+def _import(exported):
+    """
+    Gets mapping passed through :py:func:`_export`
+    """
+    if isinstance(exported, hiddenstore.StoreMapping):
+        return exported
+    res = {}
+    for term, spec in exported.items():
+        block, res[term] = sharedmem.attach_array(spec)
+        _blocks.append(block)
+    return res
+
+
+def _init_worker(predicted, target_ranks, hidden, term_children,
+                 gene_out, alpha):
+    """
+    Sets :py:data:`_shared` in a pool worker
+    """
+    global _shared
+    _shared = (predicted, target_ranks, _import(hidden), term_children,
+               _import(gene_out), alpha)
+
+
+def compute_rlipp(predicted, hidden, term_children, gene_out,
+                  alpha=RIDGE_ALPHA, workers=1):
+    """
+    Computes RLIPP score of every term
+
+    :param predicted: predicted AUC of each row
+    :param hidden: term => hidden state of each row
+    :param term_children: term => child terms
+    :param gene_out: term => direct gene layer output of each row,
+                     only terms with directly annotated genes
+    :param alpha: ridge regularization strength
+    :param workers: processes to spread groups of terms over, 1 runs
+                    in this process. Workers read the inputs from
+                    shared memory, or from the store of mappings
+                    from :py:mod:`~drugcellfindcell.hiddenstore`,
+                    rather than getting copies
+    :return: term => score, in order of `hidden`
+    :rtype: dict
+    """
+    global _shared
+    predicted = np.asarray(predicted, dtype=np.float64).reshape(-1)
+    terms = list(hidden)
+    # widths come from the store index so no term is read early
+    inputs = {t: sum(_width(hidden, c) for c in term_children.get(t, []))
+              for t in terms}
+    for t in gene_out:
+        inputs[t] += _width(gene_out, t)
+    # a term without inputs has nothing to improve on
+    scores = {t: 0.0 for t in terms if inputs[t] == 0}
+    groups = _group_terms([t for t in terms if inputs[t] > 0],
+                          {t: (_width(hidden, t), inputs[t])
+                           for t in terms}, len(predicted))
+    target_ranks = rank_rows(predicted)
+    if workers > 1 and len(groups) > 1:
+        blocks = []
+        try:
+            initargs = (predicted, target_ranks, _export(hidden, blocks),
+                        term_children, _export(gene_out, blocks), alpha)
+            with concurrent.futures.ProcessPoolExecutor(
+                    max_workers=min(workers, len(groups)),
+                    mp_context=_pool_context(), initializer=_init_worker,
+                    initargs=initargs) as pool:
+                for res in pool.map(_score_group, groups):
+                    scores.update(res)
+        finally:
+            sharedmem.release(blocks, unlink=True)
+        return {t: scores[t] for t in terms}
+
+    _shared = (predicted, target_ranks, hidden, term_children, gene_out,
+               alpha)
+    try:
+        for group in groups:
+            scores.update(_score_group(group))
+    finally:
+        _shared = None
+    return {t: scores[t] for t in terms}
+
+
+def write_rlipp(rlippfile, scores):
+    """
+    Writes ``term\\tscore`` line for each term, the RLIPP
+    file read by :py:mod:`~drugcellfindcell.generateoutput`
+
+    :param rlippfile: path to write to
+    :param scores: term => score
+    """
+    with open(rlippfile, 'w') as fo:
+        for term, score in scores.items():
+            fo.write('%s\t%f\n' % (term, score))
+
+
+def rlipp_from_store(store, predicted, alpha=RIDGE_ALPHA, workers=1):
+    """
+    Computes RLIPP score of every term in a hidden state store
+    written with the ontology in its `children` metadata, reading
+    each term only when it is needed
+
+    :param store: hidden state store
+    :type store: :py:class:`~drugcellfindcell.hiddenstore.HiddenStore`
+    :param predicted: predicted AUC of each row of the store
+    :param alpha: ridge regularization strength
+    :param workers: processes to spread groups of terms over
+    :return: term => score
+    :rtype: dict
+    """
+    return compute_rlipp(predicted, store.hidden(),
+                         store.metadata['children'], store.gene_outputs(),
+                         alpha=alpha, workers=workers)
+
+
+def _parse_arguments(desc, args):
+    """
+    Parses command line arguments
+    :param desc:
+    :param args:
+    :return:
+    """
+    help_fm = argparse.ArgumentDefaultsHelpFormatter
+    parser = argparse.ArgumentParser(description=desc,
+                                     formatter_class=help_fm)
+    parser.add_argument('hiddenstore',
+                        help='hidden.store written with --writehidden')
+    parser.add_argument('predictions',
+                        help='drugcell.predict file or columns directory '
+                             'with the predictions of the same rows')
+    parser.add_argument('output', help='RLIPP file to write')
+    parser.add_argument('--alpha', type=float, default=RIDGE_ALPHA,
+                        help='ridge regularization strength')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='processes to spread regressions over')
+    return parser.parse_args(args)
+
+
+def main(args):
+    """
+    Computes RLIPP scores from a hidden state store
+
+    :param args: command line arguments usually :py:const:`sys.argv`
+    :return: 0 for success otherwise failure
+    :rtype: int
+    """
+    from drugcellfindcell import columnar
+    desc = """
+        Computes the RLIPP score of every term from the hidden
+        states in hiddenstore and writes term<tab>score lines
+    """
+    theargs = _parse_arguments(desc, args[1:])
+    if os.path.isdir(theargs.predictions):
+        predicted = columnar.PredictionColumns(theargs.predictions).predicted
+    else:
+        predicted = columnar.read_predict_file(theargs.predictions)
+    write_rlipp(theargs.output, rlipp_from_store(
+        hiddenstore.HiddenStore(theargs.hiddenstore), predicted,
+        alpha=theargs.alpha, workers=theargs.workers))
+    return 0
+
+
+if __name__ == '__main__':  # pragma: no cover
+    sys.exit(main(sys.argv))
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+
+"""
+Coalesces tasks that arrive close together into one batch so their
+drugs are scored in a single prediction pass, then splits the batch
+result back into one result per task
+"""
+
+import os
+import json
+import time
+import threading
+
+from drugcellfindcell import generateoutput
+
+
+DEFAULT_MAX_WAIT = 0.2
+DEFAULT_MAX_BATCH = 8
+
+# task keys that change which cells are scored or reported,
+# only tasks agreeing on all of them can share a batch
+QUERY_KEYS = ('cells', 'mutations', 'topk')
+
+
+def task_smiles(task):
+    """
+    Gets SMILES of task without duplicates
+
+    :param task: task with `smiles` set to a SMILES string or list
+    :rtype: list
+    """
+    smiles = task['smiles']
+    if isinstance(smiles, str):
+        smiles = [smiles]
+    return list(dict.fromkeys(smiles))
+
+
+def merge_tasks(tasks):
+    """
+    Gets SMILES to score for a batch of tasks, each drug once
+    in the order it first appears
+
+    :param tasks: tasks in batch
+    :rtype: list
+    """
+    smiles = []
+    for task in tasks:
+        smiles.extend(task_smiles(task))
+    return list(dict.fromkeys(smiles))
+
+
+def group_by_query(tasks):
+    """
+    Groups tasks that can be scored in the same pass
+
+    :param tasks: tasks in batch
+    :return: lists of positions in `tasks`, in order of first task
+    :rtype: list
+    """
+    groups = {}
+    for i, task in enumerate(tasks):
+        key = json.dumps([task.get(k) for k in QUERY_KEYS])
+        groups.setdefault(key, []).append(i)
+    return list(groups.values())
+
+
+def split_result(result, tasks):
+    """
+    Splits result of scoring :py:func:`merge_tasks` into the result
+    each task would have had on its own. Top pathways are ranked over
+    every row of the batch rather than each task's rows, so only a
+    batch that reports none can be split
+
+    :param result: result from
+                   :py:func:`~drugcellfindcell.generateoutput.generate_output`
+                   built in memory
+    :param tasks: tasks in batch
+    :raises ValueError: if `result` was streamed or has top pathways
+    :return: result for each task in the same order as `tasks`,
+             with `taskId` set if the task has one
+    :rtype: list
+    """
+    if generateoutput.is_streamed(result):
+        raise ValueError('Streamed result has no predictions to split')
+    if result['top_pathways']:
+        raise ValueError('Top pathways of a batch cannot be split '
+                         'between its tasks')
+    if 'predictions' in result:
+        predictions = {s: result['predictions']
+                       for s in merge_tasks(tasks)}
+    else:
+        predictions = {d['smiles']: d['predictions']
+                       for d in result['drugs']}
+
+    res = []
+    for task in tasks:
+        smiles = task_smiles(task)
+        out = {}
+        if 'taskId' in task:
+            out['taskId'] = task['taskId']
+        if len(smiles) == 1:
+            out['predictions'] = predictions[smiles[0]]
+        else:
+            out['drugs'] = [{'smiles': s, 'predictions': predictions[s]}
+                            for s in smiles]
+        out['top_pathways'] = result['top_pathways']
+        res.append(out)
+    return res
+
+
+def write_task_output(outputdir, result, compact=False,
+                      schema=generateoutput.VERBOSE_SCHEMA, pack_auc=False,
+                      compress=False, smiles=None):
+    """
+    Writes ``output.json`` of a task split from a batch
+
+    :param outputdir: directory of task, created if needed
+    :param result: result for task from :py:func:`split_result`
+    :param compact: if ``True`` write JSON without indentation
+    :param schema: layout of JSON, see
+                   :py:func:`~drugcellfindcell.generateoutput.write_json`
+    :param pack_auc: if ``True`` pack AUC arrays of normalized JSON
+    :param compress: if ``True`` write gzip compressed ``output.json.gz``
+    :param smiles: SMILES of the drug of a single drug task
+    """
+    if not os.path.isdir(outputdir):
+        os.makedirs(outputdir)
+    generateoutput.write_json(os.path.join(outputdir, 'output.json'),
+                              result, compact=compact, schema=schema,
+                              pack_auc=pack_auc, compress=compress,
+                              smiles=smiles)
+
+
+class _Request(object):
+    """
+    Task waiting in a batch
+    """
+    def __init__(self, task):
+        self.task = task
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class RequestCoalescer(object):
+    """
+    Groups tasks submitted from different threads into batches. The
+    first task of a batch waits up to `max_wait` seconds for more
+    tasks, or until `max_batch` have arrived, then runs the batch on
+    its thread while the others wait for their share of the result
+    """
+    def __init__(self, run_batch, max_wait=DEFAULT_MAX_WAIT,
+                 max_batch=DEFAULT_MAX_BATCH):
+        """
+        Constructor
+
+        :param run_batch: callable taking list of tasks and returning
+                          list of results in the same order, an
+                          exception in place of a result is raised
+                          to the task's caller
+        :param max_wait: seconds to hold a batch open
+        :param max_batch: maximum number of tasks in a batch
+        """
+        self._run_batch = run_batch
+        self._max_wait = max_wait
+        self._max_batch = max_batch
+        self._cond = threading.Condition()
+        self._open = None
+
+    def submit(self, task):
+        """
+        Adds task to the open batch, or opens a new one, and
+        waits for its result
+
+        :param task: task to run
+        :type task: dict
+        :return: result of task
+        """
+        req = _Request(task)
+        with self._cond:
+            batch = self._open
+            if batch is None:
+                batch = self._open = [req]
+            else:
+                batch.append(req)
+            if len(batch) >= self._max_batch:
+                self._open = None
+                self._cond.notify_all()
+            if batch[0] is not req:
+                leader = False
+            else:
+                leader = True
+                deadline = time.monotonic() + self._max_wait
+                while self._open is batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._open = None
+                        break
+                    self._cond.wait(remaining)
+
+        if leader:
+            self._run(batch)
+        req.done.wait()
+        if req.error is not None:
+            raise req.error
+        return req.result
+
+    def _run(self, batch):
+        """
+        Runs batch and hands each task its result
+        """
+        try:
+            results = self._run_batch([r.task for r in batch])
+        except Exception as e:
+            results = [e] * len(batch)
+        for req, res in zip(batch, results):
+            if isinstance(res, Exception):
+                req.error = res
+            else:
+                req.result = res
+            req.done.set()
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+"""
+Numpy arrays in :py:mod:`multiprocessing.shared_memory` blocks, so
+worker processes started without fork can read the inputs of their
+parent without each getting a copy
+"""
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+def share_array(array):
+    """
+    Copies array into a new shared memory block
+
+    :param array: array to share
+    :return: (block, spec to pass to :py:func:`attach_array`), the
+             caller must close and unlink the block when done
+    :rtype: tuple
+    """
+    array = np.ascontiguousarray(array)
+    block = shared_memory.SharedMemory(create=True,
+                                       size=max(1, array.nbytes))
+    view = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+    view[...] = array
+    return block, (block.name, array.shape, array.dtype.str)
+
+
+def attach_array(spec):
+    """
+    Maps array shared by :py:func:`share_array` without copying
+
+    :param spec: spec from :py:func:`share_array`
+    :return: (block, array backed by it), the array must be
+             dropped before the block is closed
+    :rtype: tuple
+    """
+    name, shape, dtype = spec
+    block = shared_memory.SharedMemory(name=name)
+    return block, np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+
+
+def release(blocks, unlink=False):
+    """
+    Closes shared memory blocks, unlinking them if this
+    process created them
+
+    :param blocks: blocks to close
+    :param unlink: if ``True`` also free the memory
+    """
+    for block in blocks:
+        block.close()
+        if unlink:
+            block.unlink()
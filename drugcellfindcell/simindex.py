@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+
+"""
+Nearest neighbour search over morgan fingerprints by Tanimoto
+similarity. Fingerprints are packed into 64 bit words so a query is
+an AND and a popcount over the whole library at once, and large
+libraries can be split into shards searched by a pool of threads,
+numpy releasing the GIL while it scans each shard
+"""
+
+import sys
+import argparse
+import concurrent.futures
+
+import numpy as np
+
+from drugcellfindcell import buildinput
+from drugcellfindcell import fingerprint as fingerprintmod
+from drugcellfindcell import fpcache as fpcachemod
+
+
+DEFAULT_TOP_K = 5
+
+# libraries smaller than this are not worth sharding
+MIN_SHARD_ROWS = 100000
+
+_BYTE_COUNTS = np.array([bin(i).count('1') for i in range(256)],
+                        dtype=np.uint8)
+
+
+def popcount(words):
+    """
+    Counts set bits of each row of packed words
+
+    :param words: uint64 matrix
+    :return: count for each row
+    :rtype: :py:class:`numpy.ndarray`
+    """
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+    # numpy before 2.0 has no popcount, count bytes by table
+    return _BYTE_COUNTS[words.view(np.uint8)].sum(axis=-1, dtype=np.int64)
+
+
+def pack_words(fingerprints):
+    """
+    Packs fingerprint bits into 64 bit words
+
+    :param fingerprints: 0/1 matrix with one row per drug, number
+                         of bits must be a multiple of 64
+    :return: uint64 matrix with one row per drug
+    :rtype: :py:class:`numpy.ndarray`
+    """
+    bits = np.asarray(fingerprints, dtype=np.uint8)
+    if bits.ndim == 1:
+        bits = bits.reshape(1, -1)
+    return bytes_to_words(np.packbits(bits, axis=1))
+
+
+def bytes_to_words(packed):
+    """
+    Reinterprets bytes packed 8 bits each as 64 bit words
+
+    :param packed: uint8 matrix, bytes per row a multiple of 8
+    :rtype: :py:class:`numpy.ndarray`
+    """
+    packed = np.ascontiguousarray(packed, dtype=np.uint8)
+    if packed.shape[1] % 8:
+        raise ValueError('Fingerprint bits must be a multiple of 64')
+    return packed.view(np.uint64)
+
+
+def _top_k(words, counts, query, query_count, k, offset=0):
+    """
+    Gets the `k` rows most similar to `query`
+
+    :return: (row indices, similarities) best first
+    """
+    common = popcount(np.bitwise_and(words, query))
+    union = counts + query_count - common
+    sims = np.divide(common, union, out=np.zeros(len(common)),
+                     where=union > 0)
+    k = min(k, len(sims))
+    if k == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0)
+    best = np.argpartition(-sims, k - 1)[:k]
+    # ties are broken by row so results do not depend on sharding
+    best = best[np.lexsort((best, -sims[best]))]
+    return best + offset, sims[best]
+
+
+class TanimotoIndex(object):
+    """
+    Fingerprints of known drugs searchable by Tanimoto similarity.
+    Sharded queries share one thread pool that lives until
+    :py:meth:`close`
+    """
+    def __init__(self, keys=None, words=None,
+                 nbits=fingerprintmod.FINGERPRINT_BITS):
+        """
+        Constructor
+
+        :param keys: SMILES of each row
+        :param words: packed fingerprints from :py:func:`pack_words`
+        :param nbits: fingerprint length, only used if `words` is
+                      ``None``
+        """
+        self.keys = list(keys or [])
+        if words is None:
+            words = np.zeros((0, nbits // 64), dtype=np.uint64)
+        self.words = np.asarray(words, dtype=np.uint64)
+        if len(self.keys) != len(self.words):
+            raise ValueError('Got ' + str(len(self.keys)) + ' keys for ' +
+                             str(len(self.words)) + ' fingerprints')
+        self.counts = popcount(self.words)
+        self._pool = None
+        self._pool_size = 0
+
+    def __len__(self):
+        return len(self.keys)
+
+    def close(self):
+        """
+        Stops the threads of sharded queries
+        """
+        if self._pool is not None:
+            self._pool.shutdown()
+        self._pool = None
+        self._pool_size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _get_pool(self, workers):
+        """
+        Gets pool of at least `workers` threads, started on first use
+        """
+        if self._pool_size < workers:
+            self.close()
+            self._pool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=workers)
+            self._pool_size = workers
+        return self._pool
+
+    def add(self, keys, fingerprints):
+        """
+        Adds drugs to index
+
+        :param keys: SMILES of each drug
+        :param fingerprints: fingerprint bits of each drug
+        :raises ValueError: if fingerprints are not the length of
+                            those already in the index
+        """
+        words = pack_words(fingerprints)
+        if len(self) and words.shape[1] != self.words.shape[1]:
+            raise ValueError('Fingerprints of ' + str(words.shape[1] * 64) +
+                             ' bits added to index of ' +
+                             str(self.words.shape[1] * 64) + ' bits')
+        if not len(self):
+            self.words = self.words.reshape(0, words.shape[1])
+        self.keys.extend(keys)
+        self.words = np.concatenate((self.words, words))
+        self.counts = np.concatenate((self.counts, popcount(words)))
+
+    def query(self, fingerprint, k=DEFAULT_TOP_K, workers=1, exclude=None):
+        """
+        Gets the drugs most similar to `fingerprint`
+
+        :param fingerprint: fingerprint bits
+        :param k: number of neighbours
+        :param workers: threads to split the index between, only
+                        used for libraries of at least
+                        :py:const:`MIN_SHARD_ROWS` drugs
+        :param exclude: SMILES of drugs to leave out of the result
+        :return: list of (SMILES, Tanimoto similarity) best first,
+                 ties in the order drugs were added
+        :rtype: list
+        """
+        if not len(self):
+            return []
+        exclude = set(exclude or [])
+        # excluded drugs may take some of the top places
+        want = k
+        k += len(exclude)
+        query = pack_words(fingerprint)[0]
+        query_count = int(popcount(query))
+        if workers <= 1 or len(self) < MIN_SHARD_ROWS:
+            rows, sims = _top_k(self.words, self.counts, query,
+                                query_count, k)
+        else:
+            bounds = np.linspace(0, len(self), workers + 1).astype(int)
+            parts = list(self._get_pool(workers).map(
+                lambda i: _top_k(self.words[bounds[i]:bounds[i + 1]],
+                                 self.counts[bounds[i]:bounds[i + 1]],
+                                 query, query_count, k, offset=bounds[i]),
+                range(workers)))
+            rows = np.concatenate([p[0] for p in parts])
+            sims = np.concatenate([p[1] for p in parts])
+            order = np.lexsort((rows, -sims))[:k]
+            rows, sims = rows[order], sims[order]
+        res = [(self.keys[r], float(s)) for r, s in zip(rows, sims)
+               if self.keys[r] not in exclude]
+        return res[:want]
+
+    def save(self, filename):
+        """
+        Writes index to ``.npz`` file
+
+        :param filename: path to write to
+        """
+        with open(filename, 'wb') as fo:
+            np.savez(fo, keys=np.array(self.keys, dtype=str),
+                     words=self.words)
+
+    @classmethod
+    def load(cls, filename):
+        """
+        Reads index written by :py:meth:`save`
+
+        :param filename: path to index
+        :rtype: :py:class:`TanimotoIndex`
+        """
+        with np.load(filename) as data:
+            return cls(data['keys'].tolist(), data['words'])
+
+    @classmethod
+    def from_smiles(cls, smiles, fpcache=None):
+        """
+        Builds index fingerprinting each drug
+
+        :param smiles: SMILES strings, duplicates are skipped
+        :param fpcache: cache to get fingerprints from, if ``None``
+                        fingerprints are computed with RDKit
+        :type fpcache: :py:class:`~drugcellfindcell.fpcache.FingerprintCache`
+        :raises ValueError: if a SMILES cannot be parsed
+        :rtype: :py:class:`TanimotoIndex`
+        """
+        if fpcache is None:
+            fingerprint = fingerprintmod.morgan_fingerprint
+        else:
+            fingerprint = fpcache.get
+        smiles = list(dict.fromkeys(smiles))
+        index = cls()
+        if smiles:
+            index.add(smiles, [fingerprint(s) for s in smiles])
+        return index
+
+    @classmethod
+    def from_fpcache(cls, fpcache):
+        """
+        Builds index of every drug in fingerprint cache, keyed by
+        canonical SMILES, without unpacking the fingerprints
+
+        :param fpcache: fingerprint cache
+        :type fpcache: :py:class:`~drugcellfindcell.fpcache.FingerprintCache`
+        :rtype: :py:class:`TanimotoIndex`
+        """
+        items = fpcache.packed_items()
+        if not items:
+            return cls()
+        packed = np.frombuffer(b''.join(p for k, p in items),
+                               dtype=np.uint8).reshape(len(items), -1)
+        return cls([k for k, p in items], bytes_to_words(packed))
+
+
+def similar_drugs(index, smiles, k=DEFAULT_TOP_K, fpcache=None,
+                  workers=1):
+    """
+    Gets neighbours of each drug
+
+    :param index: index to search
+    :type index: :py:class:`TanimotoIndex`
+    :param smiles: SMILES strings of drugs to look up
+    :param k: neighbours per drug
+    :param fpcache: cache to get fingerprints from, if ``None``
+                    fingerprints are computed with RDKit
+    :param workers: threads to shard large indexes over
+    :return: entry with `smiles` and `neighbors`, each a list of
+             `smiles` and `tanimoto`, for each drug. A drug is not
+             its own neighbour even if the index holds it
+    :rtype: list
+    """
+    if fpcache is None:
+        fingerprint = fingerprintmod.morgan_fingerprint
+    else:
+        fingerprint = fpcache.get
+    res = []
+    for s in dict.fromkeys(smiles):
+        fp = fingerprint(s)
+        # indexes built from a fingerprint cache are keyed by
+        # canonical SMILES
+        exclude = [s, fingerprintmod.canonical_smiles(
+            fingerprintmod.parse_smiles(s))]
+        neighbors = index.query(fp, k=k, workers=workers, exclude=exclude)
+        res.append({'smiles': s,
+                    'neighbors': [{'smiles': n, 'tanimoto': round(t, 4)}
+                                  for n, t in neighbors]})
+    return res
+
+
+def _parse_arguments(desc, args):
+    """
+    Parses command line arguments
+    :param desc:
+    :param args:
+    :return:
+    """
+    help_fm = argparse.ArgumentDefaultsHelpFormatter
+    parser = argparse.ArgumentParser(description=desc,
+                                     formatter_class=help_fm)
+    parser.add_argument('output', help='index file to write')
+    parser.add_argument('--smiles',
+                        help='file with SMILES of drugs in first column')
+    parser.add_argument('--fpcache',
+                        help='fingerprint cache database whose drugs '
+                             'are added to the index')
+    return parser.parse_args(args)
+
+
+def main(args):
+    """
+    Builds a similarity index
+
+    :param args: command line arguments usually :py:const:`sys.argv`
+    :return: 0 for success otherwise failure
+    :rtype: int
+    """
+    desc = """
+        Builds a Tanimoto similarity index over the drugs in a
+        SMILES file and/or a fingerprint cache, for use with
+        drugcellfindcellcmd.py --similar
+    """
+    theargs = _parse_arguments(desc, args[1:])
+    index = TanimotoIndex()
+    if theargs.fpcache is not None:
+        with fpcachemod.FingerprintCache(theargs.fpcache) as cache:
+            index = TanimotoIndex.from_fpcache(cache)
+    if theargs.smiles is not None:
+        known = set(index.keys)
+        extra = TanimotoIndex.from_smiles(
+            [s for s in buildinput.load_1col(theargs.smiles, 0)
+             if s not in known])
+        index = TanimotoIndex(index.keys + extra.keys,
+                              np.concatenate((index.words, extra.words)))
+    index.save(theargs.output)
+    sys.stdout.write(str(len(index)) + ' drugs in ' + theargs.output + '\n')
+    return 0
+
+
+if __name__ == '__main__':  # pragma: no cover
+    sys.exit(main(sys.argv))
@@ -0,0 +1,450 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compiles the DrugCell reference data text files into a single
+versioned binary snapshot of integer indexed arrays and string tables.
+The snapshot is memory mapped on first use so processes loading the
+same snapshot share its pages
+"""
+
+import os
+import sys
+import json
+import mmap
+import struct
+import argparse
+import logging
+import collections.abc
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'DCSNAP'
+VERSION = 1
+SNAPSHOT_FILE = 'reference.snap'
+
+_PREAMBLE = struct.Struct('<6sIQ')
+_ALIGN = 64
+
+
+class StringTable(collections.abc.Sequence):
+    """
+    Read only list of strings stored as utf-8 bytes and offsets,
+    strings are only decoded when accessed
+    """
+    def __init__(self, offsets, data):
+        """
+        Constructor
+
+        :param offsets: int64 array, string `i` is
+                        ``data[offsets[i]:offsets[i + 1]]``
+        :param data: uint8 array of utf-8 bytes
+        """
+        self._offsets = offsets
+        self._data = data
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if i < 0 or i >= len(self):
+            raise IndexError('string table index out of range')
+        return bytes(self._data[self._offsets[i]:
+                                self._offsets[i + 1]]).decode('utf-8')
+
+    def index_map(self):
+        """
+        Builds string => position dict
+
+        :rtype: dict
+        """
+        return {s: i for i, s in enumerate(self)}
+
+
+class SnapshotMapping(collections.abc.Mapping):
+    """
+    Read only dict view pairing a key and a value
+    :py:class:`StringTable` of equal length. The key index
+    is built on first lookup and values are decoded on access
+    """
+    def __init__(self, keys, values):
+        """
+        Constructor
+
+        :param keys: keys
+        :type keys: :py:class:`StringTable`
+        :param values: value for each key
+        :type values: :py:class:`StringTable`
+        """
+        self._keys = keys
+        self._values = values
+        self._index = None
+
+    def _get_index(self):
+        if self._index is None:
+            self._index = self._keys.index_map()
+        return self._index
+
+    def __getitem__(self, key):
+        return self._values[self._get_index()[key]]
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._get_index()
+
+
+def _string_table(strings):
+    """
+    Encodes strings as (offsets, data) arrays
+    """
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(e) for e in encoded])
+    data = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    return offsets, data
+
+
+def _read_table(filename):
+    """
+    Reads tab delimited file as lists of tokens
+    """
+    rows = []
+    with open(filename, 'r') as fi:
+        for line in fi:
+            tokens = line.rstrip('\n').split('\t')
+            if tokens[0]:
+                rows.append(tokens)
+    return rows
+
+
+def source_files(config):
+    """
+    Gets the text files compiled into a snapshot
+
+    :param config: pipeline configuration
+    :type config: :py:class:`~drugcellfindcell.pipeline.PipelineConfig`
+    :return: name => path, ``cell2mutation`` is only included if
+             the model's dense genotype file exists
+    :rtype: dict
+    """
+    sources = {'cell2ind': config.cell2idfile,
+               'cell2mutation_list': config.cell2mutationfile,
+               'goterm2name': config.go2namefile,
+               'goterm2genes': config.go2genefile,
+               'gene2ind': config.gene2idfile}
+    if os.path.isfile(config.genotypefile):
+        sources['cell2mutation'] = config.genotypefile
+    return sources
+
+
+def _stamp(filename):
+    """
+    Gets size and modification time of file
+    """
+    st = os.stat(filename)
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+
+def build_snapshot(config, outputfile):
+    """
+    Compiles reference data text files into a snapshot
+
+    :param config: pipeline configuration
+    :type config: :py:class:`~drugcellfindcell.pipeline.PipelineConfig`
+    :param outputfile: path to write snapshot to
+    """
+    sources = source_files(config)
+    stamps = {name: dict(path=os.path.abspath(path), **_stamp(path))
+              for name, path in sources.items()}
+
+    # genotype row of each cell, the last row of a repeated
+    # cell wins as in buildinput.load_mapping
+    cell2id = {r[1]: int(r[0]) for r in _read_table(sources['cell2ind'])}
+    cells = list(cell2id)
+    cell2mut = {r[0]: r[1] if len(r) > 1 else ''
+                for r in _read_table(sources['cell2mutation_list'])}
+
+    genes = [r[1] for r in _read_table(sources['gene2ind'])]
+    gene2ind = {g: i for i, g in enumerate(genes)}
+
+    # mutated genes of each cell as compressed sparse rows
+    indptr = [0]
+    indices = []
+    for c in cells:
+        for g in cell2mut.get(c, '').split(','):
+            if g in gene2ind:
+                indices.append(gene2ind[g])
+        indptr.append(len(indices))
+
+    go2name = {r[0]: r[1] if len(r) > 1 else ''
+               for r in _read_table(sources['goterm2name'])}
+    go2gene = {r[0]: r[1] if len(r) > 1 else ''
+               for r in _read_table(sources['goterm2genes'])}
+    terms = list(dict.fromkeys(list(go2name) + list(go2gene)))
+
+    arrays = collections.OrderedDict()
+    arrays['cell_ids'] = np.array([cell2id[c] for c in cells],
+                                  dtype=np.int64)
+    arrays['cell_mutation_indptr'] = np.array(indptr, dtype=np.int64)
+    arrays['cell_mutation_indices'] = np.array(indices, dtype=np.int32)
+    if 'cell2mutation' in sources:
+        # the genotype the model takes, rows by cell id, so it always
+        # agrees with cell2mutation.txt
+        from drugcellfindcell import genotype
+        geno = genotype.read_dense(sources['cell2mutation'])
+        arrays['genotype_indptr'] = geno.indptr
+        arrays['genotype_indices'] = geno.indices
+        arrays['genotype_ngenes'] = np.array([geno.ngenes], dtype=np.int64)
+    for name, strings in [('cells', cells),
+                          ('cell_mutations', [cell2mut.get(c, '')
+                                              for c in cells]),
+                          ('genes', genes),
+                          ('terms', terms),
+                          ('term_names', [go2name.get(t, '')
+                                          for t in terms]),
+                          ('term_genes', [go2gene.get(t, '')
+                                          for t in terms])]:
+        offsets, data = _string_table(strings)
+        arrays[name + '.offsets'] = offsets
+        arrays[name + '.data'] = data
+
+    index = {}
+    offset = 0
+    for name, arr in arrays.items():
+        index[name] = {'dtype': arr.dtype.str, 'shape': list(arr.shape),
+                       'offset': offset}
+        offset += (arr.nbytes + _ALIGN - 1) // _ALIGN * _ALIGN
+    header = json.dumps({'version': VERSION, 'sources': stamps,
+                         'arrays': index}).encode('utf-8')
+    datastart = _PREAMBLE.size + len(header)
+    datastart = (datastart + _ALIGN - 1) // _ALIGN * _ALIGN
+
+    tmpfile = outputfile + '.tmp'
+    with open(tmpfile, 'wb') as fo:
+        fo.write(_PREAMBLE.pack(MAGIC, VERSION, len(header)))
+        fo.write(header)
+        for name, arr in arrays.items():
+            fo.seek(datastart + index[name]['offset'])
+            fo.write(arr.tobytes())
+        fo.truncate(datastart + offset)
+    os.replace(tmpfile, outputfile)
+
+
+class ReferenceSnapshot(object):
+    """
+    Memory mapped snapshot written by :py:func:`build_snapshot`.
+    Only the header is read on construction, the data is mapped
+    when first accessed
+    """
+    def __init__(self, filename):
+        """
+        Constructor
+
+        :param filename: path to snapshot
+        :raises ValueError: if file is not a snapshot or was written
+                            by a different version
+        """
+        self._filename = filename
+        with open(filename, 'rb') as f:
+            magic, version, headerlen = _PREAMBLE.unpack(
+                f.read(_PREAMBLE.size))
+            if magic != MAGIC:
+                raise ValueError(filename + ' is not a reference snapshot')
+            if version != VERSION:
+                raise ValueError(filename + ' is snapshot version ' +
+                                 str(version) + ', expected ' +
+                                 str(VERSION))
+            self._header = json.loads(f.read(headerlen).decode('utf-8'))
+        datastart = _PREAMBLE.size + headerlen
+        self._datastart = (datastart + _ALIGN - 1) // _ALIGN * _ALIGN
+        self._mmap = None
+        self._cache = {}
+
+    def close(self):
+        """
+        Unmaps the snapshot
+        """
+        self._cache = {}
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def is_stale(self):
+        """
+        Checks if any source file changed since snapshot was built
+
+        :return: ``True`` if a source file is missing or its size or
+                 modification time differs from when it was compiled
+        :rtype: bool
+        """
+        for name, stamp in self._header['sources'].items():
+            try:
+                current = _stamp(stamp['path'])
+            except OSError:
+                return True
+            if current['size'] != stamp['size'] or \
+                    current['mtime_ns'] != stamp['mtime_ns']:
+                logger.debug(stamp['path'] + ' changed since snapshot '
+                             'was built')
+                return True
+        return False
+
+    def __contains__(self, name):
+        return name in self._header['arrays']
+
+    def array(self, name):
+        """
+        Gets array from snapshot without copying it
+
+        :param name: name of array
+        :return: read only view of memory mapped data
+        :rtype: :py:class:`numpy.ndarray`
+        """
+        if name in self._cache:
+            return self._cache[name]
+        if self._mmap is None:
+            with open(self._filename, 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), 0,
+                                       access=mmap.ACCESS_READ)
+        info = self._header['arrays'][name]
+        dtype = np.dtype(info['dtype'])
+        count = int(np.prod(info['shape']))
+        arr = np.frombuffer(self._mmap, dtype=dtype, count=count,
+                            offset=self._datastart + info['offset'])
+        arr = arr.reshape(info['shape'])
+        self._cache[name] = arr
+        return arr
+
+    def strings(self, name):
+        """
+        Gets string table from snapshot
+
+        :param name: name of table, one of `cells`, `cell_mutations`,
+                     `genes`, `terms`, `term_names` or `term_genes`
+        :rtype: :py:class:`StringTable`
+        """
+        return StringTable(self.array(name + '.offsets'),
+                           self.array(name + '.data'))
+
+    @property
+    def cells(self):
+        """
+        Cell names ordered as in ``cell2ind.txt``
+        """
+        return self.strings('cells')
+
+    @property
+    def cell2id(self):
+        """
+        Cell name => genotype row from ``cell2ind.txt``, built as a
+        dict as the native engine looks up every cell it scores
+        """
+        return dict(zip(self.cells, self.array('cell_ids').tolist()))
+
+    @property
+    def cell2genes(self):
+        """
+        Cell name => mutations string from ``cell2mutation_list.txt``
+        """
+        return SnapshotMapping(self.cells, self.strings('cell_mutations'))
+
+    @property
+    def go2name(self):
+        """
+        GO term => name
+        """
+        return SnapshotMapping(self.strings('terms'),
+                               self.strings('term_names'))
+
+    @property
+    def go2gene(self):
+        """
+        GO term => genes
+        """
+        return SnapshotMapping(self.strings('terms'),
+                               self.strings('term_genes'))
+
+    def cell_mutations(self, i):
+        """
+        Gets indices into `genes` of genes mutated in cell `i`
+
+        :param i: position of cell in `cells`
+        :rtype: :py:class:`numpy.ndarray`
+        """
+        indptr = self.array('cell_mutation_indptr')
+        return self.array('cell_mutation_indices')[indptr[i]:indptr[i + 1]]
+
+
+def open_fresh(filename):
+    """
+    Opens snapshot if it can be used in place of the text files
+
+    :param filename: path to snapshot
+    :return: snapshot or ``None`` if it is missing, unreadable
+             or older than a source file
+    :rtype: :py:class:`ReferenceSnapshot`
+    """
+    try:
+        snap = ReferenceSnapshot(filename)
+    except (OSError, ValueError):
+        return None
+    if snap.is_stale():
+        return None
+    return snap
+
+
+def _parse_arguments(desc, args):
+    """
+    Parses command line arguments
+    :param desc:
+    :param args:
+    :return:
+    """
+    from drugcellfindcell import pipeline
+    help_fm = argparse.ArgumentDefaultsHelpFormatter
+    parser = argparse.ArgumentParser(description=desc,
+                                     formatter_class=help_fm)
+    parser.add_argument('--datadir', default=pipeline.DEFAULT_DATADIR,
+                        help='directory containing DrugCell reference data')
+    parser.add_argument('--output',
+                        help='snapshot file to write, default is ' +
+                             SNAPSHOT_FILE + ' in --datadir')
+    return parser.parse_args(args)
+
+
+def main(args):
+    """
+    Builds reference snapshot
+
+    :param args: command line arguments usually :py:const:`sys.argv`
+    :return: 0 for success otherwise failure
+    :rtype: int
+    """
+    from drugcellfindcell import pipeline
+    desc = """
+        Compiles cell2ind, cell2mutation_list, cell2mutation,
+        goterm2name, goterm2genes and gene2ind into a binary
+        snapshot that
+        drugcellfindcell memory maps instead of parsing the
+        text files
+    """
+    theargs = _parse_arguments(desc, args[1:])
+    config = pipeline.PipelineConfig(datadir=theargs.datadir,
+                                     snapshotfile=theargs.output)
+    build_snapshot(config, config.snapshotfile)
+    return 0
+
+
+if __name__ == '__main__':  # pragma: no cover
+    sys.exit(main(sys.argv))
@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+
+"""
+Generates synthetic DrugCell reference data, RLIPP scores and
+predictions at configurable scales so stages can be tested and
+benchmarked offline without the real data set
+"""
+
+import os
+import sys
+import argparse
+
+import numpy as np
+
+from drugcellfindcell import columnar
+from drugcellfindcell import pipeline
+
+
+DEFAULT_CELLS = 1000
+DEFAULT_TERMS = 2000
+DEFAULT_GENES = 3008
+DEFAULT_MUTATIONS = 20
+DEFAULT_TERM_GENES = 4
+
+_RINGS = ['', 'c1ccccc1', 'C1CCCCC1', 'c1ccncc1']
+_TAILS = ['O', 'N', 'F', 'Cl', 'C(=O)O', 'S']
+
+
+def term_id(i):
+    """
+    Gets GO term id of synthetic term `i`
+
+    :param i: term number
+    :rtype: str
+    """
+    return 'GO:%07d' % i
+
+
+def cell_name(i):
+    """
+    Gets name of synthetic cell `i`
+
+    :param i: cell number
+    :rtype: str
+    """
+    return 'CELL%d_SYNTH' % i
+
+
+def gene_name(i):
+    """
+    Gets name of synthetic gene `i`
+
+    :param i: gene number
+    :rtype: str
+    """
+    return 'GENE%d' % i
+
+
+def synthetic_smiles(count):
+    """
+    Builds `count` distinct SMILES strings RDKit can parse
+
+    :param count: number of SMILES
+    :rtype: list
+    """
+    res = []
+    for i in range(count):
+        smiles = _RINGS[(i // 12) % len(_RINGS)] + 'C' * (1 + i % 12) + \
+            'C(C)' * (i // (12 * len(_RINGS) * len(_TAILS))) + \
+            _TAILS[(i // (12 * len(_RINGS))) % len(_TAILS)]
+        res.append(smiles)
+    return res
+
+
+def generate_reference_data(datadir, cells=DEFAULT_CELLS,
+                            terms=DEFAULT_TERMS, genes=DEFAULT_GENES,
+                            mutations=DEFAULT_MUTATIONS,
+                            term_genes=DEFAULT_TERM_GENES, seed=0):
+    """
+    Writes the reference files read through
+    :py:class:`~drugcellfindcell.pipeline.PipelineConfig` into `datadir`.
+    Terms form a tree rooted at term 0 where every term's parent has a
+    lower number, each term is annotated directly with a few genes and
+    ``goterm2genes.txt`` lists every gene under a term
+
+    :param datadir: directory to write to, created if needed
+    :param cells: number of cells
+    :param terms: number of GO terms
+    :param genes: number of genes
+    :param mutations: number of mutated genes per cell
+    :param term_genes: number of genes directly annotated to each term
+    :param seed: random seed
+    :return: configuration pointing at the files written
+    :rtype: :py:class:`~drugcellfindcell.pipeline.PipelineConfig`
+    """
+    if not os.path.isdir(datadir):
+        os.makedirs(datadir)
+    config = pipeline.PipelineConfig(datadir=datadir)
+    rng = np.random.RandomState(seed)
+    mutations = min(mutations, genes)
+    term_genes = min(term_genes, genes)
+
+    with open(config.gene2idfile, 'w') as fo:
+        for g in range(genes):
+            fo.write('%d\t%s\n' % (g, gene_name(g)))
+
+    with open(config.cell2idfile, 'w') as fo:
+        for c in range(cells):
+            fo.write('%d\t%s\n' % (c, cell_name(c)))
+
+    # genotype is one row of comma delimited 0/1 per cell
+    with open(config.genotypefile, 'w') as fg, \
+            open(config.cell2mutationfile, 'w') as fl:
+        for c in range(cells):
+            mutated = np.sort(rng.choice(genes, mutations, replace=False))
+            row = bytearray(b'0,' * genes)
+            for g in mutated:
+                row[2 * g] = ord('1')
+            fg.write(row[:-1].decode('ascii') + '\n')
+            fl.write('%s\t%s\n' % (cell_name(c),
+                                   ','.join(gene_name(g) for g in mutated)))
+
+    parents = [None] + [int(rng.randint(0, t)) for t in range(1, terms)]
+    direct = [rng.choice(genes, term_genes, replace=False)
+              for t in range(terms)]
+    # every gene must be annotated somewhere
+    for g in range(genes):
+        direct[g % terms] = np.append(direct[g % terms], g)
+
+    allgenes = [set(d.tolist()) for d in direct]
+    for t in range(terms - 1, 0, -1):
+        allgenes[parents[t]].update(allgenes[t])
+
+    with open(config.ontfile, 'w') as fo:
+        for t in range(1, terms):
+            fo.write('%s\t%s\tdefault\n' % (term_id(parents[t]),
+                                            term_id(t)))
+        for t in range(terms):
+            for g in sorted(set(direct[t].tolist())):
+                fo.write('%s\t%s\tgene\n' % (term_id(t), gene_name(g)))
+
+    with open(config.go2namefile, 'w') as fn, \
+            open(config.go2genefile, 'w') as fg:
+        for t in range(terms):
+            fn.write('%s\tsynthetic term %d\n' % (term_id(t), t))
+            fg.write('%s\t%s\n' % (term_id(t),
+                                   ','.join(gene_name(g)
+                                            for g in sorted(allgenes[t]))))
+    return config
+
+
+def generate_model(config, num_hiddens_genotype=6,
+                   num_hiddens_drug=(100, 50, 6), num_hiddens_final=6,
+                   seed=0):
+    """
+    Writes DrugCell model with random weights for the ontology in
+    `config` to its `modelfile`, readable by
+    :py:func:`~drugcellfindcell.drugcellnn.load_model`
+
+    :param config: configuration from :py:func:`generate_reference_data`
+    :param num_hiddens_genotype: hidden units per term
+    :param num_hiddens_drug: hidden units of each drug layer
+    :param num_hiddens_final: hidden units of final layer
+    :param seed: random seed
+    :return: path to model
+    :rtype: str
+    """
+    # torch is only needed when a model is generated
+    import torch
+    from drugcellfindcell import buildinput
+    from drugcellfindcell import drugcellnn
+
+    torch.manual_seed(seed)
+    gene2id = buildinput.load_mapping(config.gene2idfile)
+    term_children, term_direct_gene_map, root = drugcellnn.load_ontology(
+        config.ontfile, gene2id)
+    model = drugcellnn.drugcell_nn(term_children, term_direct_gene_map,
+                                   len(gene2id),
+                                   buildinput.FINGERPRINT_BITS, root,
+                                   num_hiddens_genotype=num_hiddens_genotype,
+                                   num_hiddens_drug=num_hiddens_drug,
+                                   num_hiddens_final=num_hiddens_final)
+    model.eval()
+    modeldir = os.path.dirname(config.modelfile)
+    if not os.path.isdir(modeldir):
+        os.makedirs(modeldir)
+    torch.save(model, config.modelfile)
+    return config.modelfile
+
+
+def generate_rlipp(rlippfile, terms=DEFAULT_TERMS, seed=0):
+    """
+    Writes random RLIPP score for every synthetic term
+
+    :param rlippfile: path to write to
+    :param terms: number of GO terms
+    :param seed: random seed
+    """
+    rng = np.random.RandomState(seed)
+    scores = rng.normal(0.0, 0.5, size=terms)
+    with open(rlippfile, 'w') as fo:
+        for t in range(terms):
+            fo.write('%s\t%f\n' % (term_id(t), scores[t]))
+
+
+def generate_predictions(outputfile, cells, drugs, seed=0):
+    """
+    Writes ``output.txt`` read by ``2_generate_output.py``
+    with random AUC for every drug and cell
+
+    :param outputfile: path to write to
+    :param cells: names of cells
+    :param drugs: SMILES strings
+    :param seed: random seed
+    """
+    rng = np.random.RandomState(seed)
+    with open(outputfile, 'w') as fo:
+        for d in drugs:
+            for c, auc in zip(cells, rng.uniform(0.0, 1.0, len(cells))):
+                fo.write('%s\t%s\t-1\t%f\n' % (c, d, auc))
+
+
+def generate_prediction_columns(columndir, cells, drugs, seed=0):
+    """
+    Writes the same predictions as :py:func:`generate_predictions`
+    in :py:mod:`~drugcellfindcell.columnar` form
+
+    :param columndir: directory to write to
+    :param cells: names of cells
+    :param drugs: SMILES strings
+    :param seed: random seed
+    """
+    rng = np.random.RandomState(seed)
+    columnar.write_input(columndir, drugs, cells)
+    predicted = np.concatenate([rng.uniform(0.0, 1.0, len(cells))
+                                for d in drugs])
+    columnar.write_predictions(columndir, predicted)
+
+
+class SyntheticPredictor(object):
+    """
+    Predictor that writes random predictions and RLIPP
+    scores for every synthetic term, in place of a model
+    """
+    def __init__(self, terms=DEFAULT_TERMS, seed=0):
+        """
+        Constructor
+
+        :param terms: number of GO terms to score
+        :param seed: random seed
+        """
+        self._terms = terms
+        self._seed = seed
+
+    def predict(self, inputfiles, outputdir):
+        """
+        Stores one random prediction per row of the columnar input
+
+        :param inputfiles: paths keyed by `columns`
+        :param outputdir: directory to write RLIPP scores to
+        :return: (``None`` as predictions go to the columns,
+                 path to RLIPP file)
+        :rtype: tuple
+        """
+        rows = np.load(os.path.join(inputfiles['columns'],
+                                    columnar.CELL_INDEX_FILE),
+                       mmap_mode='r').shape[0]
+        rng = np.random.RandomState(self._seed)
+        columnar.write_predictions(inputfiles['columns'],
+                                   rng.uniform(0.0, 1.0, rows))
+        rlippfile = os.path.join(outputdir, pipeline.RLIPP_FILE)
+        generate_rlipp(rlippfile, terms=self._terms, seed=self._seed)
+        return None, rlippfile
+
+
+def _parse_arguments(desc, args):
+    """
+    Parses command line arguments
+    :param desc:
+    :param args:
+    :return:
+    """
+    help_fm = argparse.ArgumentDefaultsHelpFormatter
+    parser = argparse.ArgumentParser(description=desc,
+                                     formatter_class=help_fm)
+    parser.add_argument('outputdir',
+                        help='directory to write synthetic data to')
+    parser.add_argument('--cells', type=int, default=DEFAULT_CELLS,
+                        help='number of cells')
+    parser.add_argument('--terms', type=int, default=DEFAULT_TERMS,
+                        help='number of GO terms')
+    parser.add_argument('--genes', type=int, default=DEFAULT_GENES,
+                        help='number of genes')
+    parser.add_argument('--mutations', type=int, default=DEFAULT_MUTATIONS,
+                        help='number of mutated genes per cell')
+    parser.add_argument('--drugs', type=int, default=1,
+                        help='number of drugs in input_drug.txt '
+                             'and output.txt')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='random seed')
+    return parser.parse_args(args)
+
+
+def main(args):
+    """
+    Writes synthetic data
+
+    :param args: command line arguments usually :py:const:`sys.argv`
+    :return: 0 for success otherwise failure
+    :rtype: int
+    """
+    desc = """
+        Writes synthetic DrugCell reference data to
+        <outputdir>/data along with input_drug.txt,
+        rlipp.txt and output.txt for that data
+    """
+    theargs = _parse_arguments(desc, args[1:])
+    generate_reference_data(os.path.join(theargs.outputdir, 'data'),
+                            cells=theargs.cells, terms=theargs.terms,
+                            genes=theargs.genes,
+                            mutations=theargs.mutations,
+                            seed=theargs.seed)
+    drugs = synthetic_smiles(theargs.drugs)
+    with open(os.path.join(theargs.outputdir, 'input_drug.txt'), 'w') as fo:
+        for d in drugs:
+            fo.write(d + '\n')
+    generate_rlipp(os.path.join(theargs.outputdir, pipeline.RLIPP_FILE),
+                   terms=theargs.terms, seed=theargs.seed)
+    generate_predictions(os.path.join(theargs.outputdir,
+                                      pipeline.OUTPUT_FILE),
+                         [cell_name(c) for c in range(theargs.cells)],
+                         drugs, seed=theargs.seed)
+    return 0
+
+
+if __name__ == '__main__':  # pragma: no cover
+    sys.exit(main(sys.argv))
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+"""
+Records how long each stage of a task takes and the peak memory
+of the process when it finishes, written per task as JSON
+"""
+
+import sys
+import json
+import time
+import contextlib
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
+
+
+TRACE_FILE = 'trace.json'
+PROFILE_FILE = 'profile.pstats'
+
+
+def peak_rss():
+    """
+    Gets peak resident set size of this process
+
+    :return: bytes or ``None`` if it cannot be measured on
+             this platform
+    :rtype: int
+    """
+    if resource is None:  # pragma: no cover
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return maxrss
+    return maxrss * 1024
+
+
+class Tracer(object):
+    """
+    Collects timing spans of a task. Spans may be nested,
+    each records the span it ran inside of as `parent`
+    """
+    def __init__(self):
+        """
+        Constructor
+        """
+        self.spans = []
+        self._stack = []
+        self._created = time.time()
+        self._origin = time.perf_counter()
+
+    @contextlib.contextmanager
+    def span(self, name, **attrs):
+        """
+        Times the enclosed block as stage `name`
+
+        :param name: name of stage
+        :param attrs: extra values to record with the span
+        """
+        parent = self._stack[-1] if self._stack else None
+        self._stack.append(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self._stack.pop()
+            entry = {'name': name,
+                     'start': round(start - self._origin, 6),
+                     'seconds': round(end - start, 6),
+                     'peak_rss_bytes': peak_rss()}
+            if parent is not None:
+                entry['parent'] = parent
+            entry.update(attrs)
+            self.spans.append(entry)
+
+    def to_dict(self):
+        """
+        Gets trace as a dict
+
+        :return: `created` epoch time, `seconds` elapsed since then,
+                 final `peak_rss_bytes` and list of `spans` in the
+                 order they finished
+        :rtype: dict
+        """
+        return {'created': self._created,
+                'seconds': round(time.perf_counter() - self._origin, 6),
+                'peak_rss_bytes': peak_rss(),
+                'spans': list(self.spans)}
+
+    def write(self, filename):
+        """
+        Writes trace as JSON
+
+        :param filename: path to write to
+        """
+        with open(filename, 'w') as fo:
+            json.dump(self.to_dict(), fo, indent=4)
+
+
+@contextlib.contextmanager
+def _no_span():
+    yield
+
+
+def span(tracer, name, **attrs):
+    """
+    Times the enclosed block with `tracer` if one is set
+
+    :param tracer: tracer or ``None`` to not record anything
+    :type tracer: :py:class:`Tracer`
+    :param name: name of stage
+    :return: context manager
+    """
+    if tracer is None:
+        return _no_span()
+    return tracer.span(name, **attrs)
@@ -0,0 +1,466 @@
+# -*- coding: utf-8 -*-
+
+"""
+Long lived DrugCell worker that loads the reference data and predictor
+once and then runs tasks submitted over a local Unix socket
+"""
+
+import os
+import sys
+import copy
+import json
+import shutil
+import socket
+import logging
+import argparse
+import tempfile
+import threading
+import socketserver
+
+from drugcellfindcell import pipeline
+from drugcellfindcell import cellquery
+from drugcellfindcell import fpcache
+from drugcellfindcell import generateoutput
+from drugcellfindcell import executor as executormod
+from drugcellfindcell import scheduler
+
+
+DEFAULT_SOCKET = '/tmp/drugcellfindcell.sock'
+
+logger = logging.getLogger(__name__)
+
+
+class DrugCellWorker(object):
+    """
+    Keeps everything a task needs loaded between tasks. Tasks
+    run one at a time in this process unless an executor is
+    given, in which case they run concurrently in its pool.
+    With `max_batch` above 1 tasks arriving within `max_wait`
+    seconds of each other are scored in one prediction pass, if
+    the configuration reports no top pathways
+    """
+    def __init__(self, config, predictor=None, executor=None,
+                 max_batch=1, max_wait=scheduler.DEFAULT_MAX_WAIT):
+        """
+        Constructor
+
+        :param config: pipeline configuration
+        :type config: :py:class:`~drugcellfindcell.pipeline.PipelineConfig`
+        :param predictor: predictor to use, if ``None``
+            one is made with
+            :py:func:`~drugcellfindcell.pipeline.create_predictor`
+            unless tasks run in `executor`, whose processes make
+            their own
+        :param executor: pool to run tasks in
+        :type executor: :py:class:`~drugcellfindcell.executor.TaskExecutor`
+        :param max_batch: maximum number of tasks in a batch, 1 runs
+                          every task on its own
+        :param max_wait: seconds the first task of a batch waits
+                         for others
+        """
+        # results go back over the socket so they cannot be streamed
+        if config.streamoutput:
+            config = copy.copy(config)
+            config.streamoutput = False
+        self._config = config
+        if predictor is None and executor is None:
+            predictor = pipeline.create_predictor(config)
+        self._predictor = predictor
+        self._executor = executor
+        self._lock = threading.Lock()
+        self._refdata = None
+        self._fpcache = None
+        self._coalescer = None
+        if max_batch > 1:
+            self._coalescer = scheduler.RequestCoalescer(
+                self.run_batch, max_wait=max_wait, max_batch=max_batch)
+
+    def load(self):
+        """
+        Loads reference data and predictor and opens
+        fingerprint cache if one is configured. Nothing is
+        loaded here when tasks run in an executor
+        """
+        if self._executor is not None:
+            return
+        if self._refdata is None:
+            self._refdata = pipeline.ReferenceData(self._config)
+            self._fpcache = self._config.open_fpcache()
+        if hasattr(self._predictor, 'load'):
+            self._predictor.load()
+
+    def run_task(self, task):
+        """
+        Runs a single task, possibly batched with others
+
+        :param task: task with `smiles`, `outputdir` and optional
+                     `taskId`, `cells`, `mutations` and `topk`
+                     overriding those of the configuration
+        :type task: dict
+        :return: result from
+                 :py:func:`~drugcellfindcell.pipeline.run_pipeline`
+        :rtype: dict
+        """
+        # top pathways are ranked over every row of a pass so
+        # tasks reporting them cannot share one with other tasks
+        if self._coalescer is not None and \
+                not self._task_config(task).topn:
+            return self._coalescer.submit(task)
+        return self._run_one(task)
+
+    def run_batch(self, tasks):
+        """
+        Scores the drugs of all `tasks` in one prediction pass and
+        writes each task's share of the result to its ``output.json``.
+        If the batch fails each task is run on its own so a bad
+        SMILES only fails its own task
+
+        :param tasks: tasks to run
+        :type tasks: list
+        :return: result of each task, or the exception it raised,
+                 in the same order as `tasks`
+        :rtype: list
+        """
+        if self._executor is not None:
+            return self._executor.run_batch(tasks)
+        results = [None] * len(tasks)
+        for positions in scheduler.group_by_query(tasks):
+            group = [tasks[i] for i in positions]
+            for i, res in zip(positions, self._run_group(group)):
+                results[i] = res
+        return results
+
+    def _run_group(self, tasks):
+        """
+        Runs tasks with the same cell query as one pass, falling
+        back to running them one at a time
+        """
+        if len(tasks) > 1:
+            try:
+                return self._run_merged(tasks)
+            except Exception as e:
+                logger.info('Batch of ' + str(len(tasks)) +
+                            ' tasks failed, running them one at a '
+                            'time: ' + str(e))
+        results = []
+        for task in tasks:
+            try:
+                results.append(self._run_one(task))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def _task_config(self, task):
+        """
+        Gets configuration with cell query of `task` applied
+        """
+        if all(task.get(k) is None for k in scheduler.QUERY_KEYS):
+            return self._config
+        config = copy.copy(self._config)
+        for k in scheduler.QUERY_KEYS:
+            if task.get(k) is not None:
+                setattr(config, k, task[k])
+        return config
+
+    def _run_one(self, task):
+        """
+        Runs task on its own
+        """
+        if self._executor is not None:
+            return self._executor.run_task(task)
+        with self._lock:
+            self.load()
+            outputdir = task['outputdir']
+            if not os.path.isdir(outputdir):
+                os.makedirs(outputdir)
+            return pipeline.run_pipeline(task['smiles'],
+                                         config=self._task_config(task),
+                                         outputdir=outputdir,
+                                         predictor=self._predictor,
+                                         refdata=self._refdata,
+                                         fpcache=self._fpcache)
+
+    def _run_merged(self, tasks):
+        """
+        Runs tasks as one pipeline pass in a scratch directory
+        and splits the result between them
+        """
+        config = self._task_config(tasks[0])
+        batchdir = tempfile.mkdtemp(prefix='drugcellbatch')
+        try:
+            with self._lock:
+                self.load()
+                result = pipeline.run_pipeline(
+                    scheduler.merge_tasks(tasks), config=config,
+                    outputdir=batchdir, predictor=self._predictor,
+                    refdata=self._refdata, fpcache=self._fpcache)
+            results = scheduler.split_result(result, tasks)
+            for task, res in zip(tasks, results):
+                scheduler.write_task_output(
+                    task['outputdir'], res, compact=config.compactoutput,
+                    schema=config.outputschema, pack_auc=config.packauc,
+                    compress=config.gzipoutput,
+                    smiles=scheduler.task_smiles(task)[0])
+        finally:
+            shutil.rmtree(batchdir, ignore_errors=True)
+        return results
+
+    def settings_mismatch(self, task):
+        """
+        Compares the engine settings a task was submitted with
+        to those of this worker
+
+        :param task: task with optional `settings` from
+                     :py:meth:`~.PipelineConfig.engine_settings`
+        :type task: dict
+        :return: settings that differ, empty if the task has
+                 no settings or they all match
+        :rtype: list
+        """
+        settings = task.get('settings')
+        if settings is None:
+            return []
+        ours = self._config.engine_settings()
+        return sorted(k for k in set(settings) | set(ours)
+                      if settings.get(k) != ours.get(k))
+
+    def handle_request(self, data):
+        """
+        Runs the task encoded in `data` and returns encoded response
+
+        :param data: JSON encoded task
+        :type data: bytes
+        :return: JSON encoded response with `status` set to ``ok``
+                 and `result`, ``mismatch`` and `message` if the task
+                 asks for engine settings this worker was not started
+                 with, or ``error`` and `message`
+        :rtype: bytes
+        """
+        try:
+            task = json.loads(data.decode('utf-8'))
+            mismatch = self.settings_mismatch(task)
+            if mismatch:
+                res = {'status': 'mismatch',
+                       'message': 'Worker settings differ: ' +
+                                  ', '.join(mismatch)}
+            else:
+                res = {'status': 'ok', 'result': self.run_task(task)}
+        except Exception as e:
+            res = {'status': 'error', 'message': str(e)}
+        return (json.dumps(res) + '\n').encode('utf-8')
+
+
+class _TaskHandler(socketserver.StreamRequestHandler):
+    """
+    Reads one task per connection and writes back the response
+    """
+    def handle(self):
+        data = self.rfile.readline()
+        if not data:
+            return
+        self.wfile.write(self.server.worker.handle_request(data))
+
+
+def create_server(worker, socketpath=DEFAULT_SOCKET):
+    """
+    Loads `worker` and creates a server for it listening
+    on `socketpath`, replacing any stale socket file
+
+    :param worker: worker to run tasks with
+    :type worker: :py:class:`DrugCellWorker`
+    :param socketpath: path of Unix socket to listen on
+    :return: server, call `serve_forever()` to start handling tasks
+    :rtype: :py:class:`socketserver.ThreadingUnixStreamServer`
+    """
+    worker.load()
+    if os.path.exists(socketpath):
+        os.remove(socketpath)
+    server = socketserver.ThreadingUnixStreamServer(socketpath,
+                                                    _TaskHandler)
+    server.daemon_threads = True
+    server.worker = worker
+    return server
+
+
+def serve(worker, socketpath=DEFAULT_SOCKET):
+    """
+    Serves tasks for `worker` on `socketpath` until interrupted
+
+    :param worker: worker to run tasks with
+    :type worker: :py:class:`DrugCellWorker`
+    :param socketpath: path of Unix socket to listen on
+    """
+    server = create_server(worker, socketpath=socketpath)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(socketpath):
+            os.remove(socketpath)
+
+
+def submit_task(smiles, outputdir, socketpath=DEFAULT_SOCKET,
+                timeout=None, task_id=None, cells=None, mutations=None,
+                topk=None, settings=None):
+    """
+    Submits a task to a running worker
+
+    :param smiles: SMILES string for drug or list of SMILES strings
+    :param outputdir: directory worker should write results to
+    :param socketpath: path of Unix socket worker listens on
+    :param timeout: seconds to wait for result, ``None`` waits forever
+    :param task_id: id of task, set as `taskId` in ``output.json``
+                    when the worker scores the task in a batch
+    :param cells: if set only these cells are scored
+    :param mutations: if set only cells with at least one of
+                      these genes mutated are scored
+    :param topk: if set only the `topk` most sensitive cells of
+                 each drug are returned
+    :param settings: engine settings from
+                     :py:meth:`~.PipelineConfig.engine_settings`
+                     the worker must have been started with
+    :raises RuntimeError: if the worker failed to run the task
+    :return: result from
+             :py:func:`~drugcellfindcell.pipeline.run_pipeline` or
+             ``None`` if no worker is listening on `socketpath` or
+             its settings differ from `settings`
+    :rtype: dict
+    """
+    task = {'smiles': smiles, 'outputdir': os.path.abspath(outputdir)}
+    if task_id is not None:
+        task['taskId'] = task_id
+    for k, v in [('cells', cells), ('mutations', mutations),
+                 ('topk', topk), ('settings', settings)]:
+        if v is not None:
+            task[k] = v
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(timeout)
+        try:
+            sock.connect(socketpath)
+        except (FileNotFoundError, ConnectionRefusedError):
+            return None
+        sock.sendall((json.dumps(task) + '\n').encode('utf-8'))
+        with sock.makefile('rb') as f:
+            data = f.readline()
+    finally:
+        sock.close()
+
+    res = json.loads(data.decode('utf-8'))
+    if res['status'] == 'mismatch':
+        logger.info('Not using worker on ' + socketpath + ': ' +
+                    res['message'])
+        return None
+    if res['status'] != 'ok':
+        raise RuntimeError('Worker failed to run task: ' + res['message'])
+    return res['result']
+
+
+def _parse_arguments(desc, args):
+    """
+    Parses command line arguments
+    :param desc:
+    :param args:
+    :return:
+    """
+    help_fm = argparse.ArgumentDefaultsHelpFormatter
+    parser = argparse.ArgumentParser(description=desc,
+                                     formatter_class=help_fm)
+    parser.add_argument('--socket', default=DEFAULT_SOCKET,
+                        help='Unix socket to listen on')
+    parser.add_argument('--datadir', default=pipeline.SERVICE_DATADIR,
+                        help='directory containing DrugCell reference data')
+    parser.add_argument('--predictscript',
+                        default=pipeline.DEFAULT_PREDICT_SCRIPT,
+                        help='DrugCell prediction script')
+    parser.add_argument('--modelfile',
+                        help='trained DrugCell model, default is '
+                             'pretrained_model/drugcell_v1.pt under '
+                             '--datadir')
+    parser.add_argument('--fpcache',
+                        help='fingerprint cache database, if not set '
+                             'fingerprints are not cached')
+    parser.add_argument('--fpcachesize', type=int,
+                        default=fpcache.DEFAULT_MAX_ENTRIES,
+                        help='maximum number of fingerprints to cache')
+    parser.add_argument('--maxtasks', type=int, default=1,
+                        help='number of tasks to run at once, above 1 '
+                             'tasks run in a pool of processes')
+    parser.add_argument('--threadspertask', type=int,
+                        help='threads each task may use for torch and '
+                             'OpenMP/MKL, default splits the cores '
+                             'evenly between --maxtasks tasks')
+    parser.add_argument('--maxbatch', type=int, default=1,
+                        help='maximum number of tasks scored in one '
+                             'prediction pass, 1 disables batching. '
+                             'Only used with --topn 0 as top pathways '
+                             'are ranked over a whole pass')
+    parser.add_argument('--maxwait', type=float,
+                        default=scheduler.DEFAULT_MAX_WAIT,
+                        help='seconds a task waits for others to '
+                             'batch with')
+    parser.add_argument('--topn', type=int, default=generateoutput.TOP_N,
+                        help='number of top RLIPP pathways to report')
+    pipeline.add_output_arguments(parser)
+    pipeline.add_engine_arguments(parser)
+    return parser.parse_args(args)
+
+
+def main(args):
+    """
+    Runs worker until interrupted
+
+    :param args: command line arguments usually :py:const:`sys.argv`
+    :return: 0 for success otherwise failure
+    :rtype: int
+    """
+    desc = """
+        Loads DrugCell reference data and predictor once and
+        runs tasks submitted by drugcellfindcellcmd.py over
+        a Unix socket
+    """
+    theargs = _parse_arguments(desc, args[1:])
+    config = pipeline.PipelineConfig(datadir=theargs.datadir,
+                                     predictscript=theargs.predictscript,
+                                     modelfile=theargs.modelfile,
+                                     fpcachefile=theargs.fpcache,
+                                     fpcachesize=theargs.fpcachesize,
+                                     engine=theargs.engine,
+                                     batchsize=theargs.batchsize,
+                                     intrathreads=theargs.intrathreads,
+                                     interthreads=theargs.interthreads,
+                                     genotypeformat=theargs.genotypeformat,
+                                     embeddingcache=theargs.embeddingcache,
+                                     rlippworkers=theargs.rlippworkers,
+                                     writehidden=theargs.writehidden,
+                                     compresshidden=theargs.compresshidden,
+                                     ensemble=cellquery.parse_list(
+                                         theargs.ensemble),
+                                     topn=theargs.topn,
+                                     outputschema=theargs.schema,
+                                     packauc=theargs.packauc,
+                                     gzipoutput=theargs.gzip)
+    if theargs.maxtasks > 1:
+        with executormod.TaskExecutor(
+                config, max_workers=theargs.maxtasks,
+                threads_per_task=theargs.threadspertask) as executor:
+            serve(DrugCellWorker(config, executor=executor,
+                                 max_batch=theargs.maxbatch,
+                                 max_wait=theargs.maxwait),
+                  socketpath=theargs.socket)
+        return 0
+
+    threads = theargs.threadspertask
+    if threads is None:
+        threads = executormod.default_threads_per_task(1)
+    executormod.set_thread_budget(threads)
+    serve(DrugCellWorker(config, max_batch=theargs.maxbatch,
+                         max_wait=theargs.maxwait),
+          socketpath=theargs.socket)
+    return 0
+
+
+if __name__ == '__main__':  # pragma: no cover
+    sys.exit(main(sys.argv))
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_benchmark
+----------------------------------
+
+Tests for `drugcellfindcell.benchmark` module.
+"""
+
+import os
+import sys
+import json
+import unittest
+import tempfile
+import shutil
+
+from drugcellfindcell import benchmark
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_run_benchmarks(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            data = benchmark.BenchmarkData(temp_dir, cells=20, terms=30,
+                                           genes=40, drugs=2)
+            res = benchmark.run_benchmarks(data, repeat=2)
+            self.assertEqual(sorted(b[0] for b in benchmark.BENCHMARKS),
+                             sorted(res['results']))
+            for name, r in res['results'].items():
+                self.assertEqual(2, len(r['seconds']))
+                self.assertEqual(min(r['seconds']), r['min'])
+            self.assertEqual(20, res['params']['cells'])
+
+            # results are JSON serializable
+            json.dumps(res)
+
+            try:
+                benchmark.run_benchmarks(data, names=['nope'])
+                self.fail('Expected ValueError')
+            except ValueError:
+                pass
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_compare_results(self):
+        params = {'cells': 1, 'terms': 1, 'genes': 1, 'drugs': 1}
+        baseline = {'params': params,
+                    'results': {'a': {'min': 1.0}, 'b': {'min': 1.0}}}
+        current = {'params': params,
+                   'results': {'a': {'min': 1.1}, 'b': {'min': 2.0},
+                               'c': {'min': 5.0}}}
+        res = benchmark.compare_results(baseline, current, tolerance=0.25)
+        self.assertEqual(1, len(res))
+        self.assertEqual('b', res[0]['name'])
+        self.assertEqual(2.0, res[0]['ratio'])
+
+        other = {'params': dict(params, cells=2), 'results': {}}
+        try:
+            benchmark.compare_results(baseline, other)
+            self.fail('Expected ValueError')
+        except ValueError:
+            pass
+
+    def test_main(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            outfile = os.path.join(temp_dir, 'res.json')
+            args = ['benchmark.py', '--cells', '10', '--terms', '10',
+                    '--genes', '20', '--repeat', '1', '--only',
+                    'rlipp_top,generate_output', '--output', outfile]
+            self.assertEqual(0, benchmark.main(args))
+            with open(outfile, 'r') as f:
+                res = json.load(f)
+            self.assertEqual(['generate_output', 'rlipp_top'],
+                             sorted(res['results']))
+            self.assertEqual(0, benchmark.main(args + [
+                '--compare', outfile, '--tolerance', '1000']))
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
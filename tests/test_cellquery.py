@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_cellquery
+----------------------------------
+
+Tests for `drugcellfindcell.cellquery` module.
+"""
+
+import sys
+import unittest
+
+from drugcellfindcell import cellquery
+
+
+class TestCellQuery(unittest.TestCase):
+
+    def setUp(self):
+        self.cells = ['a', 'b', 'c', 'd']
+        self.cell2genes = {'a': 'TP53', 'b': 'KRAS,TP53', 'c': '',
+                           'd': 'KRAS'}
+
+    def tearDown(self):
+        pass
+
+    def test_parse_list(self):
+        self.assertEqual(None, cellquery.parse_list(None))
+        self.assertEqual(['a', 'b'], cellquery.parse_list(' a, b,,'))
+
+    def test_select_cells(self):
+        self.assertEqual(self.cells, cellquery.select_cells(
+            self.cells, self.cell2genes))
+        self.assertEqual(['b', 'd'], cellquery.select_cells(
+            self.cells, self.cell2genes, cells=['d', 'b']))
+        self.assertEqual(['b', 'd'], cellquery.select_cells(
+            self.cells, self.cell2genes, mutations=['KRAS']))
+        self.assertEqual(['a'], cellquery.select_cells(
+            self.cells, self.cell2genes, cells=['a', 'c', 'd'],
+            mutations=['TP53', 'BRAF']))
+        try:
+            cellquery.select_cells(self.cells, self.cell2genes,
+                                   cells=['a', 'x'])
+            self.fail('Expected ValueError')
+        except ValueError as e:
+            self.assertTrue('Unknown cells: x' in str(e))
+        try:
+            cellquery.select_cells(self.cells, self.cell2genes,
+                                   mutations=['BRAF'])
+            self.fail('Expected ValueError')
+        except ValueError:
+            pass
+
+    def test_select_cells_without_mutation_entry(self):
+        cell2genes = {c: g for c, g in self.cell2genes.items() if c != 'b'}
+        self.assertEqual(['d'], cellquery.select_cells(
+            self.cells, cell2genes, mutations=['KRAS']))
+        self.assertEqual(['b'], cellquery.select_cells(
+            self.cells, cell2genes, cells=['b']))
+
+    def test_top_sensitive(self):
+        preds = [{'cell': c, 'predicted_AUC': auc}
+                 for c, auc in [('a', 0.5), ('b', 0.2), ('c', 0.5),
+                                ('d', 0.9)]]
+        self.assertEqual(['b', 'a', 'c'],
+                         [p['cell'] for p in
+                          cellquery.top_sensitive(preds, 3)])
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
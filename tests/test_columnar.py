@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_columnar
+----------------------------------
+
+Tests for `drugcellfindcell.columnar` module.
+"""
+
+import os
+import sys
+import unittest
+import tempfile
+import shutil
+
+import numpy as np
+
+from drugcellfindcell import columnar
+
+
+class TestColumnar(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_write_and_read(self):
+        columndir = os.path.join(self.temp_dir, 'cols')
+        self.assertFalse(columnar.is_columnar(columndir))
+        columnar.write_input(columndir, ['CCO', 'CCN'], ['a', 'b', 'c'])
+        self.assertTrue(columnar.is_columnar(columndir))
+
+        predictfile = os.path.join(self.temp_dir, 'drugcell.predict')
+        with open(predictfile, 'w') as f:
+            for i in range(6):
+                f.write('%f\n' % (i / 10.0))
+        columnar.write_predictions(columndir,
+                                   columnar.read_predict_file(predictfile))
+
+        cols = columnar.PredictionColumns(columndir)
+        self.assertEqual(6, len(cols))
+        self.assertEqual(['a', 'b', 'c'], cols.cells)
+        self.assertEqual(['CCO', 'CCN'], cols.drugs)
+        self.assertEqual([0, 1, 2, 0, 1, 2], cols.cell_index.tolist())
+        self.assertEqual([0, 0, 0, 1, 1, 1], cols.drug_index.tolist())
+        groups = [(d, rows.tolist()) for d, rows in cols.drug_rows()]
+        self.assertEqual([(0, [0, 1, 2]), (1, [3, 4, 5])], groups)
+        self.assertAlmostEqual(0.4, cols.predicted[4])
+
+    def test_write_predictions_wrong_count(self):
+        columnar.write_input(self.temp_dir, ['CCO'], ['a', 'b'])
+        try:
+            columnar.write_predictions(self.temp_dir, np.zeros(3))
+            self.fail('Expected ValueError')
+        except ValueError as e:
+            self.assertTrue('3 predictions for 2 rows' in str(e))
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
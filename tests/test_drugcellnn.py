@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_drugcellnn
+----------------------------------
+
+Tests for `drugcellfindcell.drugcellnn` module.
+"""
+
+import os
+import sys
+import unittest
+import tempfile
+import shutil
+
+import torch
+
+from drugcellfindcell import drugcellnn
+
+
+class TestDrugCellNN(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def _write_ontology(self, ontfile):
+        with open(ontfile, 'w') as f:
+            f.write('root\tA\tdefault\n')
+            f.write('root\tB\tdefault\n')
+            f.write('A\tg0\tgene\n')
+            f.write('A\tg1\tgene\n')
+            f.write('B\tg2\tgene\n')
+            f.write('root\tg3\tgene\n')
+            f.write('B\tunknown\tgene\n')
+
+    def test_load_ontology(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            ontfile = os.path.join(temp_dir, 'ont.txt')
+            self._write_ontology(ontfile)
+            gene2id = {'g0': 0, 'g1': 1, 'g2': 2, 'g3': 3}
+            children, direct, root = drugcellnn.load_ontology(ontfile,
+                                                              gene2id)
+            self.assertEqual('root', root)
+            self.assertEqual(['A', 'B'], children['root'])
+            self.assertEqual([], children['A'])
+            self.assertEqual({0, 1}, direct['A'])
+            self.assertEqual({2}, direct['B'])
+
+            with open(ontfile, 'a') as f:
+                f.write('other\tg0\tgene\n')
+            try:
+                drugcellnn.load_ontology(ontfile, gene2id)
+                self.fail('Expected ValueError')
+            except ValueError:
+                pass
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_forward_and_load_model(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            children = {'root': ['A', 'B'], 'A': [], 'B': []}
+            direct = {'A': {0, 1}, 'B': {2}, 'root': {3}}
+            torch.manual_seed(0)
+            model = drugcellnn.drugcell_nn(children, direct, 4, 8, 'root',
+                                           num_hiddens_genotype=3,
+                                           num_hiddens_drug=[5, 2],
+                                           num_hiddens_final=2)
+            model.eval()
+            self.assertEqual([['A', 'B'], ['root']], model.term_layer_list)
+
+            x = torch.rand(6, 12)
+            with torch.no_grad():
+                aux_out_map, term_nn_out_map = model(x)
+            self.assertEqual((6, 1), tuple(aux_out_map['final'].shape))
+            self.assertEqual((6, 3), tuple(term_nn_out_map['root'].shape))
+            self.assertEqual((6, 2), tuple(term_nn_out_map['drug_2'].shape))
+
+            modelfile = os.path.join(temp_dir, 'model.pt')
+            torch.save(model, modelfile)
+            loaded = drugcellnn.load_model(modelfile)
+            self.assertFalse(loaded.training)
+            with torch.no_grad():
+                self.assertTrue(torch.allclose(aux_out_map['final'],
+                                               loaded(x)[0]['final']))
+
+            # models pickled by the original code refer to drugcell_NN
+            self.assertIs(drugcellnn.drugcell_nn,
+                          sys.modules['drugcell_NN'].drugcell_nn)
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_embedcache
+----------------------------------
+
+Tests for `drugcellfindcell.embedcache` module.
+"""
+
+import os
+import sys
+import unittest
+import tempfile
+import shutil
+
+import numpy as np
+
+from drugcellfindcell import buildinput
+from drugcellfindcell import columnar
+from drugcellfindcell import embedcache
+from drugcellfindcell import inference
+from drugcellfindcell import synthdata
+
+
+class TestEmbedCache(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_cached_engine_matches(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            config = synthdata.generate_reference_data(
+                os.path.join(temp_dir, 'data'), cells=6, terms=5, genes=12,
+                mutations=3)
+            synthdata.generate_model(config, num_hiddens_drug=(4, 3))
+            cachedir = os.path.join(temp_dir, 'cache')
+            cells = [synthdata.cell_name(c) for c in [4, 0, 2]]
+            outdir = os.path.join(temp_dir, 'out')
+            os.makedirs(outdir)
+            inputfiles = buildinput.build_input(
+                synthdata.synthetic_smiles(2), cells, outdir)
+
+            plain = inference.InferenceEngine(config, batch_size=4)
+            predictfile, rlippfile = plain.predict(inputfiles, outdir)
+            self.assertIsNone(predictfile)
+            predictedfile = os.path.join(inputfiles['columns'],
+                                         columnar.PREDICTED_FILE)
+            expected = np.load(predictedfile)
+            with open(rlippfile, 'r') as f:
+                expected_rlipp = f.read()
+
+            cached = inference.InferenceEngine(config, batch_size=4,
+                                               embedding_cache=cachedir)
+            cached.predict(inputfiles, outdir)
+            self.assertIsNone(cached.genotype)
+            self.assertEqual(6, len(cached.embeddings))
+            self.assertTrue(np.allclose(expected, np.load(predictedfile),
+                                        atol=1e-3))
+            with open(rlippfile, 'r') as f:
+                self.assertEqual(expected_rlipp, f.read())
+
+            # entry is reused until genotype changes
+            self.assertEqual(1, len(os.listdir(cachedir)))
+            embedcache.main(['embedcache.py', cachedir, '--datadir',
+                             config.datadir])
+            self.assertEqual(1, len(os.listdir(cachedir)))
+            key = embedcache.cache_key(config)
+            with open(config.genotypefile, 'a') as f:
+                f.write('\n')
+            self.assertNotEqual(key, embedcache.cache_key(config))
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
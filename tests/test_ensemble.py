@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_ensemble
+----------------------------------
+
+Tests for `drugcellfindcell.ensemble` module.
+"""
+
+import os
+import sys
+import unittest
+import tempfile
+import shutil
+
+import numpy as np
+
+from drugcellfindcell import buildinput
+from drugcellfindcell import columnar
+from drugcellfindcell import ensemble
+from drugcellfindcell import inference
+from drugcellfindcell import pipeline
+from drugcellfindcell import synthdata
+
+
+def _read_rlipp(rlippfile):
+    with open(rlippfile, 'r') as f:
+        return {t: float(v) for t, v in
+                (line.rstrip('\n').split('\t') for line in f)}
+
+
+class TestEnsemble(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_predict(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            config = synthdata.generate_reference_data(
+                os.path.join(temp_dir, 'data'), cells=6, terms=4, genes=10,
+                mutations=3)
+            modelfiles = []
+            for seed in range(2):
+                config.modelfile = os.path.join(temp_dir,
+                                                'model' + str(seed) + '.pt')
+                synthdata.generate_model(config, num_hiddens_drug=(4, 3),
+                                         seed=seed)
+                modelfiles.append(config.modelfile)
+            config.engine = pipeline.NATIVE_ENGINE
+            config.batchsize = 4
+
+            cells = [synthdata.cell_name(c) for c in range(6)]
+            drugs = synthdata.synthetic_smiles(2)
+            outdir = os.path.join(temp_dir, 'out')
+            os.makedirs(outdir)
+            inputfiles = buildinput.build_input(drugs, cells, outdir)
+
+            single = []
+            single_rlipp = []
+            for m in modelfiles:
+                config.modelfile = m
+                predictfile, rlippfile = inference.InferenceEngine(
+                    config).predict(inputfiles, outdir)
+                single.append(np.load(os.path.join(
+                    inputfiles['columns'], columnar.PREDICTED_FILE)))
+                single_rlipp.append(_read_rlipp(rlippfile))
+
+            config.ensemble = modelfiles
+            predictor = pipeline.create_predictor(config)
+            self.assertIsInstance(predictor, ensemble.EnsemblePredictor)
+            with predictor:
+                predictfile, rlippfile = predictor.predict(inputfiles,
+                                                           outdir)
+                self.assertEqual(12, predictor.stats['cells'])
+                self.assertEqual(2, predictor.stats['models'])
+                # workers stay loaded between requests
+                predictor.predict(inputfiles, outdir)
+            self.assertEqual(None, predictfile)
+            mean = np.load(os.path.join(inputfiles['columns'],
+                                        columnar.PREDICTED_FILE))
+            self.assertTrue(np.allclose(np.mean(single, axis=0), mean))
+            std = np.load(os.path.join(inputfiles['columns'],
+                                       columnar.PREDICTED_STD_FILE))
+            self.assertTrue(np.allclose(np.std(single, axis=0), std,
+                                        atol=1e-4))
+            rlipp = _read_rlipp(rlippfile)
+            for t, v in rlipp.items():
+                self.assertAlmostEqual((single_rlipp[0][t] +
+                                        single_rlipp[1][t]) / 2, v,
+                                       places=4)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_run_pipeline(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            config = synthdata.generate_reference_data(
+                os.path.join(temp_dir, 'data'), cells=4, terms=3, genes=6,
+                mutations=2)
+            modelfiles = []
+            for seed in range(2):
+                config.modelfile = os.path.join(temp_dir,
+                                                'model' + str(seed) + '.pt')
+                synthdata.generate_model(config, num_hiddens_drug=(4, 3),
+                                         seed=seed)
+                modelfiles.append(config.modelfile)
+            config.engine = pipeline.NATIVE_ENGINE
+            config.ensemble = modelfiles
+            self.assertEqual(modelfiles, config.modelfiles)
+            outdir = os.path.join(temp_dir, 'out')
+            os.makedirs(outdir)
+            with pipeline.create_predictor(config) as predictor:
+                res = pipeline.run_pipeline('CCO', config=config,
+                                            outputdir=outdir,
+                                            predictor=predictor)
+            self.assertEqual(4, len(res['predictions']))
+            for p in res['predictions']:
+                self.assertTrue(p['predicted_AUC_std'] >= 0)
+
+            config.engine = pipeline.SCRIPT_ENGINE
+            try:
+                pipeline.create_predictor(config)
+                self.fail('Expected ValueError')
+            except ValueError:
+                pass
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_rlipp_workers(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            config = synthdata.generate_reference_data(
+                os.path.join(temp_dir, 'data'), cells=4, terms=4, genes=6,
+                mutations=2)
+            modelfiles = []
+            for seed in range(2):
+                config.modelfile = os.path.join(temp_dir,
+                                                'model' + str(seed) + '.pt')
+                synthdata.generate_model(config, num_hiddens_drug=(4, 3),
+                                         seed=seed)
+                modelfiles.append(config.modelfile)
+            config.engine = pipeline.NATIVE_ENGINE
+            config.ensemble = modelfiles
+            outdir = os.path.join(temp_dir, 'out')
+            os.makedirs(outdir)
+            expected = pipeline.run_pipeline('CCO', config=config,
+                                             outputdir=outdir)
+
+            # each model worker starts its own RLIPP pool
+            config.rlippworkers = 2
+            with pipeline.create_predictor(config) as predictor:
+                res = pipeline.run_pipeline('CCO', config=config,
+                                            outputdir=outdir,
+                                            predictor=predictor)
+            self.assertEqual(len(expected['top_pathways']),
+                             len(res['top_pathways']))
+            for e, r in zip(expected['top_pathways'], res['top_pathways']):
+                self.assertAlmostEqual(float(e['RLIPP']), float(r['RLIPP']),
+                                       places=4)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_load_bad_model(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            config = synthdata.generate_reference_data(
+                os.path.join(temp_dir, 'data'), cells=3, terms=2, genes=4,
+                mutations=1)
+            predictor = ensemble.EnsemblePredictor(
+                config, modelfiles=[os.path.join(temp_dir, 'missing.pt')])
+            try:
+                predictor.load()
+                self.fail('Expected ValueError')
+            except ValueError as e:
+                self.assertTrue('missing.pt' in str(e))
+            try:
+                ensemble.EnsemblePredictor(config, modelfiles=[])
+                self.fail('Expected ValueError')
+            except ValueError:
+                pass
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_executor
+----------------------------------
+
+Tests for `drugcellfindcell.executor` module.
+"""
+
+import os
+import sys
+import unittest
+import tempfile
+import shutil
+
+from drugcellfindcell import pipeline
+from drugcellfindcell import executor
+from tests.test_pipeline import FakePredictor
+from tests.test_pipeline import _write_reference_data
+
+
+def _fake_predictor(config):
+    return FakePredictor()
+
+
+class TestExecutor(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_task_dir(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            path = executor.task_dir(temp_dir, 'abc-123')
+            self.assertEqual(os.path.join(temp_dir, 'abc-123'), path)
+            self.assertTrue(os.path.isdir(path))
+
+            # same task id gives same directory
+            self.assertEqual(path, executor.task_dir(temp_dir, 'abc-123'))
+
+            path = executor.task_dir(temp_dir, '../x/y')
+            self.assertEqual(os.path.join(temp_dir, '_x_y'), path)
+
+            try:
+                executor.task_dir(temp_dir, '..')
+                self.fail('Expected ValueError')
+            except ValueError:
+                pass
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_default_threads_per_task(self):
+        self.assertEqual(max(1, os.cpu_count() or 1),
+                         executor.default_threads_per_task(1))
+        self.assertEqual(1, executor.default_threads_per_task(100000))
+
+    def test_run_tasks_concurrently(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            datadir = os.path.join(temp_dir, 'data')
+            os.makedirs(datadir)
+            _write_reference_data(datadir)
+            config = pipeline.PipelineConfig(datadir=datadir)
+            with executor.TaskExecutor(
+                    config, max_workers=2, threads_per_task=1,
+                    predictor_factory=_fake_predictor) as pool:
+                futures = []
+                for i in range(3):
+                    outdir = executor.task_dir(temp_dir, 'task%d' % i)
+                    futures.append((outdir, pool.submit(
+                        {'smiles': 'CCO', 'outputdir': outdir})))
+                for outdir, f in futures:
+                    res = f.result(timeout=60)
+                    self.assertEqual(3, len(res['predictions']))
+                    self.assertTrue(os.path.isfile(os.path.join(
+                        outdir, 'output.json')))
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_featurize
+----------------------------------
+
+Tests for `drugcellfindcell.featurize` module.
+"""
+
+import os
+import sys
+import unittest
+import tempfile
+import shutil
+
+from drugcellfindcell import buildinput
+from drugcellfindcell import fingerprintio
+from drugcellfindcell import featurize
+
+
+class TestFeaturize(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_read_chunks(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            tfile = os.path.join(temp_dir, 'lib.smi')
+            with open(tfile, 'w') as f:
+                f.write('CCO\tethanol\n\nCCN\nCCC\tpropane\n')
+            self.assertEqual(3, featurize.count_smiles(tfile))
+            res = list(featurize.read_chunks(tfile, chunksize=2))
+            self.assertEqual([(0, [('ethanol', 'CCO'), ('1', 'CCN')]),
+                              (2, [('propane', 'CCC')])], res)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_featurize_library(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            smiles = ['CCO', 'c1ccccc1', 'bogus', 'CC(=O)O', 'CCN']
+            tfile = os.path.join(temp_dir, 'lib.smi')
+            with open(tfile, 'w') as f:
+                for s in smiles:
+                    f.write(s + '\n')
+            outfile = os.path.join(temp_dir, 'lib.npy')
+            res = featurize.featurize_library(tfile, outfile, processes=2,
+                                              chunksize=2)
+            self.assertEqual({'total': 5, 'invalid': 1}, res)
+
+            fps = fingerprintio.load_fingerprints(outfile)
+            self.assertEqual((5, 2048), fps.shape)
+            for i, s in enumerate(smiles):
+                if s == 'bogus':
+                    self.assertEqual(0, fps[i].sum())
+                    continue
+                self.assertEqual(buildinput.morgan_fingerprint(s),
+                                 fps[i].astype(int).tolist())
+
+            with open(outfile + featurize.INDEX_SUFFIX, 'r') as f:
+                self.assertEqual('2\t2\tbogus\n', f.readlines()[2])
+            with open(outfile + featurize.INVALID_SUFFIX, 'r') as f:
+                self.assertEqual('2\t2\tbogus\n', f.read())
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_fingerprint
+----------------------------------
+
+Tests for `drugcellfindcell.fingerprint` module.
+"""
+
+import sys
+import json
+import unittest
+import subprocess
+from unittest.mock import patch
+
+from drugcellfindcell import fingerprint
+
+# seconds a fresh interpreter may take to import the command line
+# entry points, generous so a loaded machine does not fail the test
+IMPORT_BUDGET = 3.0
+
+# modules a task only needs once it predicts or fingerprints
+HEAVY_MODULES = ['torch', 'rdkit', 'matplotlib']
+
+LIGHT_MODULES = ['drugcellfindcell.drugcellfindcellcmd',
+                 'drugcellfindcell.pipeline',
+                 'drugcellfindcell.worker',
+                 'drugcellfindcell.buildinput',
+                 'drugcellfindcell.fpcache',
+                 'drugcellfindcell.resultcache',
+                 'drugcellfindcell.simindex',
+                 'drugcellfindcell.embedcache',
+                 'drugcellfindcell.ensemble']
+
+_IMPORT_SCRIPT = """
+import sys
+import json
+import time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed,
+                   'heavy': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def _import_in_fresh_process(module):
+    out = subprocess.check_output(
+        [sys.executable, '-c', _IMPORT_SCRIPT.format(module=module,
+                                                     heavy=HEAVY_MODULES)])
+    return json.loads(out.decode('utf-8'))
+
+
+class TestFingerprint(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_same_bits_as_similarity_maps(self):
+        from rdkit.Chem import rdMolDescriptors
+        for s in ['CCO', 'CC(=O)Oc1ccccc1C(=O)O', 'CN1CCC[C@H]1c2cccnc2']:
+            mol = fingerprint.parse_smiles(s)
+            # what SimilarityMaps.GetMorganFingerprint(fpType='bv') calls
+            expected = list(rdMolDescriptors.GetMorganFingerprintAsBitVect(
+                mol, 2, nBits=2048))
+            self.assertEqual(expected, fingerprint.morgan_fingerprint(s))
+            with patch.object(fingerprint, '_generator',
+                              return_value=None):
+                self.assertEqual(expected, fingerprint.mol_fingerprint(mol))
+
+    def test_other_settings(self):
+        bits = fingerprint.morgan_fingerprint('c1ccccc1O', radius=1,
+                                              nbits=64)
+        self.assertEqual(64, len(bits))
+        self.assertTrue(0 < sum(bits) < 64)
+
+    def test_parse_smiles(self):
+        self.assertEqual('CCO', fingerprint.canonical_smiles(
+            fingerprint.parse_smiles('OCC')))
+        try:
+            fingerprint.parse_smiles('notasmiles(')
+            self.fail('Expected ValueError')
+        except ValueError as e:
+            self.assertTrue('notasmiles(' in str(e))
+
+    def test_import_budget(self):
+        for module in LIGHT_MODULES:
+            res = _import_in_fresh_process(module)
+            self.assertEqual([], res['heavy'], module)
+            self.assertLess(res['seconds'], IMPORT_BUDGET, module)
+
+
+if __name__ == '__main__':
+    unittest.main()
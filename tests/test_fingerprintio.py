@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_fingerprintio
+----------------------------------
+
+Tests for `drugcellfindcell.fingerprintio` module.
+"""
+
+import os
+import sys
+import unittest
+import tempfile
+import shutil
+
+import numpy as np
+
+from drugcellfindcell import fingerprintio
+
+
+class TestFingerprintio(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_get_format(self):
+        self.assertEqual(fingerprintio.NPY_FORMAT,
+                         fingerprintio.get_format('/a/fp.npy'))
+        self.assertEqual(fingerprintio.TEXT_FORMAT,
+                         fingerprintio.get_format('/a/fp.txt'))
+
+    def test_write_read_both_formats(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            rng = np.random.RandomState(1)
+            fps = rng.randint(0, 2, size=(3, 64)).tolist()
+            textfile = os.path.join(temp_dir, 'fp.txt')
+            npyfile = os.path.join(temp_dir, 'fp.npy')
+            fingerprintio.write_fingerprints(textfile, fps)
+            fingerprintio.write_fingerprints(npyfile, fps,
+                                             fmt=fingerprintio.NPY_FORMAT)
+            with open(textfile, 'r') as f:
+                self.assertEqual(','.join(map(str, fps[0])),
+                                 f.readline().strip())
+
+            packed = fingerprintio.load_packed(npyfile)
+            self.assertEqual((3, 8), packed.shape)
+            self.assertEqual(np.uint8, packed.dtype)
+
+            for fname in [textfile, npyfile]:
+                res = fingerprintio.load_fingerprints(fname)
+                self.assertEqual(np.float32, res.dtype)
+                self.assertTrue(np.array_equal(np.array(fps), res))
+            self.assertTrue(np.array_equal(
+                np.array(fps)[[2, 0]],
+                fingerprintio.unpack(packed, rows=[2, 0])))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_write_unknown_format(self):
+        try:
+            fingerprintio.write_fingerprints('/x', [[0]], fmt='foo')
+            self.fail('Expected ValueError')
+        except ValueError as e:
+            self.assertEqual('Unknown fingerprint format: foo', str(e))
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_fpcache
+----------------------------------
+
+Tests for `drugcellfindcell.fpcache` module.
+"""
+
+import os
+import sys
+import unittest
+import tempfile
+import shutil
+from unittest.mock import patch
+
+from drugcellfindcell import buildinput
+from drugcellfindcell import fingerprint
+from drugcellfindcell import fpcache
+
+
+class TestFingerprintCache(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_pack_unpack_bits(self):
+        bits = [0] * 16
+        bits[0] = 1
+        bits[15] = 1
+        packed = fpcache.pack_bits(bits)
+        self.assertEqual(b'\x80\x01', packed)
+        self.assertEqual(bits, fpcache.unpack_bits(packed, 16))
+        self.assertEqual([0] * 8, fpcache.unpack_bits(
+            fpcache.pack_bits([0] * 8), 8))
+
+    def test_packed_items(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            dbfile = os.path.join(temp_dir, 'fp.db')
+            with fpcache.FingerprintCache(dbfile) as cache:
+                self.assertEqual([], cache.packed_items())
+                fp = cache.get('OCC')
+                cache.get('CCO')
+                items = cache.packed_items()
+                self.assertEqual(1, len(items))
+                self.assertEqual('CCO', items[0][0])
+                self.assertEqual(fp, fpcache.unpack_bits(
+                    items[0][1], buildinput.FINGERPRINT_BITS))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_get_hit_and_miss(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            dbfile = os.path.join(temp_dir, 'fp.db')
+            with fpcache.FingerprintCache(dbfile) as cache:
+                fp = cache.get('OCC')
+                self.assertEqual(buildinput.morgan_fingerprint('OCC'), fp)
+
+                # same canonical SMILES written differently
+                self.assertEqual(fp, cache.get('CCO'))
+                self.assertEqual(1, cache.misses)
+                self.assertEqual(1, cache.hits)
+
+            # repeat SMILES does not touch RDKit
+            with fpcache.FingerprintCache(dbfile) as cache:
+                with patch.object(fingerprint, 'parse_smiles') as parse:
+                    self.assertEqual(fp, cache.get('CCO'))
+                    self.assertEqual(0, parse.call_count)
+                stats = cache.stats()
+                self.assertEqual(1, stats['hits'])
+                self.assertEqual(0, stats['misses'])
+                self.assertEqual(2, stats['total_hits'])
+                self.assertEqual(1, stats['total_misses'])
+                self.assertEqual(1, stats['entries'])
+
+            # different fingerprint parameters are separate entries
+            with fpcache.FingerprintCache(dbfile, nbits=1024) as cache:
+                self.assertEqual(1024, len(cache.get('CCO')))
+                self.assertEqual(1, cache.misses)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_lru_eviction(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            dbfile = os.path.join(temp_dir, 'fp.db')
+            with fpcache.FingerprintCache(dbfile, max_entries=2) as cache:
+                cache.get('CCO')
+                cache.get('CCN')
+                cache.get('CCO')
+                cache.get('CCC')
+                self.assertEqual(2, cache.stats()['entries'])
+                self.assertEqual(3, cache.misses)
+                cache.get('CCO')
+                self.assertEqual(3, cache.misses)
+                cache.get('CCN')
+                self.assertEqual(4, cache.misses)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_get_invalid_smiles(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            dbfile = os.path.join(temp_dir, 'fp.db')
+            with fpcache.FingerprintCache(dbfile) as cache:
+                try:
+                    cache.get('not a smiles')
+                    self.fail('Expected ValueError')
+                except ValueError:
+                    pass
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_generateoutput
+----------------------------------
+
+Tests for `drugcellfindcell.generateoutput` module.
+"""
+
+import os
+import sys
+import gzip
+import json
+import unittest
+import tempfile
+import shutil
+
+import numpy as np
+
+from drugcellfindcell import columnar
+from drugcellfindcell import generateoutput
+
+
+class TestGenerateOutput(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.cell2genes = {'a': 'TP53', 'b': 'KRAS,TP53', 'c': ''}
+        self.go2name = {}
+        self.go2gene = {}
+        self.rlippfile = os.path.join(self.temp_dir, 'rlipp.txt')
+        with open(self.rlippfile, 'w') as f:
+            for t in range(12):
+                term = 'GO:%d' % t
+                self.go2name[term] = 'name%d' % t
+                self.go2gene[term] = 'G%d' % t
+                f.write('%s\t%f\n' % (term, (t * 7) % 12))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _write_input(self, drugs):
+        inputfile = os.path.join(self.temp_dir, 'output.txt')
+        with open(inputfile, 'w') as f:
+            for i, d in enumerate(drugs):
+                for j, c in enumerate(['a', 'b', 'c']):
+                    f.write('%s\t%s\t-1\t%f\n' % (c, d, i + j / 10.0))
+        return inputfile
+
+    def _generate(self, inputfile, **kwargs):
+        res = generateoutput.generate_output(inputfile, self.rlippfile,
+                                             self.cell2genes, self.go2name,
+                                             self.go2gene, **kwargs)
+        with open(inputfile.replace('.txt', '.json'), 'r') as f:
+            return res, json.load(f)
+
+    def test_get_top_pathways(self):
+        res = generateoutput.get_top_pathways(self.rlippfile, self.go2name,
+                                              self.go2gene, top_n=3)
+        self.assertEqual(['GO:5', 'GO:10', 'GO:3'],
+                         [p['GO_id'] for p in res])
+        self.assertEqual({'GO_id': 'GO:5', 'pathway_name': 'name5',
+                          'RLIPP': '11.000000', 'pathway_genes': 'G5'},
+                         res[0])
+        sortedfile = os.path.join(self.temp_dir, 'rlipp_sorted.txt')
+        self.assertFalse(os.path.isfile(sortedfile))
+
+        res = generateoutput.get_top_pathways(self.rlippfile, self.go2name,
+                                              self.go2gene, min_rlipp=10.5,
+                                              write_sorted=True)
+        self.assertEqual(['GO:5'], [p['GO_id'] for p in res])
+        with open(sortedfile, 'r') as f:
+            self.assertEqual(12, len(f.readlines()))
+
+    def test_generate_output_single_drug(self):
+        res, written = self._generate(self._write_input(['CCO']))
+        self.assertEqual(res, written)
+        self.assertEqual(3, len(res['predictions']))
+        self.assertEqual({'cell': 'b', 'predicted_AUC': 0.1,
+                          'mutations': 'KRAS,TP53'}, res['predictions'][1])
+
+    def test_generate_output_stream_matches(self):
+        for drugs in [['CCO'], ['CCO', 'CCN', 'CCC'], []]:
+            for compact in [False, True]:
+                inputfile = self._write_input(drugs)
+                res, expected = self._generate(inputfile)
+                res, written = self._generate(inputfile, stream=True,
+                                              compact=compact)
+                self.assertEqual(expected, written)
+                self.assertEqual(3 * len(drugs), res['rows'])
+                self.assertTrue(generateoutput.is_streamed(res))
+                self.assertFalse(generateoutput.is_streamed(expected))
+                self.assertEqual(expected['top_pathways'],
+                                 res['top_pathways'])
+
+    def test_generate_output_columns_matches(self):
+        for drugs in [['CCO'], ['CCO', 'CCN', 'CCC']]:
+            for stream in [False, True]:
+                inputfile = self._write_input(drugs)
+                res, expected = self._generate(inputfile)
+                columndir = os.path.join(self.temp_dir,
+                                         columnar.COLUMNS_DIR)
+                columnar.write_input(columndir, drugs, ['a', 'b', 'c'])
+                columnar.write_predictions(
+                    columndir, [i + j / 10.0 for i in range(len(drugs))
+                                for j in range(3)])
+                generateoutput.generate_output(columndir, self.rlippfile,
+                                               self.cell2genes,
+                                               self.go2name, self.go2gene,
+                                               stream=stream)
+                with open(os.path.join(self.temp_dir, 'output.json')) as f:
+                    self.assertEqual(expected, json.load(f))
+
+    def test_generate_output_top_k(self):
+        drugs = ['CCO', 'CCN']
+        inputfile = os.path.join(self.temp_dir, 'output.txt')
+        aucs = [0.5, 0.2, 0.9, 0.7, 0.8, 0.1]
+        with open(inputfile, 'w') as f:
+            for i, d in enumerate(drugs):
+                for j, c in enumerate(['a', 'b', 'c']):
+                    f.write('%s\t%s\t-1\t%f\n' % (c, d, aucs[i * 3 + j]))
+        columndir = os.path.join(self.temp_dir, columnar.COLUMNS_DIR)
+        columnar.write_input(columndir, drugs, ['a', 'b', 'c'])
+        columnar.write_predictions(columndir, aucs)
+        for path in [inputfile, columndir]:
+            for stream in [False, True]:
+                generateoutput.generate_output(path, self.rlippfile,
+                                               self.cell2genes,
+                                               self.go2name, self.go2gene,
+                                               stream=stream, top_k=2)
+                with open(os.path.join(self.temp_dir, 'output.json')) as f:
+                    res = json.load(f)
+                self.assertEqual([['b', 'a'], ['c', 'a']],
+                                 [[p['cell'] for p in d['predictions']]
+                                  for d in res['drugs']])
+
+    def test_generate_output_compact(self):
+        inputfile = self._write_input(['CCO', 'CCN'])
+        res, written = self._generate(inputfile, compact=True)
+        self.assertEqual(['CCO', 'CCN'],
+                         [d['smiles'] for d in written['drugs']])
+        with open(inputfile.replace('.txt', '.json'), 'r') as f:
+            self.assertFalse(' ' in f.read().replace('KRAS,TP53', ''))
+
+    def test_generate_output_ensemble_std(self):
+        columndir = os.path.join(self.temp_dir, columnar.COLUMNS_DIR)
+        columnar.write_input(columndir, ['CCO'], ['a', 'b', 'c'])
+        columnar.write_predictions(columndir, [0.5, 0.2, 0.9])
+        columnar.write_predictions(columndir, [0.01, 0.02, 0.03],
+                                   filename=columnar.PREDICTED_STD_FILE)
+        res = generateoutput.generate_output(columndir, self.rlippfile,
+                                             self.cell2genes, self.go2name,
+                                             self.go2gene)
+        self.assertEqual({'cell': 'b', 'predicted_AUC': 0.2,
+                          'predicted_AUC_std': 0.02,
+                          'mutations': 'KRAS,TP53'}, res['predictions'][1])
+
+    def test_normalize_output(self):
+        for drugs in [['CCO'], ['CCO', 'CCN', 'CCC'], []]:
+            inputfile = self._write_input(drugs)
+            res, verbose = self._generate(inputfile)
+            smiles = drugs[0] if drugs else None
+            norm = generateoutput.normalize_output(verbose, smiles=smiles)
+            self.assertEqual(generateoutput.NORMALIZED_SCHEMA,
+                             norm['schema'])
+            self.assertEqual(verbose['top_pathways'], norm['top_pathways'])
+            self.assertEqual(drugs, [d['smiles'] for d in norm['drugs']])
+            if drugs:
+                self.assertEqual([{'cell': 'a', 'mutations': 'TP53'},
+                                  {'cell': 'b', 'mutations': 'KRAS,TP53'},
+                                  {'cell': 'c', 'mutations': ''}],
+                                 norm['cells'])
+                self.assertEqual([0, 1, 2], norm['drugs'][-1]['cell_index'])
+            self.assertEqual(verbose, generateoutput.expand_output(norm))
+
+            packed = generateoutput.normalize_output(verbose, pack=True,
+                                                     smiles=smiles)
+            self.assertEqual(generateoutput.PACKED_AUC_ENCODING,
+                             packed['auc_encoding'])
+            expanded = generateoutput.expand_output(packed)
+            # packed AUC are float32
+            self.assertEqual(_cells(verbose), _cells(expanded))
+            self.assertTrue(np.allclose(_aucs(verbose), _aucs(expanded)))
+
+    def test_pack_values(self):
+        packed = generateoutput.pack_values([0.5, 1.25, -2.0])
+        self.assertEqual(16, len(packed))
+        self.assertEqual([0.5, 1.25, -2.0],
+                         generateoutput.unpack_values(packed))
+        self.assertEqual([], generateoutput.unpack_values(
+            generateoutput.pack_values([])))
+
+    def test_generate_output_normalized_gzip(self):
+        inputfile = self._write_input(['CCO', 'CCN'])
+        res, expected = self._generate(inputfile)
+        jsonfile = inputfile.replace('.txt', '.json')
+        for stream in [False, True]:
+            res = generateoutput.generate_output(
+                inputfile, self.rlippfile, self.cell2genes, self.go2name,
+                self.go2gene, stream=stream,
+                schema=generateoutput.NORMALIZED_SCHEMA, compress=True)
+            with gzip.open(jsonfile + generateoutput.GZIP_SUFFIX, 'rt') as f:
+                written = json.load(f)
+            self.assertEqual(2, len(written['drugs']))
+            self.assertEqual(3, len(written['cells']))
+            self.assertEqual(expected, generateoutput.expand_output(written))
+            self.assertEqual(expected, res)
+
+        # verbose output can be streamed compressed
+        generateoutput.generate_output(inputfile, self.rlippfile,
+                                       self.cell2genes, self.go2name,
+                                       self.go2gene, stream=True,
+                                       compress=True)
+        with gzip.open(jsonfile + generateoutput.GZIP_SUFFIX, 'rt') as f:
+            self.assertEqual(expected, json.load(f))
+
+        try:
+            generateoutput.generate_output(inputfile, self.rlippfile,
+                                           self.cell2genes, self.go2name,
+                                           self.go2gene, schema='bogus')
+            self.fail('Expected ValueError')
+        except ValueError:
+            pass
+
+
+def _predictions(result):
+    if 'drugs' in result:
+        return [p for d in result['drugs'] for p in d['predictions']]
+    return result['predictions']
+
+
+def _cells(result):
+    return [p['cell'] for p in _predictions(result)]
+
+
+def _aucs(result):
+    return [p['predicted_AUC'] for p in _predictions(result)]
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_genotype
+----------------------------------
+
+Tests for `drugcellfindcell.genotype` module.
+"""
+
+import os
+import sys
+import unittest
+import tempfile
+import shutil
+
+import numpy as np
+
+from drugcellfindcell import genotype
+from drugcellfindcell import snapshot
+from drugcellfindcell import synthdata
+
+
+def _cell_names(config):
+    with open(config.cell2idfile, 'r') as f:
+        return [line.rstrip('\n').split('\t')[1] for line in f]
+
+
+class TestGenotype(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_dense(self):
+        geno = genotype.SparseGenotype([0, 2, 2, 3], [1, 3, 0], 4)
+        self.assertEqual(3, len(geno))
+        self.assertEqual(3, geno.nnz)
+        self.assertEqual([1, 3], geno.row(0).tolist())
+        res = geno.dense([2, 0, 1, 0])
+        self.assertEqual(np.float32, res.dtype)
+        self.assertEqual([[1, 0, 0, 0], [0, 1, 0, 1], [0, 0, 0, 0],
+                          [0, 1, 0, 1]], res.tolist())
+        self.assertEqual((2, 4), geno.dense([1, 1]).shape)
+
+    def test_read_dense_slow_path(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            genofile = os.path.join(temp_dir, 'geno.txt')
+            with open(genofile, 'w') as f:
+                f.write('0,1.0,0\n')
+                f.write('1,0,1\n')
+            geno = genotype.read_dense(genofile)
+            self.assertEqual(3, geno.ngenes)
+            self.assertEqual([[0, 1, 0], [1, 0, 1]],
+                             geno.dense([0, 1]).tolist())
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_formats_agree(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            config = synthdata.generate_reference_data(
+                temp_dir, cells=9, terms=4, genes=15, mutations=4)
+            expected = np.loadtxt(config.genotypefile, delimiter=',',
+                                  dtype=np.float32)
+            rows = np.arange(9)
+
+            dense = genotype.load_genotype(config,
+                                           fmt=genotype.DENSE_FORMAT)
+            self.assertEqual(36, dense.nnz)
+            self.assertTrue(np.array_equal(expected, dense.dense(rows)))
+
+            fromlist = genotype.load_genotype(config)
+            self.assertTrue(np.array_equal(expected, fromlist.dense(rows)))
+
+            snapshot.build_snapshot(config, config.snapshotfile)
+            fromsnap = genotype.load_genotype(config)
+            self.assertTrue(np.array_equal(expected, fromsnap.dense(rows)))
+
+            try:
+                genotype.load_genotype(config, fmt='nope')
+                self.fail('Expected ValueError')
+            except ValueError:
+                pass
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_sparse_follows_dense_file(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            config = synthdata.generate_reference_data(
+                temp_dir, cells=5, terms=3, genes=8, mutations=2)
+            expected = np.loadtxt(config.genotypefile, delimiter=',',
+                                  dtype=np.float32)
+            # mutation list that disagrees with the model's genotype
+            with open(config.cell2mutationfile, 'w') as f:
+                for cell in _cell_names(config):
+                    f.write(cell + '\t\n')
+            rows = np.arange(5)
+            geno = genotype.load_genotype(config)
+            self.assertTrue(np.array_equal(expected, geno.dense(rows)))
+
+            snapshot.build_snapshot(config, config.snapshotfile)
+            geno = genotype.load_genotype(config)
+            self.assertTrue(np.array_equal(expected, geno.dense(rows)))
+
+            # a changed genotype file makes the snapshot stale
+            expected[0] = 1 - expected[0]
+            np.savetxt(config.genotypefile, expected, fmt='%d',
+                       delimiter=',')
+            geno = genotype.load_genotype(config)
+            self.assertTrue(np.array_equal(expected, geno.dense(rows)))
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
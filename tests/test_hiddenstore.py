@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_hiddenstore
+----------------------------------
+
+Tests for `drugcellfindcell.hiddenstore` module.
+"""
+
+import os
+import sys
+import unittest
+import tempfile
+import shutil
+import pickle
+
+import numpy as np
+
+from drugcellfindcell import buildinput
+from drugcellfindcell import hiddenstore
+from drugcellfindcell import inference
+from drugcellfindcell import rlipp
+from drugcellfindcell import synthdata
+
+
+class TestHiddenStore(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_write_and_read(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            hidden = {'GO:1': np.arange(12, dtype=np.float32).reshape(4, 3),
+                      'GO:2': np.ones((4, 3), dtype=np.float32)}
+            gene_out = {'GO:1': np.full((4, 2), 0.5, dtype=np.float32)}
+            for compress in [False, True]:
+                storefile = os.path.join(temp_dir, 'h' + str(compress))
+                hiddenstore.write_states(storefile, hidden, gene_out,
+                                         compress=compress,
+                                         metadata={'root': 'GO:2'})
+                store = hiddenstore.HiddenStore(storefile)
+                self.assertEqual({'root': 'GO:2'}, store.metadata)
+                self.assertEqual(['GO:1', 'GO:2', 'GO:1:genes'],
+                                 store.names())
+                self.assertEqual((4, 3), store.shape('GO:1'))
+                self.assertTrue(np.array_equal(hidden['GO:1'],
+                                               store.read('GO:1')))
+                self.assertEqual([[9, 10, 11], [0, 1, 2]],
+                                 store.read('GO:1', rows=[3, 0]).tolist())
+                mapping = store.hidden(rows=[1])
+                self.assertEqual(['GO:1', 'GO:2'], list(mapping))
+                self.assertEqual([[3, 4, 5]], mapping['GO:1'].tolist())
+                genes = store.gene_outputs()
+                self.assertEqual(['GO:1'], list(genes))
+                self.assertTrue(np.array_equal(gene_out['GO:1'],
+                                               genes['GO:1']))
+                self.assertFalse('GO:2' in genes)
+                self.assertEqual(2, genes.width('GO:1'))
+
+                # pickles as the store path and the rows to get
+                copied = pickle.loads(pickle.dumps(mapping))
+                self.assertEqual(list(mapping), list(copied))
+                self.assertEqual([[3, 4, 5]], copied['GO:1'].tolist())
+                copied = pickle.loads(pickle.dumps(genes))
+                self.assertTrue(np.array_equal(gene_out['GO:1'],
+                                               copied['GO:1']))
+
+            with hiddenstore.HiddenStoreWriter(
+                    os.path.join(temp_dir, 'dup')) as writer:
+                writer.add('a', np.zeros(3))
+                try:
+                    writer.add('a', np.zeros(3))
+                    self.fail('Expected ValueError')
+                except ValueError:
+                    pass
+            self.assertEqual((3, 1), hiddenstore.HiddenStore(
+                os.path.join(temp_dir, 'dup')).shape('a'))
+
+            notstore = os.path.join(temp_dir, 'rlipp.txt')
+            with open(notstore, 'w') as f:
+                f.write('GO:1\t0.5\n' * 10)
+            try:
+                hiddenstore.HiddenStore(notstore)
+                self.fail('Expected ValueError')
+            except ValueError:
+                pass
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_engine_writes_store(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            config = synthdata.generate_reference_data(
+                os.path.join(temp_dir, 'data'), cells=8, terms=4, genes=10,
+                mutations=3)
+            synthdata.generate_model(config, num_hiddens_drug=(4, 3))
+            outdir = os.path.join(temp_dir, 'out')
+            os.makedirs(outdir)
+            inputfiles = buildinput.build_input(
+                synthdata.synthetic_smiles(2),
+                [synthdata.cell_name(c) for c in range(8)], outdir)
+            engine = inference.InferenceEngine(config, write_hidden=True,
+                                               compress_hidden=True)
+            predictfile, rlippfile = engine.predict(inputfiles, outdir)
+            storefile = os.path.join(outdir, hiddenstore.HIDDEN_STORE_FILE)
+            store = hiddenstore.HiddenStore(storefile)
+            self.assertEqual(hiddenstore.ZLIB_CODEC, store.codec)
+            self.assertEqual(4, len(store.hidden()))
+            self.assertEqual(16, store.shape(synthdata.term_id(0))[0])
+
+            # RLIPP from the store matches the engine's
+            outfile = os.path.join(temp_dir, 'rlipp.txt')
+            self.assertEqual(0, rlipp.main(['rlipp.py', storefile,
+                                            inputfiles['columns'],
+                                            outfile]))
+            with open(rlippfile, 'r') as f:
+                expected = dict(line.split('\t') for line in f)
+            with open(outfile, 'r') as f:
+                res = dict(line.split('\t') for line in f)
+            self.assertEqual(sorted(expected), sorted(res))
+            for term in expected:
+                self.assertAlmostEqual(float(expected[term]),
+                                       float(res[term]), places=3)
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_inference
+----------------------------------
+
+Tests for `drugcellfindcell.inference` module.
+"""
+
+import os
+import sys
+import unittest
+import tempfile
+import shutil
+
+import numpy as np
+
+from drugcellfindcell import buildinput
+from drugcellfindcell import columnar
+from drugcellfindcell import inference
+from drugcellfindcell import pipeline
+from drugcellfindcell import synthdata
+
+
+class TestInference(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_predict(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            config = synthdata.generate_reference_data(
+                os.path.join(temp_dir, 'data'), cells=7, terms=5, genes=12,
+                mutations=3)
+            synthdata.generate_model(config, num_hiddens_drug=(4, 3))
+            config.engine = pipeline.NATIVE_ENGINE
+            config.batchsize = 3
+            engine = pipeline.create_predictor(config)
+            self.assertIsInstance(engine, inference.InferenceEngine)
+
+            cells = [synthdata.cell_name(c) for c in range(7)]
+            drugs = synthdata.synthetic_smiles(2)
+            outdir = os.path.join(temp_dir, 'out')
+            os.makedirs(outdir)
+            inputfiles = buildinput.build_input(drugs, cells, outdir,
+                                                text_input=False)
+            self.assertFalse(os.path.isfile(os.path.join(
+                outdir, buildinput.INPUT_FILE)))
+            predictfile, rlippfile = engine.predict(inputfiles, outdir)
+            self.assertIsNone(predictfile)
+            predictedfile = os.path.join(inputfiles['columns'],
+                                         columnar.PREDICTED_FILE)
+            predicted = np.load(predictedfile)
+            self.assertEqual(14, len(predicted))
+            self.assertEqual(14, engine.stats['cells'])
+            self.assertTrue(engine.stats['cells_per_second'] > 0)
+
+            # same result scored in one batch
+            whole = inference.InferenceEngine(config, batch_size=100)
+            whole.predict(inputfiles, outdir)
+            self.assertTrue(np.allclose(predicted, np.load(predictedfile),
+                                        atol=1e-3))
+
+            with open(rlippfile, 'r') as f:
+                rows = [line.rstrip('\n').split('\t') for line in f]
+            self.assertEqual(sorted(synthdata.term_id(t) for t in range(5)),
+                             sorted(r[0] for r in rows))
+            for r in rows:
+                float(r[1])
+
+            try:
+                inference.InferenceEngine(config, batch_size=0)
+                self.fail('Expected ValueError')
+            except ValueError:
+                pass
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_run_pipeline(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            config = synthdata.generate_reference_data(
+                os.path.join(temp_dir, 'data'), cells=4, terms=3, genes=6,
+                mutations=2)
+            synthdata.generate_model(config, num_hiddens_drug=(4, 3))
+            config.engine = pipeline.NATIVE_ENGINE
+            outdir = os.path.join(temp_dir, 'out')
+            os.makedirs(outdir)
+            res = pipeline.run_pipeline('CCO', config=config,
+                                        outputdir=outdir)
+            self.assertEqual(4, len(res['predictions']))
+            self.assertEqual(3, len(res['top_pathways']))
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_pipeline
+----------------------------------
+
+Tests for `drugcellfindcell.pipeline` module.
+"""
+
+import os
+import sys
+import json
+import unittest
+import tempfile
+import shutil
+
+from drugcellfindcell import pipeline
+
+
+def _write_reference_data(datadir, cells=('cellA', 'cellB', 'cellC'),
+                          terms=12):
+    """
+    Writes a tiny set of DrugCell reference files
+    """
+    with open(os.path.join(datadir, 'cell2ind.txt'), 'w') as f:
+        for i, c in enumerate(cells):
+            f.write('%d\t%s\n' % (i, c))
+    with open(os.path.join(datadir, 'cell2mutation_list.txt'), 'w') as f:
+        for c in cells:
+            f.write('%s\tTP53,%s_gene\n' % (c, c))
+    with open(os.path.join(datadir, 'goterm2name.txt'), 'w') as f:
+        for t in range(terms):
+            f.write('GO:%07d\tterm %d\n' % (t, t))
+    with open(os.path.join(datadir, 'goterm2genes.txt'), 'w') as f:
+        for t in range(terms):
+            f.write('GO:%07d\tG%d,G%d\n' % (t, t, t + 1))
+
+
+class FakePredictor(object):
+    """
+    Predictor that writes fixed predictions and RLIPP scores
+    """
+    def __init__(self, terms=12):
+        self.calls = 0
+        self._terms = terms
+
+    def predict(self, inputfiles, outputdir):
+        self.calls += 1
+        predictfile = os.path.join(outputdir, pipeline.PREDICT_FILE)
+        with open(inputfiles['input'], 'r') as fi:
+            rows = len(fi.readlines())
+        with open(predictfile, 'w') as f:
+            for i in range(rows):
+                f.write('%.4f\n' % (0.1 * (i + 1)))
+        rlippfile = os.path.join(outputdir, pipeline.RLIPP_FILE)
+        with open(rlippfile, 'w') as f:
+            for t in range(self._terms):
+                f.write('GO:%07d\t%f\n' % (t, t / 10.0))
+        return predictfile, rlippfile
+
+
+class TestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_pipeline_config(self):
+        config = pipeline.PipelineConfig(datadir='/foo')
+        self.assertEqual('/foo/cell2ind.txt', config.cell2idfile)
+        self.assertEqual('/foo/pretrained_model/drugcell_v1.pt',
+                         config.modelfile)
+        config = pipeline.PipelineConfig(datadir='/foo', modelfile='/m.pt')
+        self.assertEqual('/m.pt', config.modelfile)
+
+    def test_run_pipeline(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            datadir = os.path.join(temp_dir, 'data')
+            outdir = os.path.join(temp_dir, 'out')
+            os.makedirs(datadir)
+            os.makedirs(outdir)
+            _write_reference_data(datadir)
+            config = pipeline.PipelineConfig(datadir=datadir)
+            predictor = FakePredictor()
+            res = pipeline.run_pipeline('CCO', config=config,
+                                        outputdir=outdir,
+                                        predictor=predictor)
+            self.assertEqual(1, predictor.calls)
+            self.assertEqual(3, len(res['predictions']))
+            self.assertEqual(10, len(res['top_pathways']))
+            self.assertEqual('GO:0000011', res['top_pathways'][0]['GO_id'])
+            cells = sorted([p['cell'] for p in res['predictions']])
+            self.assertEqual(['cellA', 'cellB', 'cellC'], cells)
+            self.assertFalse(os.path.isfile(os.path.join(
+                outdir, pipeline.PREDICT_FILE)))
+            with open(os.path.join(outdir, 'output.json'), 'r') as f:
+                self.assertEqual(res, json.load(f))
+            with open(os.path.join(outdir, 'trace.json'), 'r') as f:
+                spans = json.load(f)['spans']
+            self.assertEqual(['reference_data_load', 'smiles_parse',
+                              'fingerprint', 'inference', 'output_assembly',
+                              'rlipp', 'output_assembly', 'json_write'],
+                             [s['name'] for s in spans])
+            for s in spans:
+                self.assertTrue(s['seconds'] >= 0)
+                self.assertTrue(s['peak_rss_bytes'] > 0)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_run_pipeline_cell_subset(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            datadir = os.path.join(temp_dir, 'data')
+            outdir = os.path.join(temp_dir, 'out')
+            os.makedirs(datadir)
+            os.makedirs(outdir)
+            _write_reference_data(datadir)
+            config = pipeline.PipelineConfig(datadir=datadir,
+                                             cells=['cellC', 'cellA'],
+                                             topk=1)
+            res = pipeline.run_pipeline('CCO', config=config,
+                                        outputdir=outdir,
+                                        predictor=FakePredictor())
+            # only the selected cells are given to the predictor
+            with open(os.path.join(outdir, 'input.txt'), 'r') as f:
+                self.assertEqual(['cellA', 'cellC'],
+                                 [line.split('\t')[0] for line in f])
+            self.assertEqual(['cellA'],
+                             [p['cell'] for p in res['predictions']])
+
+            config = pipeline.PipelineConfig(datadir=datadir,
+                                             mutations=['cellB_gene'])
+            res = pipeline.run_pipeline('CCO', config=config,
+                                        outputdir=outdir,
+                                        predictor=FakePredictor())
+            self.assertEqual(['cellB'],
+                             [p['cell'] for p in res['predictions']])
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_run_pipeline_multiple_drugs(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            datadir = os.path.join(temp_dir, 'data')
+            outdir = os.path.join(temp_dir, 'out')
+            os.makedirs(datadir)
+            os.makedirs(outdir)
+            _write_reference_data(datadir)
+            config = pipeline.PipelineConfig(datadir=datadir)
+            predictor = FakePredictor()
+            drugs = ['CCO', 'c1ccccc1', 'CC(=O)O', 'CCO']
+            res = pipeline.run_pipeline(drugs, config=config,
+                                        outputdir=outdir,
+                                        predictor=predictor)
+            self.assertEqual(1, predictor.calls)
+            self.assertFalse('predictions' in res)
+            self.assertEqual(['CCO', 'c1ccccc1', 'CC(=O)O'],
+                             [d['smiles'] for d in res['drugs']])
+            for d in res['drugs']:
+                self.assertEqual(['cellA', 'cellB', 'cellC'],
+                                 [p['cell'] for p in d['predictions']])
+            with open(os.path.join(outdir, 'input_drug2id.txt'), 'r') as f:
+                self.assertEqual('0\tCCO\n1\tc1ccccc1\n2\tCC(=O)O\n',
+                                 f.read())
+            with open(os.path.join(outdir,
+                                   'input_drug_fingerprint.txt'), 'r') as f:
+                rows = f.readlines()
+            self.assertEqual(3, len(rows))
+            self.assertEqual(2048, len(rows[0].split(',')))
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
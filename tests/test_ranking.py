@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_ranking
+----------------------------------
+
+Tests for `drugcellfindcell.ranking` module.
+"""
+
+import os
+import sys
+import unittest
+import tempfile
+import shutil
+
+from drugcellfindcell import ranking
+
+
+class TestRlippRanking(unittest.TestCase):
+
+    def setUp(self):
+        self.scores = {'GO:1': 0.5, 'GO:2': 2.0, 'GO:3': -1.0,
+                       'GO:4': 2.0, 'GO:5': 1.0}
+
+    def tearDown(self):
+        pass
+
+    def test_top(self):
+        rank = ranking.RlippRanking(self.scores)
+        self.assertEqual(5, len(rank))
+        self.assertEqual([('GO:2', 2.0), ('GO:4', 2.0), ('GO:5', 1.0)],
+                         rank.top(3))
+        self.assertEqual(5, len(rank.top(10)))
+        self.assertEqual([], ranking.RlippRanking({}).top(10))
+
+    def test_above(self):
+        rank = ranking.RlippRanking(self.scores)
+        self.assertEqual(['GO:2', 'GO:4', 'GO:5'],
+                         [r[0] for r in rank.above(1.0)])
+
+    def test_percentile(self):
+        rank = ranking.RlippRanking(self.scores)
+        self.assertEqual(-1.0, rank.percentile(0))
+        self.assertEqual(2.0, rank.percentile(100))
+        self.assertEqual(1.0, rank.percentile(50))
+        self.assertEqual(0.75, rank.percentile(37.5))
+        self.assertEqual(['GO:2', 'GO:4'],
+                         [r[0] for r in rank.above_percentile(80)])
+        try:
+            rank.percentile(101)
+            self.fail('Expected ValueError')
+        except ValueError:
+            pass
+        try:
+            ranking.RlippRanking({}).percentile(50)
+            self.fail('Expected ValueError')
+        except ValueError:
+            pass
+
+    def test_from_file_and_write_sorted(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            rlippfile = os.path.join(temp_dir, 'rlipp.txt')
+            with open(rlippfile, 'w') as f:
+                for k, v in self.scores.items():
+                    f.write('%s\t%f\n' % (k, v))
+            rank = ranking.RlippRanking.from_file(rlippfile)
+            self.assertEqual(rank.top(5),
+                             ranking.RlippRanking(self.scores).top(5))
+
+            go2name = {k: 'n' + k for k in self.scores}
+            go2gene = {k: 'g' + k for k in self.scores}
+            sortedfile = os.path.join(temp_dir, 'rlipp_sorted.txt')
+            rank.write_sorted(sortedfile, go2name, go2gene)
+            with open(sortedfile, 'r') as f:
+                lines = f.readlines()
+            self.assertEqual('GO:2\tnGO:2\t2.000000\tgGO:2\n', lines[0])
+            self.assertEqual('GO:3\tnGO:3\t-1.000000\tgGO:3\n', lines[4])
+
+            self.assertEqual([{'GO_id': 'GO:2', 'pathway_name': 'nGO:2',
+                               'RLIPP': '2.000000',
+                               'pathway_genes': 'gGO:2'}],
+                             ranking.to_pathways(rank.top(1), go2name,
+                                                 go2gene))
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_resultcache
+----------------------------------
+
+Tests for `drugcellfindcell.resultcache` module.
+"""
+
+import os
+import sys
+import time
+import unittest
+import tempfile
+import shutil
+
+from drugcellfindcell import pipeline
+from drugcellfindcell import resultcache
+
+
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def _write(self, filename, data):
+        with open(filename, 'w') as f:
+            f.write(data)
+
+    def test_make_key(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            model = os.path.join(temp_dir, 'model.pt')
+            self._write(model, 'weights')
+            cache = resultcache.ResultCache(os.path.join(temp_dir, 'c'))
+            key = cache.make_key([[0] * 8], [model])
+            self.assertEqual(key, cache.make_key([[0] * 8], [model]))
+            self.assertNotEqual(key, cache.make_key([[1] * 8], [model]))
+
+            # digest is remembered across instances
+            cache = resultcache.ResultCache(os.path.join(temp_dir, 'c'))
+            self.assertEqual(key, cache.make_key([[0] * 8], [model]))
+
+            self._write(model, 'new weights')
+            self.assertNotEqual(key, cache.make_key([[0] * 8], [model]))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_make_task_key_same_fingerprint(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            config = pipeline.PipelineConfig(datadir=temp_dir,
+                                             predictscript=os.path.join(
+                                                 temp_dir, 'predict.py'))
+            for f in resultcache.config_files(config):
+                if not os.path.isdir(os.path.dirname(f)):
+                    os.makedirs(os.path.dirname(f))
+                self._write(f, f)
+            cache = resultcache.ResultCache(os.path.join(temp_dir, 'c'))
+            self.assertEqual(cache.make_task_key('OCC', config),
+                             cache.make_task_key(['CCO'], config))
+            self.assertNotEqual(cache.make_task_key('CCO', config),
+                                cache.make_task_key('CCN', config))
+            key = cache.make_task_key('CCO', config)
+            config.topk = 5
+            self.assertNotEqual(key, cache.make_task_key('CCO', config))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_make_task_key_native_engine_ignores_script(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            config = pipeline.PipelineConfig(datadir=temp_dir,
+                                             engine=pipeline.NATIVE_ENGINE,
+                                             predictscript=os.path.join(
+                                                 temp_dir, 'missing.py'))
+            self.assertFalse(config.predictscript in
+                             resultcache.config_files(config))
+            for f in resultcache.config_files(config):
+                if not os.path.isdir(os.path.dirname(f)):
+                    os.makedirs(os.path.dirname(f))
+                self._write(f, f)
+            cache = resultcache.ResultCache(os.path.join(temp_dir, 'c'))
+            key = cache.make_task_key('CCO', config)
+            self.assertEqual(key, cache.make_task_key('CCO', config))
+
+            config.engine = pipeline.SCRIPT_ENGINE
+            try:
+                cache.make_task_key('CCO', config)
+                self.fail('Expected OSError')
+            except OSError:
+                pass
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_put_get(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            cache = resultcache.ResultCache(temp_dir)
+            self.assertEqual(None, cache.get('abc'))
+            res = {'predictions': [{'cell': 'a'}], 'top_pathways': []}
+            cache.put('abc', res)
+            try:
+                cache.put('def', {'top_pathways': [], 'rows': 1})
+                self.fail('Expected ValueError')
+            except ValueError:
+                pass
+            self.assertEqual(None, cache.get('def'))
+            self.assertEqual(res, cache.get('abc'))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_evict_by_age(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            cache = resultcache.ResultCache(temp_dir, max_age=60)
+            cache.put('old', {'x': 1})
+            cache.put('new', {'x': 2})
+            past = time.time() - 120
+            os.utime(os.path.join(temp_dir, 'old.json'), (past, past))
+            self.assertEqual(None, cache.get('old'))
+            self.assertFalse(os.path.isfile(os.path.join(temp_dir,
+                                                         'old.json')))
+            self.assertEqual({'x': 2}, cache.get('new'))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_evict_by_size(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            cache = resultcache.ResultCache(temp_dir, max_bytes=50)
+            cache.put('a', {'x': 'a' * 20})
+            past = time.time() - 100
+            os.utime(os.path.join(temp_dir, 'a.json'), (past, past))
+            cache.put('b', {'x': 'b' * 20})
+            self.assertEqual(None, cache.get('a'))
+            self.assertEqual({'x': 'b' * 20}, cache.get('b'))
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_rlipp
+----------------------------------
+
+Tests for `drugcellfindcell.rlipp` module.
+"""
+
+import os
+import sys
+import unittest
+import tempfile
+import shutil
+
+import numpy as np
+
+from drugcellfindcell import hiddenstore
+from drugcellfindcell import rlipp
+
+
+def _reference_score(predicted, parent, child):
+    """
+    RLIPP of one term computed on its own
+    """
+    parent_corr = rlipp.spearman(rlipp.ridge_fit_predict(parent, predicted),
+                                 predicted)
+    child_corr = rlipp.spearman(rlipp.ridge_fit_predict(child, predicted),
+                                predicted)
+    return (parent_corr - child_corr) / child_corr
+
+
+class TestRlipp(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_rank_rows(self):
+        self.assertEqual([[1.0, 2.5, 2.5, 4.0], [4.0, 2.0, 2.0, 2.0]],
+                         rlipp.rank_rows(np.array([[1, 2, 2, 3],
+                                                   [9, 1, 1, 1]])).tolist())
+
+    def test_spearman(self):
+        self.assertAlmostEqual(1.0, rlipp.spearman([1.0, 2.0, 5.0],
+                                                   [0.1, 0.3, 0.4]))
+        self.assertAlmostEqual(-1.0, rlipp.spearman([1.0, 2.0, 5.0],
+                                                    [0.4, 0.3, 0.1]))
+        self.assertEqual(0.0, rlipp.spearman([1.0, 1.0, 1.0],
+                                             [0.4, 0.3, 0.1]))
+
+    def test_ridge_fit_predict(self):
+        features = np.arange(10, dtype=np.float64).reshape(5, 2)
+        target = features[:, 0] * 2.0 + 1.0
+        res = rlipp.ridge_fit_predict(features, target, alpha=1e-9)
+        self.assertTrue(np.allclose(target, res))
+
+        stacked = rlipp.ridge_fit_predict(np.stack([features, features]),
+                                          target, alpha=1e-9)
+        self.assertEqual((2, 5), stacked.shape)
+
+    def test_compute_rlipp(self):
+        rng = np.random.RandomState(1)
+        rows = 40
+        children = {'root': ['a', 'b'], 'a': [], 'b': ['c'], 'c': []}
+        hidden = {t: rng.normal(size=(rows, 3)) for t in
+                  ['c', 'a', 'b', 'root']}
+        gene_out = {'a': rng.normal(size=(rows, 2)),
+                    'c': rng.normal(size=(rows, 2)),
+                    'root': rng.normal(size=(rows, 1))}
+        predicted = rng.uniform(size=rows)
+
+        res = rlipp.compute_rlipp(predicted, hidden, children, gene_out)
+        self.assertEqual(['c', 'a', 'b', 'root'], list(res))
+        for t in hidden:
+            parts = [hidden[c] for c in children[t]]
+            if t in gene_out:
+                parts.append(gene_out[t])
+            self.assertAlmostEqual(
+                _reference_score(predicted, hidden[t],
+                                 np.concatenate(parts, axis=1)),
+                res[t])
+
+        pooled = rlipp.compute_rlipp(predicted, hidden, children, gene_out,
+                                     workers=2)
+        self.assertEqual(list(res), list(pooled))
+        self.assertTrue(np.allclose(list(res.values()),
+                                    list(pooled.values())))
+
+        # terms without inputs score 0
+        res = rlipp.compute_rlipp(predicted, {'x': hidden['a']}, {}, {})
+        self.assertEqual({'x': 0.0}, res)
+
+    def test_rlipp_from_store(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            rng = np.random.RandomState(3)
+            rows = 30
+            children = {'root': ['a', 'b'], 'a': [], 'b': []}
+            hidden = {t: rng.normal(size=(rows, 3)).astype(np.float32)
+                      for t in ['a', 'b', 'root']}
+            gene_out = {'a': rng.normal(size=(rows, 2)).astype(np.float32),
+                        'b': rng.normal(size=(rows, 4)).astype(np.float32)}
+            predicted = rng.uniform(size=rows)
+            storefile = os.path.join(temp_dir, 'hidden.store')
+            hiddenstore.write_states(storefile, hidden, gene_out,
+                                     metadata={'children': children})
+            expected = rlipp.compute_rlipp(predicted, hidden, children,
+                                           gene_out)
+
+            store = hiddenstore.HiddenStore(storefile)
+            res = rlipp.rlipp_from_store(store, predicted)
+            self.assertEqual(list(expected), list(res))
+            self.assertTrue(np.allclose(list(expected.values()),
+                                        list(res.values())))
+
+            # pool workers reopen the store, this process reads nothing
+            states = store.hidden()
+            outputs = store.gene_outputs()
+            pooled = rlipp.compute_rlipp(predicted, states, children,
+                                         outputs, workers=2)
+            self.assertTrue(np.allclose(list(expected.values()),
+                                        list(pooled.values())))
+            self.assertEqual({}, states._cache)
+            self.assertEqual({}, outputs._cache)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_write_rlipp(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            rlippfile = os.path.join(temp_dir, 'rlipp.txt')
+            rlipp.write_rlipp(rlippfile, {'GO:1': 0.5, 'GO:2': -1.25})
+            with open(rlippfile, 'r') as f:
+                self.assertEqual('GO:1\t0.500000\nGO:2\t-1.250000\n',
+                                 f.read())
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_scheduler
+----------------------------------
+
+Tests for `drugcellfindcell.scheduler` module.
+"""
+
+import os
+import sys
+import json
+import unittest
+import tempfile
+import shutil
+import threading
+
+from drugcellfindcell import pipeline
+from drugcellfindcell import scheduler
+from drugcellfindcell import worker
+from tests.test_pipeline import FakePredictor
+from tests.test_pipeline import _write_reference_data
+
+
+def _submit_all(func, tasks):
+    """
+    Calls `func` on each task from its own thread, returning
+    results or exceptions in task order
+    """
+    results = [None] * len(tasks)
+
+    def run(i):
+        try:
+            results[i] = func(tasks[i])
+        except Exception as e:
+            results[i] = e
+    threads = [threading.Thread(target=run, args=(i,))
+               for i in range(len(tasks))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+class TestScheduler(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_split_result(self):
+        tasks = [{'smiles': 'CCO', 'taskId': 't1'},
+                 {'smiles': ['CCN', 'CCO']},
+                 {'smiles': 'CCN', 'taskId': 't3'}]
+        self.assertEqual(['CCO', 'CCN'], scheduler.merge_tasks(tasks))
+        result = {'drugs': [{'smiles': 'CCO', 'predictions': [1]},
+                            {'smiles': 'CCN', 'predictions': [2]}],
+                  'top_pathways': []}
+        res = scheduler.split_result(result, tasks)
+        self.assertEqual({'taskId': 't1', 'predictions': [1],
+                          'top_pathways': []}, res[0])
+        self.assertEqual({'drugs': [{'smiles': 'CCN', 'predictions': [2]},
+                                    {'smiles': 'CCO', 'predictions': [1]}],
+                          'top_pathways': []}, res[1])
+        self.assertEqual([2], res[2]['predictions'])
+
+        try:
+            scheduler.split_result({'top_pathways': [], 'rows': 3},
+                                   tasks)
+            self.fail('Expected ValueError')
+        except ValueError:
+            pass
+
+        # pathways of the batch are not those of any one task
+        try:
+            scheduler.split_result(dict(result, top_pathways=['p']),
+                                   tasks)
+            self.fail('Expected ValueError')
+        except ValueError:
+            pass
+
+        # batch of one drug
+        res = scheduler.split_result({'predictions': [5],
+                                      'top_pathways': []},
+                                     [{'smiles': 'C'}, {'smiles': ['C']}])
+        self.assertEqual([[5], [5]], [r['predictions'] for r in res])
+
+    def test_coalescer(self):
+        batches = []
+
+        def run_batch(tasks):
+            batches.append(len(tasks))
+            return [ValueError('bad') if t == 'bad' else t * 2
+                    for t in tasks]
+
+        coalescer = scheduler.RequestCoalescer(run_batch, max_wait=1.0,
+                                               max_batch=3)
+        res = _submit_all(coalescer.submit, [1, 2, 'bad'])
+        self.assertEqual([3], batches)
+        self.assertEqual([2, 4], res[:2])
+        self.assertTrue(isinstance(res[2], ValueError))
+
+        # max_wait closes batch before it is full
+        coalescer = scheduler.RequestCoalescer(run_batch, max_wait=0.01,
+                                               max_batch=100)
+        self.assertEqual(10, coalescer.submit(5))
+        self.assertEqual(1, batches[-1])
+
+    def test_worker_batches_tasks(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            datadir = os.path.join(temp_dir, 'data')
+            os.makedirs(datadir)
+            _write_reference_data(datadir)
+            config = pipeline.PipelineConfig(datadir=datadir, topn=0)
+            predictor = FakePredictor()
+            w = worker.DrugCellWorker(config, predictor=predictor,
+                                      max_batch=3, max_wait=5.0)
+            tasks = [{'smiles': s, 'taskId': 'task%d' % i,
+                      'outputdir': os.path.join(temp_dir, 'task%d' % i)}
+                     for i, s in enumerate(['CCO', 'CCN', 'CCO'])]
+            res = _submit_all(w.run_task, tasks)
+            self.assertEqual(1, predictor.calls)
+            for task, r in zip(tasks, res):
+                self.assertEqual(task['taskId'], r['taskId'])
+                self.assertEqual(3, len(r['predictions']))
+                self.assertEqual([], r['top_pathways'])
+                with open(os.path.join(task['outputdir'],
+                                       'output.json'), 'r') as f:
+                    self.assertEqual(r, json.load(f))
+                # trace of the batch is not that of the task
+                self.assertFalse(os.path.isfile(os.path.join(
+                    task['outputdir'], 'trace.json')))
+            # CCN was second drug in batch so got rows 4 to 6
+            self.assertEqual(0.4, res[1]['predictions'][0]['predicted_AUC'])
+            self.assertEqual(res[0], dict(res[2], taskId='task0'))
+
+            # a bad SMILES only fails its own task
+            tasks[1]['smiles'] = 'not a smiles'
+            res = _submit_all(w.run_task, tasks)
+            self.assertTrue(isinstance(res[1], ValueError))
+            self.assertEqual(3, len(res[0]['predictions']))
+            self.assertEqual(3, len(res[2]['predictions']))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_worker_does_not_batch_pathways(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            datadir = os.path.join(temp_dir, 'data')
+            os.makedirs(datadir)
+            _write_reference_data(datadir)
+            config = pipeline.PipelineConfig(datadir=datadir)
+            predictor = FakePredictor()
+            w = worker.DrugCellWorker(config, predictor=predictor,
+                                      max_batch=3, max_wait=5.0)
+            tasks = [{'smiles': s,
+                      'outputdir': os.path.join(temp_dir, 'task%d' % i)}
+                     for i, s in enumerate(['CCO', 'CCN'])]
+            res = _submit_all(w.run_task, tasks)
+            self.assertEqual(2, predictor.calls)
+            for r in res:
+                self.assertEqual(10, len(r['top_pathways']))
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_sharedmem
+----------------------------------
+
+Tests for `drugcellfindcell.sharedmem` module.
+"""
+
+import sys
+import unittest
+
+import numpy as np
+
+from drugcellfindcell import sharedmem
+
+
+class TestSharedMem(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_share_array(self):
+        data = np.arange(12, dtype=np.int32).reshape(3, 4)
+        block, spec = sharedmem.share_array(data)
+        try:
+            other, view = sharedmem.attach_array(spec)
+            self.assertTrue(np.array_equal(data, view))
+            view[0, 0] = 42
+            view = None
+            sharedmem.release([other])
+            other, view = sharedmem.attach_array(spec)
+            self.assertEqual(42, view[0, 0])
+            view = None
+            sharedmem.release([other])
+        finally:
+            sharedmem.release([block], unlink=True)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_simindex
+----------------------------------
+
+Tests for `drugcellfindcell.simindex` module.
+"""
+
+import os
+import unittest
+import tempfile
+import shutil
+from unittest.mock import patch
+
+import numpy as np
+
+from drugcellfindcell import buildinput
+from drugcellfindcell import fpcache
+from drugcellfindcell import simindex
+
+
+def _tanimoto(a, b):
+    a = np.asarray(a, dtype=bool)
+    b = np.asarray(b, dtype=bool)
+    union = np.logical_or(a, b).sum()
+    if union == 0:
+        return 0.0
+    return np.logical_and(a, b).sum() / union
+
+
+class TestSimIndex(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_popcount(self):
+        rng = np.random.RandomState(1)
+        bits = rng.randint(0, 2, size=(5, 128))
+        words = simindex.pack_words(bits)
+        self.assertEqual((5, 2), words.shape)
+        self.assertEqual(bits.sum(axis=1).tolist(),
+                         simindex.popcount(words).tolist())
+
+    def test_pack_words_bad_width(self):
+        try:
+            simindex.pack_words([[1] * 8])
+            self.fail('Expected ValueError')
+        except ValueError:
+            pass
+
+    def test_query_matches_brute_force(self):
+        rng = np.random.RandomState(0)
+        bits = (rng.rand(50, 256) < 0.2).astype(np.uint8)
+        keys = ['d' + str(i) for i in range(50)]
+        index = simindex.TanimotoIndex()
+        index.add(keys, bits)
+        self.assertEqual(50, len(index))
+        query = bits[7]
+        expected = sorted(((-_tanimoto(query, b), i)
+                           for i, b in enumerate(bits)))[:4]
+        res = index.query(query, k=4)
+        self.assertEqual(['d' + str(i) for s, i in expected],
+                         [k for k, s in res])
+        self.assertEqual(('d7', 1.0), res[0])
+        for (s, i), (k, sim) in zip(expected, res):
+            self.assertAlmostEqual(-s, sim)
+
+        # more neighbours than drugs
+        self.assertEqual(50, len(index.query(query, k=100)))
+        self.assertEqual([], simindex.TanimotoIndex().query(query, k=3))
+
+    def test_sharded_query_same_as_serial(self):
+        rng = np.random.RandomState(2)
+        bits = (rng.rand(300, 128) < 0.3).astype(np.uint8)
+        index = simindex.TanimotoIndex()
+        index.add([str(i) for i in range(300)], bits)
+        query = (rng.rand(128) < 0.3).astype(np.uint8)
+        serial = index.query(query, k=10)
+        with patch.object(simindex, 'MIN_SHARD_ROWS', 10):
+            with index:
+                self.assertEqual(serial, index.query(query, k=10, workers=3))
+                pool = index._pool
+                # the pool is reused across queries
+                self.assertEqual(serial, index.query(query, k=10, workers=2))
+                self.assertTrue(pool is index._pool)
+            self.assertEqual(None, index._pool)
+
+    def test_query_exclude(self):
+        index = simindex.TanimotoIndex.from_smiles(['CCO', 'CCCO', 'CCCCO'])
+        fp = buildinput.morgan_fingerprint('CCO')
+        self.assertEqual('CCO', index.query(fp, k=2)[0][0])
+        res = index.query(fp, k=2, exclude=['CCO'])
+        self.assertEqual(['CCCO', 'CCCCO'], [k for k, s in res])
+
+    def test_similar_drugs_skips_query(self):
+        index = simindex.TanimotoIndex.from_smiles(['CCO', 'CCCO', 'CCCCO'])
+        res = simindex.similar_drugs(index, ['CCO', 'OCC'], k=1)
+        self.assertEqual([[{'smiles': 'CCCO', 'tanimoto':
+                            res[0]['neighbors'][0]['tanimoto']}]] * 2,
+                         [r['neighbors'] for r in res])
+        self.assertTrue(res[0]['neighbors'][0]['tanimoto'] < 1.0)
+
+    def test_save_load_and_fpcache(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            dbfile = os.path.join(temp_dir, 'fp.db')
+            with fpcache.FingerprintCache(dbfile) as cache:
+                for s in ['CCO', 'CCCO', 'c1ccccc1O']:
+                    cache.get(s)
+                index = simindex.TanimotoIndex.from_fpcache(cache)
+                self.assertEqual(['CCCO', 'CCO', 'Oc1ccccc1'], index.keys)
+                res = simindex.similar_drugs(index, ['OCC', 'OCC'], k=2,
+                                             fpcache=cache)
+            self.assertEqual(1, len(res))
+            self.assertEqual('OCC', res[0]['smiles'])
+            self.assertEqual(['CCCO', 'Oc1ccccc1'],
+                             [n['smiles'] for n in res[0]['neighbors']])
+
+            direct = simindex.TanimotoIndex.from_smiles(
+                ['CCCO', 'CCO', 'Oc1ccccc1', 'CCO'])
+            self.assertTrue(np.array_equal(index.words, direct.words))
+
+            indexfile = os.path.join(temp_dir, 'index.npz')
+            index.save(indexfile)
+            loaded = simindex.TanimotoIndex.load(indexfile)
+            self.assertEqual(index.keys, loaded.keys)
+            fp = buildinput.morgan_fingerprint('CCO')
+            self.assertEqual(index.query(fp, k=3), loaded.query(fp, k=3))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_main(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            dbfile = os.path.join(temp_dir, 'fp.db')
+            with fpcache.FingerprintCache(dbfile) as cache:
+                cache.get('CCO')
+            smilesfile = os.path.join(temp_dir, 'drugs.txt')
+            with open(smilesfile, 'w') as f:
+                f.write('CCO\nCCCO\n')
+            indexfile = os.path.join(temp_dir, 'index.npz')
+            self.assertEqual(0, simindex.main(['simindex.py', indexfile,
+                                               '--fpcache', dbfile,
+                                               '--smiles', smilesfile]))
+            index = simindex.TanimotoIndex.load(indexfile)
+            self.assertEqual(['CCO', 'CCCO'], index.keys)
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
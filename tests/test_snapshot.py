@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_snapshot
+----------------------------------
+
+Tests for `drugcellfindcell.snapshot` module.
+"""
+
+import os
+import sys
+import unittest
+import tempfile
+import shutil
+
+from drugcellfindcell import pipeline
+from drugcellfindcell import snapshot
+from tests.test_pipeline import _write_reference_data
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        _write_reference_data(self.temp_dir)
+        with open(os.path.join(self.temp_dir, 'gene2ind.txt'), 'w') as f:
+            for i, g in enumerate(['TP53', 'cellA_gene', 'KRAS',
+                                   'cellC_gene']):
+                f.write('%d\t%s\n' % (i, g))
+        self.config = pipeline.PipelineConfig(datadir=self.temp_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_build_and_load(self):
+        snapfile = self.config.snapshotfile
+        snapshot.build_snapshot(self.config, snapfile)
+        snap = snapshot.ReferenceSnapshot(snapfile)
+        try:
+            self.assertFalse(snap.is_stale())
+            self.assertEqual(['cellA', 'cellB', 'cellC'], list(snap.cells))
+            self.assertEqual('cellC', snap.cells[-1])
+            self.assertEqual('TP53,cellB_gene', snap.cell2genes['cellB'])
+            self.assertEqual('term 3', snap.go2name['GO:0000003'])
+            self.assertEqual('G3,G4', snap.go2gene['GO:0000003'])
+            self.assertTrue('GO:0000011' in snap.go2name)
+            self.assertFalse('GO:9' in snap.go2name)
+            self.assertEqual(12, len(snap.go2gene))
+            self.assertEqual(['TP53', 'cellA_gene', 'KRAS', 'cellC_gene'],
+                             list(snap.strings('genes')))
+            self.assertEqual([0, 1], snap.cell_mutations(0).tolist())
+            self.assertEqual([0], snap.cell_mutations(1).tolist())
+            self.assertEqual([0, 1, 2], snap.array('cell_ids').tolist())
+            self.assertEqual({'cellA': 0, 'cellB': 1, 'cellC': 2},
+                             snap.cell2id)
+            self.assertFalse('gene_ids' in snap)
+            try:
+                snap.cells[3]
+                self.fail('Expected IndexError')
+            except IndexError:
+                pass
+        finally:
+            snap.close()
+
+    def test_stale(self):
+        snapfile = os.path.join(self.temp_dir, 'other.snap')
+        snapshot.build_snapshot(self.config, snapfile)
+        cellfile = self.config.cell2idfile
+        st = os.stat(cellfile)
+        self.assertIsNotNone(snapshot.open_fresh(snapfile))
+        os.utime(cellfile, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        self.assertTrue(snapshot.ReferenceSnapshot(snapfile).is_stale())
+        self.assertIsNone(snapshot.open_fresh(snapfile))
+        self.assertIsNone(snapshot.open_fresh(cellfile))
+
+    def test_not_snapshot(self):
+        tfile = os.path.join(self.temp_dir, 'cell2ind.txt')
+        try:
+            snapshot.ReferenceSnapshot(tfile)
+            self.fail('Expected ValueError')
+        except ValueError:
+            pass
+
+    def test_reference_data_uses_fresh_snapshot(self):
+        refdata = pipeline.ReferenceData(self.config)
+        self.assertEqual(None, refdata.snapshot)
+        expected = (list(refdata.cells), dict(refdata.go2name),
+                    dict(refdata.go2gene), dict(refdata.cell2genes))
+
+        self.assertEqual(0, snapshot.main(['prog', '--datadir',
+                                           self.temp_dir]))
+        refdata = pipeline.ReferenceData(self.config)
+        self.assertNotEqual(None, refdata.snapshot)
+        self.assertEqual(expected, (list(refdata.cells),
+                                    dict(refdata.go2name),
+                                    dict(refdata.go2gene),
+                                    dict(refdata.cell2genes)))
+
+        with open(self.config.go2namefile, 'a') as f:
+            f.write('GO:1\tnew term\n')
+        st = os.stat(self.config.go2namefile)
+        os.utime(self.config.go2namefile,
+                 ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+        refdata = pipeline.ReferenceData(self.config)
+        self.assertEqual(None, refdata.snapshot)
+        self.assertEqual('new term', refdata.go2name['GO:1'])
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_synthdata
+----------------------------------
+
+Tests for `drugcellfindcell.synthdata` module.
+"""
+
+import os
+import sys
+import unittest
+import tempfile
+import shutil
+
+from drugcellfindcell import buildinput
+from drugcellfindcell import pipeline
+from drugcellfindcell import synthdata
+
+
+class TestSynthData(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_synthetic_smiles(self):
+        smiles = synthdata.synthetic_smiles(300)
+        self.assertEqual(300, len(set(smiles)))
+        for s in smiles[::37]:
+            buildinput.parse_smiles(s)
+
+    def test_generate_reference_data(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            config = synthdata.generate_reference_data(
+                temp_dir, cells=5, terms=7, genes=10, mutations=3)
+            refdata = pipeline.ReferenceData(config)
+            self.assertEqual(5, len(refdata.cells))
+            self.assertEqual(3, len(refdata.cell2genes['CELL0_SYNTH']
+                                    .split(',')))
+            self.assertEqual(7, len(refdata.go2name))
+
+            # root term holds every gene
+            self.assertEqual(10, len(refdata.go2gene['GO:0000000']
+                                     .split(',')))
+            with open(config.genotypefile, 'r') as f:
+                rows = [line.strip().split(',') for line in f]
+            self.assertEqual(5, len(rows))
+            self.assertEqual(3, rows[0].count('1'))
+            self.assertEqual(10, len(rows[0]))
+            with open(config.ontfile, 'r') as f:
+                kinds = [line.strip().split('\t')[2] for line in f]
+            self.assertEqual(6, kinds.count('default'))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_main(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            res = synthdata.main(['synthdata.py', temp_dir, '--cells', '4',
+                                  '--terms', '6', '--genes', '8',
+                                  '--drugs', '2'])
+            self.assertEqual(0, res)
+            with open(os.path.join(temp_dir, pipeline.OUTPUT_FILE)) as f:
+                self.assertEqual(8, len(f.readlines()))
+            with open(os.path.join(temp_dir, pipeline.RLIPP_FILE)) as f:
+                self.assertEqual(6, len(f.readlines()))
+            self.assertTrue(os.path.isfile(os.path.join(temp_dir, 'data',
+                                                        'cell2ind.txt')))
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
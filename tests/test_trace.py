@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_trace
+----------------------------------
+
+Tests for `drugcellfindcell.trace` module.
+"""
+
+import os
+import sys
+import json
+import unittest
+import tempfile
+import shutil
+
+from drugcellfindcell import trace
+
+
+class TestTrace(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_tracer(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            tracer = trace.Tracer()
+            with tracer.span('outer'):
+                with tracer.span('inner', rows=3):
+                    pass
+            try:
+                with tracer.span('failed'):
+                    raise ValueError('boom')
+            except ValueError:
+                pass
+            with trace.span(None, 'ignored'):
+                pass
+
+            self.assertEqual(['inner', 'outer', 'failed'],
+                             [s['name'] for s in tracer.spans])
+            self.assertEqual('outer', tracer.spans[0]['parent'])
+            self.assertEqual(3, tracer.spans[0]['rows'])
+            self.assertFalse('parent' in tracer.spans[1])
+
+            tracefile = os.path.join(temp_dir, trace.TRACE_FILE)
+            tracer.write(tracefile)
+            with open(tracefile, 'r') as f:
+                res = json.load(f)
+            self.assertEqual(3, len(res['spans']))
+            self.assertTrue(res['peak_rss_bytes'] > 0)
+            self.assertTrue(res['seconds'] >= res['spans'][1]['seconds'])
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+test_worker
+----------------------------------
+
+Tests for `drugcellfindcell.worker` module.
+"""
+
+import os
+import sys
+import unittest
+import tempfile
+import shutil
+import threading
+from unittest.mock import patch
+
+from drugcellfindcell import pipeline
+from drugcellfindcell import worker
+from tests.test_pipeline import FakePredictor
+from tests.test_pipeline import _write_reference_data
+
+
+class TestWorker(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_submit_task_no_worker(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            res = worker.submit_task('CCO', temp_dir,
+                                     socketpath=os.path.join(temp_dir,
+                                                             'sock'))
+            self.assertEqual(None, res)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_submit_task_to_worker(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            datadir = os.path.join(temp_dir, 'data')
+            os.makedirs(datadir)
+            _write_reference_data(datadir)
+            config = pipeline.PipelineConfig(datadir=datadir)
+            predictor = FakePredictor()
+            socketpath = os.path.join(temp_dir, 'sock')
+            server = worker.create_server(worker.DrugCellWorker(
+                config, predictor=predictor), socketpath=socketpath)
+            t = threading.Thread(target=server.serve_forever)
+            t.start()
+            try:
+                for i in range(2):
+                    outdir = os.path.join(temp_dir, 'task%d' % i)
+                    res = worker.submit_task('CCO', outdir,
+                                             socketpath=socketpath,
+                                             timeout=10)
+                    self.assertEqual(3, len(res['predictions']))
+                    self.assertTrue(os.path.isfile(os.path.join(
+                        outdir, 'output.json')))
+                self.assertEqual(2, predictor.calls)
+
+                try:
+                    worker.submit_task('not a smiles', temp_dir,
+                                       socketpath=socketpath, timeout=10)
+                    self.fail('Expected RuntimeError')
+                except RuntimeError as e:
+                    self.assertTrue('Unable to parse SMILES' in str(e))
+            finally:
+                server.shutdown()
+                server.server_close()
+                t.join()
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_submit_task_settings_mismatch(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            datadir = os.path.join(temp_dir, 'data')
+            os.makedirs(datadir)
+            _write_reference_data(datadir)
+            config = pipeline.PipelineConfig(datadir=datadir)
+            predictor = FakePredictor()
+            socketpath = os.path.join(temp_dir, 'sock')
+            server = worker.create_server(worker.DrugCellWorker(
+                config, predictor=predictor), socketpath=socketpath)
+            t = threading.Thread(target=server.serve_forever)
+            t.start()
+            try:
+                outdir = os.path.join(temp_dir, 'task')
+                same = pipeline.PipelineConfig(datadir=datadir)
+                res = worker.submit_task('CCO', outdir,
+                                         socketpath=socketpath, timeout=10,
+                                         settings=same.engine_settings())
+                self.assertEqual(3, len(res['predictions']))
+
+                native = pipeline.NATIVE_ENGINE
+                for other in [pipeline.PipelineConfig(datadir=datadir,
+                                                      engine=native),
+                              pipeline.PipelineConfig(datadir=datadir,
+                                                      engine=native,
+                                                      ensemble=['a.pt']),
+                              pipeline.PipelineConfig(datadir=datadir,
+                                                      batchsize=7)]:
+                    self.assertEqual(None, worker.submit_task(
+                        'CCO', outdir, socketpath=socketpath, timeout=10,
+                        settings=other.engine_settings()))
+                self.assertEqual(1, predictor.calls)
+            finally:
+                server.shutdown()
+                server.server_close()
+                t.join()
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_default_datadir_matches_cmd(self):
+        from drugcellfindcell import drugcellfindcellcmd
+        ours = worker._parse_arguments('desc', [])
+        cmd = drugcellfindcellcmd._parse_arguments('desc', ['drugs.txt'])
+        self.assertTrue(os.path.isabs(ours.datadir))
+        self.assertEqual(cmd.datadir, ours.datadir)
+
+    def test_no_predictor_with_executor(self):
+        config = pipeline.PipelineConfig()
+        with patch.object(pipeline, 'create_predictor',
+                          side_effect=AssertionError('predictor made')):
+            w = worker.DrugCellWorker(config, executor=object())
+            w.load()
+
+    def test_worker_does_not_stream(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            datadir = os.path.join(temp_dir, 'data')
+            os.makedirs(datadir)
+            _write_reference_data(datadir)
+            config = pipeline.PipelineConfig(datadir=datadir,
+                                             streamoutput=True)
+            w = worker.DrugCellWorker(config, predictor=FakePredictor())
+            res = w.run_task({'smiles': 'CCO',
+                              'outputdir': os.path.join(temp_dir, 'task')})
+            self.assertEqual(3, len(res['predictions']))
+            self.assertTrue(config.streamoutput)
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+if __name__ == '__main__':
+    sys.exit(unittest.main())